@@ -1,27 +1,50 @@
 import os
+import sys
 import json
+import binascii
+import time
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from fastapi import FastAPI, HTTPException, Depends, status, Body
+from fastapi import FastAPI, HTTPException, Depends, status, Body, Request, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 # Import fungsi sedia ada anda (mungkin perlu sedikit penyesuaian)
 # Anda perlu letakkan fungsi-fungsi ini dalam fail berasingan atau di sini.
 # Untuk contoh ini, saya akan letakkan versi ringkasnya di sini.
-import requests 
+import httpx
+
+# Modul dikongsi dengan aplikasi Streamlit terletak di direktori induk projek
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ollama_client # Klien async dengan kolam sambungan; URL dari OLLAMA_BASE_URL
+from request_scheduler import RequestScheduler, QueueFullError
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED, has_images
+from session_store import get_session_store, SessionStoreError
+from context_window import ContextManager
+from model_residency import ModelResidencyManager, configured_models
+from file_extraction import ExtractionJobManager, ExtractionError, UnsupportedFileTypeError, JOB_DONE
+from extraction_cache import ExtractionCache, EXTRACTION_CACHE_ENABLED
+from document_index import DocumentIndex, DocumentIndexError, RAG_ENABLED, augment_messages
+from knowledge_base import KnowledgeBase, KB_ENABLED, response_cache_options
+from image_input import ImageTooLargeError, async_supports_vision, decode_base64_image, encode_image
+from user_store import UserStore, UserExistsError
+from chat_export import EXPORT_FORMATS
+from batch_export import BatchExportManager, BatchExportError, collect_sessions, is_batch_export_admin
+import login_security # bcrypt dalam kolam thread terhad + pengehad cubaan log masuk
+from login_security import LoginRateLimiter, LoginRateLimitError
 
 # --- KONFIGURASI ---
-OLLAMA_BASE_URL = "http://localhost:11434"
 USERS_DIR = "user_data"
 USERS_FILE = os.path.join(USERS_DIR, "users.json")
 HISTORY_DIR = "chat_sessions"
+DEFAULT_OLLAMA_MODEL = os.getenv("DEFAULT_OLLAMA_MODEL", "STEMBot-4B") # Dipanaskan semasa server bermula
 
 # Konfigurasi Keselamatan untuk JWT
 SECRET_KEY = "your-super-secret-key-change-this" # TUKAR INI! Guna 'openssl rand -hex 32' untuk jana kunci
@@ -32,6 +55,27 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 os.makedirs(USERS_DIR, exist_ok=True)
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
+# Had serentak bagi setiap model dan giliran adil bagi setiap pengguna (lihat request_scheduler.py)
+scheduler = RequestScheduler()
+# Cache respons untuk soalan berulang; None jika RESPONSE_CACHE_ENABLED=0
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+# Storan sesi dikongsi dengan aplikasi Streamlit (SESSION_STORE=sqlite|jsonl|json)
+chat_session_store = get_session_store(HISTORY_DIR)
+# Had bajet token bagi sejarah yang dihantar ke Ollama; ringkasan latar belakang beratur melalui penjadual
+context_manager = ContextManager(scheduler=scheduler)
+# Model dipanaskan semasa startup dan dimuatkan semula jika dipunggah (keep_alive dalam ollama_client)
+model_residency = ModelResidencyManager(configured_models(DEFAULT_OLLAMA_MODEL), scheduler=scheduler)
+# Kolam proses untuk OCR/PDF; dikongsi kod dengan aplikasi Streamlit (lihat file_extraction.py)
+extraction_jobs = ExtractionJobManager(cache=ExtractionCache() if EXTRACTION_CACHE_ENABLED else None)
+# Indeks vektor dokumen bagi setiap pengguna/sesi (RAG); dikongsi dengan aplikasi Streamlit
+document_index = DocumentIndex() if RAG_ENABLED else None
+# Indeks bahan kursus yang dibina di luar talian (python knowledge_base.py build); dimuatkan sekali
+knowledge_base = KnowledgeBase() if KB_ENABLED else None
+# Direktori pengguna dalam memori; users.json hanya dibaca semula apabila fail berubah
+user_store = UserStore(USERS_FILE)
+# Eksport pukal banyak sesi ke ZIP dalam kolam proses; hanya untuk BATCH_EXPORT_ADMINS (lihat batch_export.py)
+batch_exports = BatchExportManager(HISTORY_DIR)
+
 # --- MODEL DATA (Pydantic) ---
 class Token(BaseModel):
     access_token: str
@@ -53,31 +97,37 @@ class ChatRequest(BaseModel):
     prompt: str
     chat_history: List[Dict[str, Any]]
     selected_model: str
+    session_id: Optional[str] = None # Jika sesi mempunyai dokumen diindeks, petikan berkaitan disertakan
+    images: Optional[List[str]] = None # Imej base64 untuk model visi (keupayaan "vision" dalam /api/show)
 
-# --- PENGURUSAN KATA LALUAN & PENGESAHAN ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
+class DocumentRequest(BaseModel):
+    job_id: str
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class BatchExportRequest(BaseModel):
+    formats: List[str] = [] # Label EXPORT_FORMATS atau sambungan (cth. "pdf", "docx")
+    usernames: List[str] = [] # Semua sesi bagi pengguna ini
+    sessions: List[Dict[str, str]] = [] # Sesi tertentu: [{"username": ..., "session_id": ...}]
+    include_user: bool = True
+    include_assistant: bool = True
+    include_thinking: bool = True
+    workbook: bool = False # Tambah satu buku kerja Excel dengan satu helaian bagi setiap sesi
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# --- PENGURUSAN KATA LALUAN & PENGESAHAN ---
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
+login_rate_limiter = LoginRateLimiter()
 
-def load_users():
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f: json.dump({}, f)
-    with open(USERS_FILE, "r") as f: return json.load(f)
+async def verify_password(plain_password, hashed_password):
+    # bcrypt dijalankan dalam kolam pekerja supaya gelung acara tidak tersekat
+    return await login_security.async_verify_password(plain_password, hashed_password)
 
-def save_users(users):
-    with open(USERS_FILE, "w") as f: json.dump(users, f, indent=2)
+async def get_password_hash(password):
+    return await login_security.async_hash_password(password)
 
-def authenticate_user(username, password):
-    users = load_users()
-    if username not in users:
+async def authenticate_user(username, password):
+    user = user_store.get_user(username)
+    if user is None:
         return False
-    user = users[username]
-    if not verify_password(password, user["password"]):
+    if not await verify_password(password, user["password"]):
         return False
     return user
 
@@ -104,52 +154,192 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    users = load_users()
-    user = users.get(username)
-    if user is None:
+    # Dari cache memori; tiada bacaan fail bagi pengguna yang dikenali
+    if not user_store.exists(username):
         raise credentials_exception
     return User(username=username)
 
 # --- FUNGSI LOGIK UTAMA (diadaptasi dari kod anda) ---
-def get_user_history_dir(username: str):
-    user_dir = os.path.join(HISTORY_DIR, username)
-    os.makedirs(user_dir, exist_ok=True)
-    return user_dir
-
 def load_all_session_ids_for_user(username: str):
-    user_history_dir = get_user_history_dir(username)
-    # ... (logik sort_key anda di sini) ...
     try:
-        files = [f.replace(".json", "") for f in os.listdir(user_history_dir) if f.endswith(".json")]
-        return sorted(files, reverse=True) # Versi ringkas
-    except:
+        return chat_session_store.list_sessions(username)
+    except SessionStoreError:
         return []
 
-def load_chat_session_for_user(username: str, session_id: str):
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
-    try:
-        with open(filepath, "r") as f: return json.load(f)
-    except FileNotFoundError:
-        return []
+def load_chat_session_for_user(username: str, session_id: str, tail: Optional[int] = None):
+    # tail: hanya N mesej terakhir (storan JSONL membacanya dari hujung fail)
+    return chat_session_store.load_session(username, session_id, tail=tail)
 
 def save_chat_session_for_user(username: str, session_id: str, history: List[Dict]):
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
-    with open(filepath, "w") as f: json.dump(history, f, indent=2)
-
-def query_ollama(prompt: str, chat_history: List[Dict], selected_model: str):
-    # Ini adalah versi ringkas dari query_ollama_non_stream anda
-    messages_for_api = chat_history + [{"role": "user", "content": prompt}]
-    try:
-        payload = {'model': selected_model, 'messages': messages_for_api, 'stream': False}
-        response = requests.post(f'{OLLAMA_BASE_URL}/api/chat', json=payload, timeout=600)
-        response.raise_for_status()
-        data = response.json()
-        return data.get('message', {})
-    except requests.exceptions.RequestException as e:
+    chat_session_store.save_session(username, session_id, history)
+
+def require_batch_export_admin(current_user: User = Depends(get_current_user)):
+    if not is_batch_export_admin(current_user.username):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Batch export is restricted to administrators")
+    return current_user
+
+def resolve_export_formats(formats: List[str]):
+    labels = []
+    for requested in formats:
+        label = next((label for label, (extension, _, _) in EXPORT_FORMATS.items() if requested in (label, extension)), None)
+        if label is None:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown export format '{requested}'")
+        labels.append(label)
+    return labels
+
+def session_has_documents(username: str, session_id: Optional[str]):
+    return document_index is not None and bool(session_id) and document_index.has_documents(username, session_id)
+
+async def retrieve_document_context(username: str, session_id: Optional[str], prompt: str):
+    # Petikan dokumen sesi dan bahan kursus yang berkaitan; [] jika tiada atau carian gagal
+    retrieved = []
+    try:
+        if session_has_documents(username, session_id):
+            retrieved = await document_index.async_search(username, session_id, prompt)
+        if knowledge_base is not None:
+            retrieved += await knowledge_base.async_search(prompt)
+    except (httpx.HTTPError, DocumentIndexError):
+        pass
+    return retrieved
+
+async def prepare_images(images: Optional[List[str]], selected_model: str):
+    # Imej disahkan, dikecilkan dan dikod semula sebagai JPEG sebelum dihantar ke Ollama
+    if not images:
+        return []
+    if not await async_supports_vision(selected_model):
+        raise HTTPException(status_code=422, detail=f"Model '{selected_model}' does not accept images")
+    try:
+        return [await run_in_threadpool(encode_image, decode_base64_image(image)) for image in images]
+    except ImageTooLargeError:
+        raise HTTPException(status_code=400, detail="Image too large")
+    except (binascii.Error, ValueError, OSError):
+        raise HTTPException(status_code=422, detail="Invalid image data")
+
+def user_message(prompt: str, images: Optional[List[str]] = None):
+    message = {"role": "user", "content": prompt}
+    if images:
+        message["images"] = images
+    return message
+
+async def query_ollama(prompt: str, chat_history: List[Dict], selected_model: str, retrieved: Optional[List[Dict]] = None, images: Optional[List[str]] = None):
+    # Versi tanpa strim bagi query_ollama dalam aplikasi Streamlit
+    # Async supaya permintaan lain tidak tersekat semasa Ollama menjana jawapan
+    messages_for_api = augment_messages(chat_history + [user_message(prompt, images)], retrieved)
+    context = context_manager.build(messages_for_api, selected_model, images=await async_supports_vision(selected_model))
+    try:
+        data = await ollama_client.async_chat(context.messages, selected_model)
+        message = data.get('message', {})
+        if message:
+            message["context"] = context.as_dict()
+            if retrieved:
+                message["documents"] = [{"document": r["document"], "chunk": r["chunk"], "score": r["score"]} for r in retrieved]
+        return message
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Ollama service unavailable: {e}")
 
+def queue_full_exception(e: QueueFullError):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={"message": "Model queue is full, please retry later", "queue_depth": e.queue_depth, "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_ollama_events(prompt: str, chat_history: List[Dict], selected_model: str, username: str, http_request: Request, session_id: Optional[str] = None, images: Optional[List[str]] = None):
+    # Relay chunk Ollama sebagai Server-Sent Events: 'queued' jika perlu menunggu giliran,
+    # 'token' untuk setiap delta, 'done' dengan masa, 'error' jika gagal
+    lookup_start = time.time()
+    messages_for_api = chat_history + [user_message(prompt, images)]
+    question_embedding = None
+    # Jawapan bagi sesi yang mempunyai dokumen atau imej bergantung padanya; cache dikongsi tidak digunakan
+    retrieved = await retrieve_document_context(username, session_id, prompt)
+    use_cache = response_cache is not None and not session_has_documents(username, session_id) and not has_images(messages_for_api)
+    cache_options = response_cache_options(knowledge_base) # Generasi bahan kursus yang disertakan dalam prompt
+    if use_cache:
+        cached_reply, question_embedding = await response_cache.async_lookup(selected_model, messages_for_api, cache_options)
+        if cached_reply is not None:
+            yield format_sse("token", {"content": cached_reply.get("content", ""), "thinking": cached_reply.get("thinking_process", "")})
+            yield format_sse("done", dict(cached_reply, role="assistant", time_taken=time.time() - lookup_start))
+            return
+    try:
+        ticket, waiter = scheduler.async_enqueue(selected_model, username)
+    except QueueFullError as e:
+        yield format_sse("error", {"detail": str(e), "queue_depth": e.queue_depth, "retry_after": e.retry_after})
+        return
+    try:
+        if waiter is not None:
+            yield format_sse("queued", {
+                "queue_position": ticket.queue_position,
+                "estimated_wait": round(scheduler.estimated_wait(selected_model, ticket.queue_position), 1),
+            })
+            await scheduler.wait_for_slot(waiter)
+    except BaseException:
+        scheduler.abandon(waiter)
+        raise
+    try:
+        context = context_manager.build(augment_messages(messages_for_api, retrieved), selected_model, images=await async_supports_vision(selected_model))
+        async for event in relay_ollama_stream(messages_for_api, selected_model, http_request, ticket.as_dict(), question_embedding, context, use_cache, retrieved, cache_options):
+            yield event
+    finally:
+        scheduler.release(ticket)
+
+async def relay_ollama_stream(messages_for_api: List[Dict], selected_model: str, http_request: Request, queue_info: Dict[str, Any], question_embedding=None, context=None, use_cache=True, retrieved=None, cache_options=None):
+    # messages_for_api ialah sejarah penuh (kunci cache); context.messages ialah yang dihantar ke Ollama
+    splitter = ollama_client.ThinkTagSplitter()
+    start_time = time.time()
+    first_token_time = None
+    chunk_count = 0
+    final_chunk = {}
+    sent_thinking = sent_answer = 0
+    request_messages = context.messages if context is not None else messages_for_api
+    ollama_stream = ollama_client.async_stream_chat(request_messages, selected_model)
+    try:
+        async for chunk in ollama_stream:
+            if await http_request.is_disconnected():
+                # Menutup strim menutup sambungan ke Ollama, lalu Ollama membatalkan penjanaan
+                return
+            if splitter.feed_chunk(chunk):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                chunk_count += 1
+                thinking_delta = "".join(splitter.thinking_parts[sent_thinking:])
+                answer_delta = "".join(splitter.answer_parts[sent_answer:])
+                sent_thinking, sent_answer = len(splitter.thinking_parts), len(splitter.answer_parts)
+                if thinking_delta or answer_delta:
+                    yield format_sse("token", {"content": answer_delta, "thinking": thinking_delta})
+            if chunk.get("done"):
+                final_chunk = chunk
+        splitter.finish()
+        end_time = time.time()
+        stats = ollama_client.compute_stream_stats(start_time, first_token_time, end_time, chunk_count, final_chunk)
+        # Strim yang terputus sebelum chunk 'done' tidak dicache (ralat Ollama dibangkitkan sebagai OllamaStreamError)
+        if use_cache and response_cache is not None and splitter.answer and final_chunk.get("done"):
+            response_cache.put(
+                selected_model, messages_for_api,
+                {"content": splitter.answer, "thinking_process": splitter.thinking},
+                options=cache_options,
+                embedding=question_embedding,
+            )
+        yield format_sse("done", {
+            "role": "assistant",
+            "content": splitter.answer,
+            "thinking_process": splitter.thinking,
+            "time_taken": end_time - start_time,
+            "timestamp": datetime.now().isoformat(timespec="seconds"), # Lajur Timestamp dalam eksport Excel
+            **stats,
+            **queue_info,
+            "context": context.as_dict() if context is not None else None,
+            "documents": [{"document": r["document"], "chunk": r["chunk"], "score": r["score"]} for r in retrieved or []],
+        })
+    except httpx.HTTPError as e:
+        yield format_sse("error", {"detail": f"Ollama service unavailable: {e}", "time_taken": time.time() - start_time})
+    except ollama_client.OllamaStreamError as e:
+        yield format_sse("error", {"detail": f"Ollama error: {e}", "time_taken": time.time() - start_time})
+    finally:
+        await ollama_stream.aclose()
+
 
 # --- INISIALISASI APLIKASI FastAPI ---
 app = FastAPI()
@@ -163,17 +353,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_model_residency():
+    model_residency.start() # Thread latar belakang; startup tidak menunggu model dimuatkan
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    model_residency.stop()
+    extraction_jobs.shutdown()
+    batch_exports.shutdown()
+    await ollama_client.close_async_client()
+
 # === ENDPOINTS API ===
 
 @app.post("/api/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    client_host = request.client.host if request.client else None
+    limits = login_security.login_limits(form_data.username, client_host)
+    try:
+        attempt = login_rate_limiter.check(limits) # Ditempah sebagai kegagalan sehingga kata laluan disahkan
+    except LoginRateLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts. Please try again later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_rate_limiter.release(limits, attempt)
+    login_rate_limiter.reset(f"user:{form_data.username}")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": form_data.username}, expires_delta=access_token_expires
@@ -182,16 +395,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.post("/api/register")
 async def register_user(username: str = Body(...), password: str = Body(...)):
-    users = load_users()
-    if username in users:
+    if user_store.exists(username):
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(password)
-    users[username] = {
-        "password": hashed_password,
-        "created_at": datetime.now().isoformat()
-    }
-    save_users(users)
+    hashed_password = await get_password_hash(password)
+    try:
+        user_store.add_user(username, {
+            "password": hashed_password,
+            "created_at": datetime.now().isoformat()
+        })
+    except UserExistsError:
+        # Didaftarkan serentak oleh permintaan lain
+        raise HTTPException(status_code=400, detail="Username already registered")
     return {"message": "User registered successfully"}
 
 @app.get("/api/users/me", response_model=User)
@@ -199,26 +414,175 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest, current_user: User = Depends(get_current_user)):
-    response_message = query_ollama(request.prompt, request.chat_history, request.selected_model)
+async def chat_endpoint(request: ChatRequest, response: Response, current_user: User = Depends(get_current_user)):
+    images = await prepare_images(request.images, request.selected_model)
+    messages_for_api = request.chat_history + [user_message(request.prompt, images)]
+    question_embedding = None
+    retrieved = await retrieve_document_context(current_user.username, request.session_id, request.prompt)
+    use_cache = response_cache is not None and not session_has_documents(current_user.username, request.session_id) and not has_images(messages_for_api)
+    cache_options = response_cache_options(knowledge_base) # Generasi bahan kursus yang disertakan dalam prompt
+    if use_cache:
+        cached_reply, question_embedding = await response_cache.async_lookup(request.selected_model, messages_for_api, cache_options)
+        if cached_reply is not None:
+            return dict(cached_reply, role="assistant")
+    try:
+        async with scheduler.async_slot(request.selected_model, current_user.username) as ticket:
+            response_message = await query_ollama(request.prompt, request.chat_history, request.selected_model, retrieved, images)
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    response.headers["X-Queue-Position"] = str(ticket.queue_position)
+    response.headers["X-Queue-Wait"] = f"{ticket.wait_time:.3f}"
     if not response_message:
         raise HTTPException(status_code=500, detail="Failed to get response from Ollama model")
+    if use_cache and response_message.get("content"):
+        response_cache.put(
+            request.selected_model, messages_for_api,
+            {"content": response_message["content"], "thinking_process": response_message.get("thinking", "")},
+            options=cache_options,
+            embedding=question_embedding,
+        )
     
     # Di sini anda boleh menambah logik untuk memisahkan "thinking process" jika mahu
     # Untuk kesederhanaan, kita kembalikan mesej penuh dahulu
     return response_message
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request, current_user: User = Depends(get_current_user)):
+    try:
+        scheduler.check_admission(request.selected_model)
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    images = await prepare_images(request.images, request.selected_model)
+    return StreamingResponse(
+        stream_ollama_events(request.prompt, request.chat_history, request.selected_model, current_user.username, http_request, request.session_id, images),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/queue")
+async def get_queue_status(current_user: User = Depends(get_current_user)):
+    return {"models": scheduler.stats()}
+
+@app.get("/api/models/residency")
+async def get_model_residency_status(current_user: User = Depends(get_current_user)):
+    return model_residency.status()
+
+@app.get("/api/cache")
+async def get_cache_status(current_user: User = Depends(get_current_user)):
+    return response_cache.stats() if response_cache is not None else {"enabled": False}
+
+@app.get("/api/cache/extraction")
+async def get_extraction_cache_status(current_user: User = Depends(get_current_user)):
+    return extraction_jobs.cache_stats()
+
+@app.get("/api/knowledge-base")
+async def get_knowledge_base_status(current_user: User = Depends(get_current_user)):
+    return knowledge_base.status() if knowledge_base is not None else {"enabled": False}
+
+@app.post("/api/uploads", status_code=status.HTTP_202_ACCEPTED)
+async def upload_file(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+    # Ekstraksi berjalan di latar belakang; klien meninjau GET /api/uploads/{job_id}.
+    # file.file sudah berada di cakera (SpooledTemporaryFile); ia disalin secara berblok dan
+    # dicincang dalam threadpool, jadi fail besar tidak dibaca ke memori atau menyekat gelung acara.
+    try:
+        job_id = await run_in_threadpool(extraction_jobs.submit, file.filename or "upload", file.file, current_user.username)
+    except UnsupportedFileTypeError:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported file type")
+    except ExtractionError:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+    return {"job_id": job_id}
+
+@app.get("/api/uploads/{job_id}")
+async def get_upload_status(job_id: str, current_user: User = Depends(get_current_user)):
+    job = extraction_jobs.status(job_id, owner=current_user.username, include_text=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+@app.delete("/api/uploads/{job_id}")
+async def cancel_upload(job_id: str, current_user: User = Depends(get_current_user)):
+    if not extraction_jobs.cancel(job_id, owner=current_user.username):
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return {"message": "Cancellation requested"}
+
+@app.post("/api/exports", status_code=status.HTTP_202_ACCEPTED)
+async def start_batch_export(request: BatchExportRequest, current_user: User = Depends(require_batch_export_admin)):
+    # Penjanaan berjalan di latar belakang; klien meninjau GET /api/exports/{job_id} kemudian memuat turun ZIP
+    format_labels = resolve_export_formats(request.formats)
+    sessions = await run_in_threadpool(collect_sessions, chat_session_store, request.usernames)
+    sessions += [(item.get("username", ""), item.get("session_id", "")) for item in request.sessions]
+    try:
+        job_id = batch_exports.submit(
+            sessions, format_labels, owner=current_user.username, include_user=request.include_user,
+            include_assistant=request.include_assistant, include_thinking=request.include_thinking,
+            workbook=request.workbook,
+        )
+    except BatchExportError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return {"job_id": job_id, "sessions_total": len(set(sessions))}
+
+@app.get("/api/exports/{job_id}")
+async def get_batch_export_status(job_id: str, current_user: User = Depends(require_batch_export_admin)):
+    job = batch_exports.status(job_id, owner=current_user.username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@app.get("/api/exports/{job_id}/download")
+async def download_batch_export(job_id: str, current_user: User = Depends(require_batch_export_admin)):
+    # ZIP distrim dari cakera secara berblok; tidak dibaca sepenuhnya ke memori
+    zip_path = batch_exports.zip_path(job_id, owner=current_user.username)
+    if zip_path is None:
+        job = batch_exports.status(job_id, owner=current_user.username)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Export job not found")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Export job is {job['state']}")
+    return FileResponse(zip_path, media_type="application/zip", filename=f"eksport_pukal_{job_id[:8]}.zip")
+
+@app.delete("/api/exports/{job_id}")
+async def delete_batch_export(job_id: str, current_user: User = Depends(require_batch_export_admin)):
+    # Membatalkan kerja yang sedang berjalan dan memadam fail ZIP
+    if not batch_exports.forget(job_id, owner=current_user.username):
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return {"message": "Export job removed"}
+
 @app.get("/api/sessions")
 async def get_sessions(current_user: User = Depends(get_current_user)):
     return {"sessions": load_all_session_ids_for_user(current_user.username)}
 
 @app.get("/api/sessions/{session_id}")
-async def get_session_history(session_id: str, current_user: User = Depends(get_current_user)):
-    history = load_chat_session_for_user(current_user.username, session_id)
+async def get_session_history(session_id: str, tail: Optional[int] = None, current_user: User = Depends(get_current_user)):
+    history = load_chat_session_for_user(current_user.username, session_id, tail=tail)
     if history is None:
         raise HTTPException(status_code=404, detail="Session not found")
     return {"history": history}
 
+@app.get("/api/sessions/{session_id}/documents")
+async def get_session_documents(session_id: str, current_user: User = Depends(get_current_user)):
+    if document_index is None:
+        return {"documents": []}
+    return {"documents": document_index.documents(current_user.username, session_id)}
+
+@app.post("/api/sessions/{session_id}/documents", status_code=status.HTTP_201_CREATED)
+async def add_session_document(session_id: str, request: DocumentRequest, current_user: User = Depends(get_current_user)):
+    # Mengindeks teks dari kerja ekstraksi yang telah selesai (POST /api/uploads) untuk sesi ini
+    if document_index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Document index is disabled")
+    job = extraction_jobs.status(request.job_id, owner=current_user.username, include_text=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    if job["state"] != JOB_DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload job is {job['state']}")
+    if not job["text"]:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No text extracted from file")
+    try:
+        document = await document_index.async_add_document(current_user.username, session_id, job["filename"], job["text"])
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Ollama service unavailable: {e}")
+    except DocumentIndexError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"document": document, "truncated": job["truncated"], "truncation": job["truncation"]}
+
 @app.post("/api/sessions")
 async def save_session(session_id: str = Body(...), history: List[Dict] = Body(...), current_user: User = Depends(get_current_user)):
     save_chat_session_for_user(current_user.username, session_id, history)
@@ -0,0 +1,314 @@
+"""Eksport pukal banyak sesi perbualan (cth. transkrip seluruh kelas) ke satu fail ZIP di latar belakang.
+
+BatchExportManager menerima senarai (pengguna, sesi) dan format, lalu mengembalikan ID kerja serta-merta.
+Setiap sesi dimuatkan dan dijana (chat_export.export_conversation) dalam proses pekerja, jadi penjanaan
+PDF/DOCX/XLSX berjalan serentak pada beberapa teras tanpa menyekat skrip Streamlit atau gelung acara FastAPI.
+Satu thread penyelaras menulis fail ke dalam ZIP di cakera sebaik sahaja setiap sesi siap; hanya
+beberapa sesi sahaja dalam perjalanan pada satu masa, jadi memori tidak bergantung pada saiz kelas.
+Kemajuan (sesi selesai / jumlah) boleh ditinjau dan kerja boleh dibatalkan. Secara pilihan, semua sesi juga
+ditulis ke satu buku kerja Excel (satu helaian bagi setiap sesi) yang distrim terus ke dalam ZIP.
+Digunakan oleh chatbot-newtheme.py (bahagian pentadbir) dan /api/exports dalam backend_api.py.
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from chat_export import EXPORT_FORMATS, export_conversation, filter_history, write_excel
+from session_store import HISTORY_DIR, SESSION_STORE, SessionStoreError, get_session_store
+
+# --- KONFIGURASI ---
+BATCH_EXPORT_WORKERS = int(os.getenv("BATCH_EXPORT_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+BATCH_EXPORT_MAX_SESSIONS = int(os.getenv("BATCH_EXPORT_MAX_SESSIONS", "2000")) # Had sesi bagi satu kerja
+BATCH_EXPORT_JOB_TTL = float(os.getenv("BATCH_EXPORT_JOB_TTL", "3600")) # Saat fail ZIP yang siap disimpan untuk dimuat turun
+BATCH_EXPORT_DIR = os.getenv("BATCH_EXPORT_DIR", "") # Kosong = direktori sementara sistem
+BATCH_EXPORT_ADMINS = {name.strip() for name in os.getenv("BATCH_EXPORT_ADMINS", "").split(",") if name.strip()} # Pengguna yang dibenarkan
+EXPORT_LOGO_PATH = os.getenv("logo_ikm", "logo_ikm.jpg")
+EXPORT_WATERMARK_TEXT = os.getenv("CHATBOT_WATERMARK_TEXT", "IKM Besut")
+IN_FLIGHT_PER_WORKER = 2 # Sesi yang dihantar ke kolam tetapi belum ditulis ke ZIP, bagi setiap pekerja
+COMPRESSED_EXTENSIONS = ("docx", "xlsx", "pptx", "pdf") # Sudah dimampatkan; disimpan terus (ZIP_STORED)
+ERRORS_FILENAME = "RALAT.txt"
+WORKBOOK_FILENAME = "semua_sesi.xlsx"
+
+# Keadaan kerja (sama seperti file_extraction.py)
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class BatchExportError(Exception):
+    pass
+
+
+def is_batch_export_admin(username):
+    return bool(username) and username in BATCH_EXPORT_ADMINS
+
+def collect_sessions(store, usernames):
+    """Senarai (pengguna, sesi) bagi semua sesi pengguna yang diberi, mengikut susunan pengguna."""
+    sessions = []
+    for username in usernames:
+        try:
+            sessions.extend((username, session_id) for session_id in store.list_sessions(username))
+        except SessionStoreError as e:
+            print(f"Gagal menyenaraikan sesi pengguna '{username}': {e}")
+    return sessions
+
+def _safe_name(name):
+    return re.sub(r"[^\w.-]+", "_", name or "tanpa_nama").strip("._") or "tanpa_nama"
+
+
+# --- PENJANAAN (dijalankan dalam proses pekerja) ---
+_worker_store = None
+
+def _init_worker(history_dir, store_backend):
+    global _worker_store
+    _worker_store = get_session_store(history_dir, store_backend)
+
+def _render_session(username, session_id, format_labels, options):
+    """Memuatkan satu sesi dan menjana setiap format. Mengembalikan ([(nama dalam ZIP, bait)], [ralat]).
+    Ralat ditangkap di sini supaya satu sesi rosak tidak menggagalkan keseluruhan kerja."""
+    folder = f"{_safe_name(username)}/{_safe_name(session_id)}"
+    try:
+        history = _worker_store.load_session(username, session_id)
+    except SessionStoreError as e:
+        return [], [f"{folder}: gagal memuatkan sesi: {e}"]
+    files, errors = [], []
+    for format_label in format_labels:
+        extension = EXPORT_FORMATS[format_label][0]
+        try:
+            data = export_conversation(format_label, history, **options)
+        except Exception as e: # Pengeksport (fpdf2, python-docx, openpyxl) membangkitkan pelbagai jenis ralat
+            errors.append(f"{folder}.{extension}: {e}")
+            continue
+        if data is not None: # Tiada mesej yang sepadan dengan penapis
+            files.append((f"{folder}.{extension}", data))
+    return files, errors
+
+
+# --- PENGURUS KERJA ---
+class _Job:
+    def __init__(self, job_id, sessions, format_labels, owner, path, workbook):
+        self.job_id = job_id
+        self.sessions = sessions
+        self.format_labels = format_labels
+        self.workbook = workbook # Satu buku kerja Excel untuk semua sesi
+        self.writing_workbook = False
+        self.owner = owner
+        self.path = path # Fail ZIP di cakera, dipadam apabila kerja dilupakan
+        self.state = JOB_QUEUED
+        self.sessions_done = 0
+        self.files_written = 0
+        self.errors = []
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.finished_at = None
+
+
+class BatchExportManager:
+    """Kolam proses dikongsi untuk eksport pukal, dengan ID kerja, kemajuan, pembatalan dan fail ZIP sementara."""
+    def __init__(self, history_dir=HISTORY_DIR, store_backend=SESSION_STORE, max_workers=BATCH_EXPORT_WORKERS,
+                 job_ttl=BATCH_EXPORT_JOB_TTL, export_dir=BATCH_EXPORT_DIR,
+                 logo_path=EXPORT_LOGO_PATH, watermark_text=EXPORT_WATERMARK_TEXT):
+        self.history_dir = history_dir
+        self.store_backend = store_backend
+        self.max_workers = max(1, max_workers)
+        self.job_ttl = job_ttl
+        self.export_dir = export_dir or tempfile.gettempdir()
+        self.logo_path = logo_path
+        self.watermark_text = watermark_text
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("spawn") # fork tidak selamat dalam proses berbilang thread
+        self._executor = None
+        self._store = None # Storan sesi proses ini, untuk buku kerja gabungan
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def _ensure_pool_locked(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=self._context,
+                initializer=_init_worker, initargs=(self.history_dir, self.store_backend),
+            )
+        return self._executor
+
+    def submit(self, sessions, format_labels, owner=None, include_user=True, include_assistant=True, include_thinking=True, workbook=False):
+        """Memulakan eksport pukal dan mengembalikan ID kerja tanpa menunggu. 'sessions' ialah senarai (pengguna, sesi).
+        Jika 'workbook', ZIP juga mengandungi WORKBOOK_FILENAME dengan satu helaian bagi setiap sesi."""
+        sessions = list(dict.fromkeys((username, session_id) for username, session_id in sessions))
+        format_labels = [label for label in dict.fromkeys(format_labels) if label in EXPORT_FORMATS]
+        if not sessions:
+            raise BatchExportError("Tiada sesi dipilih untuk dieksport.")
+        if not format_labels and not workbook:
+            raise BatchExportError("Tiada format eksport yang sah dipilih.")
+        if len(sessions) > BATCH_EXPORT_MAX_SESSIONS:
+            raise BatchExportError(f"Terlalu banyak sesi ({len(sessions)}); had ialah {BATCH_EXPORT_MAX_SESSIONS}.")
+        options = {
+            "include_user": include_user, "include_assistant": include_assistant, "include_thinking": include_thinking,
+            "logo_path": self.logo_path if self.logo_path and os.path.exists(self.logo_path) else None,
+            "watermark_text": self.watermark_text,
+        }
+        job_id = uuid.uuid4().hex
+        job = _Job(job_id, sessions, format_labels, owner, os.path.join(self.export_dir, f"batch-export-{job_id}.zip"), workbook)
+        with self._lock:
+            self._prune_locked()
+            executor = self._ensure_pool_locked()
+            self._jobs[job_id] = job
+        threading.Thread(target=self._run, args=(job, executor, options), name=f"batch-export-{job_id[:8]}", daemon=True).start()
+        return job_id
+
+    def _run(self, job, executor, options):
+        """Thread penyelaras: menghantar sesi ke kolam secara berperingkat dan menulis hasil ke ZIP mengikut siap."""
+        job.state = JOB_RUNNING
+        pending = set()
+        queue = iter(job.sessions if job.format_labels else ()) # Buku kerja sahaja: tiada kerja untuk kolam
+        max_in_flight = self.max_workers * IN_FLIGHT_PER_WORKER
+        try:
+            with zipfile.ZipFile(job.path, "w", zipfile.ZIP_DEFLATED) as archive:
+                while True:
+                    while not job.cancel_event.is_set() and len(pending) < max_in_flight:
+                        session = next(queue, None)
+                        if session is None:
+                            break
+                        pending.add(executor.submit(_render_session, session[0], session[1], job.format_labels, options))
+                    if not pending or job.cancel_event.is_set():
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files, errors = future.result()
+                        for arcname, data in files:
+                            compress_type = zipfile.ZIP_STORED if arcname.endswith(COMPRESSED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+                            archive.writestr(arcname, data, compress_type=compress_type)
+                        job.files_written += len(files)
+                        job.errors.extend(errors)
+                        job.sessions_done += 1
+                if job.workbook and not job.cancel_event.is_set():
+                    job.writing_workbook = True
+                    self._write_workbook(job, archive, options)
+                if job.errors:
+                    archive.writestr(ERRORS_FILENAME, "\n".join(job.errors) + "\n")
+        except BrokenProcessPool:
+            # Pekerja mati; kerja seterusnya akan membina kolam baru
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            job.error = "Proses pekerja eksport terhenti secara tidak dijangka."
+        except (OSError, zipfile.BadZipFile) as e:
+            job.error = f"Gagal menulis fail ZIP: {e}"
+        except Exception as e: # Cth. ralat openpyxl dalam buku kerja atau hasil pekerja yang tidak dapat di-unpickle
+            job.error = f"Eksport pukal gagal: {e}"
+        finally:
+            for future in pending:
+                future.cancel()
+            if job.cancel_event.is_set():
+                job.state = JOB_CANCELLED
+            elif job.error is not None:
+                job.state = JOB_FAILED
+            else:
+                job.state = JOB_DONE
+            if job.state != JOB_DONE:
+                self._remove_file(job)
+            job.finished_at = time.time()
+
+    def _workbook_sessions(self, job, options):
+        """Penjana (nama helaian, mesej): setiap sesi dimuatkan hanya apabila helaiannya ditulis."""
+        if self._store is None:
+            self._store = get_session_store(self.history_dir, self.store_backend)
+        for username, session_id in job.sessions:
+            if job.cancel_event.is_set():
+                return
+            try:
+                history = self._store.load_session(username, session_id)
+            except SessionStoreError as e:
+                job.errors.append(f"{WORKBOOK_FILENAME}: {username}/{session_id}: gagal memuatkan sesi: {e}")
+                continue
+            yield f"{username} {session_id}", filter_history(history, options["include_user"], options["include_assistant"])
+            if not job.format_labels:
+                job.sessions_done += 1 # Kemajuan dilaporkan oleh peringkat ini sahaja
+
+    def _write_workbook(self, job, archive, options):
+        # Buku kerja write-only distrim terus ke entri ZIP; tiada fail sementara atau salinan dalam memori
+        info = zipfile.ZipInfo(WORKBOOK_FILENAME, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        with archive.open(info, "w", force_zip64=True) as entry:
+            write_excel(entry, self._workbook_sessions(job, options), options["include_thinking"])
+        job.files_written += 1
+
+    @staticmethod
+    def _remove_file(job):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+
+    def _prune_locked(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and now - job.finished_at > self.job_ttl]:
+            self._remove_file(self._jobs.pop(job_id))
+
+    def _get(self, job_id, owner=None):
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def status(self, job_id, owner=None):
+        """Status kerja sebagai kamus, atau None jika tidak wujud (atau milik pengguna lain)."""
+        with self._lock:
+            job = self._get(job_id, owner)
+        if job is None:
+            return None
+        size = os.path.getsize(job.path) if job.state == JOB_DONE and os.path.exists(job.path) else None
+        return {
+            "job_id": job.job_id, "state": job.state, "formats": job.format_labels,
+            "sessions_done": job.sessions_done, "sessions_total": len(job.sessions),
+            "files_written": job.files_written, "errors": list(job.errors), "error": job.error, "size": size,
+            "workbook": job.workbook, "writing_workbook": job.writing_workbook and job.state in ACTIVE_STATES,
+            "elapsed": round((job.finished_at or time.time()) - job.created_at, 3),
+        }
+
+    def zip_path(self, job_id, owner=None):
+        """Laluan fail ZIP yang siap, atau None jika kerja tidak wujud atau belum selesai."""
+        with self._lock:
+            job = self._get(job_id, owner)
+        if job is None or job.state != JOB_DONE or not os.path.exists(job.path):
+            return None
+        return job.path
+
+    def cancel(self, job_id, owner=None):
+        """Membatalkan kerja. Sesi yang sedang dijana diselesaikan dahulu; fail ZIP separa dipadam."""
+        with self._lock:
+            job = self._get(job_id, owner)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def forget(self, job_id, owner=None):
+        """Membuang kerja dan fail ZIPnya (kerja yang masih berjalan dibatalkan)."""
+        with self._lock:
+            job = self._get(job_id, owner)
+            if job is None:
+                return False
+            self._jobs.pop(job_id)
+        job.cancel_event.set()
+        if job.finished_at is not None:
+            self._remove_file(job) # Jika masih berjalan, thread penyelaras memadamnya selepas berhenti
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel_event.set()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
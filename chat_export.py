@@ -0,0 +1,196 @@
+"""Eksport perbualan ke Word, PDF, Teks, Excel dan PowerPoint sebagai bait dalam memori.
+
+Tiada fail ditulis ke direktori kerja: setiap pengeksport mengembalikan bait yang terus dihantar
+ke butang muat turun (Streamlit) atau respons HTTP. Modul ini tidak bergantung pada Streamlit
+supaya boleh digunakan oleh kedua-dua aplikasi, backend dan proses pekerja.
+Ralat semasa menjana dibangkitkan kepada pemanggil; logo yang tidak dapat dibaca hanya diabaikan.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+
+from docx import Document
+from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from docx.shared import Inches as DocxInches, Pt as DocxPt, RGBColor as DocxRGBColor
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from pdf_export import render_pdf
+from pptx_export import render_pptx
+
+# --- KONFIGURASI ---
+EXPORT_CACHE_ENABLED = os.getenv("EXPORT_CACHE_ENABLED", "1") == "1" # Eksport terakhir disimpan dalam sesi pengguna
+
+# Label UI -> (sambungan, jenis MIME, sumber data: teks berformat atau senarai mesej)
+EXPORT_FORMATS = {
+    "Word (.docx)": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text"),
+    "Teks (.txt)": ("txt", "text/plain", "text"),
+    "PDF (.pdf)": ("pdf", "application/pdf", "text"),
+    "Excel (.xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "history"),
+    "PowerPoint (.pptx)": ("pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation", "history"),
+}
+
+EXCEL_MAX_CELL_CHARS = 32767 # Had Excel bagi satu sel
+EXCEL_SHEET_TITLE_CHARS = 31
+EXCEL_DEFAULT_SHEET = "Perbualan"
+EXCEL_THINKING_COLUMN = "Thinking Process"
+
+def _round(value, digits=2):
+    return round(value, digits) if isinstance(value, (int, float)) else None
+
+# (tajuk lajur, lebar, nilai dari mesej); statistik hanya wujud pada mesej pembantu yang baru
+EXCEL_COLUMNS = [
+    ("Timestamp", 20, lambda msg: msg.get("timestamp") or msg.get("created_at")),
+    ("Role", 11, lambda msg: msg.get("role", "").capitalize()),
+    ("Message", 80, lambda msg: msg.get("content", "")),
+    (EXCEL_THINKING_COLUMN, 60, lambda msg: msg.get("thinking_process", "")),
+    ("Model", 22, lambda msg: msg.get("model")),
+    ("Generation Time (s)", 12, lambda msg: _round(msg.get("time_taken"))),
+    ("Time to First Token (s)", 12, lambda msg: _round(msg.get("time_to_first_token"))),
+    ("Prompt Tokens (est.)", 12, lambda msg: (msg.get("context") or {}).get("estimated_tokens")),
+    ("Response Tokens", 12, lambda msg: msg.get("token_count")),
+    ("Tokens/s", 10, lambda msg: _round(msg.get("tokens_per_second"), 1)),
+]
+
+
+def format_conversation_text(chat_history, include_user=True, include_assistant=True, include_thinking=False):
+    lines = []
+    for msg in chat_history:
+        role_display = msg["role"].capitalize()
+        content_display = msg.get("content", "").strip()
+        thinking_display = msg.get("thinking_process", "").strip() if include_thinking else ""
+        if msg["role"] == "user" and include_user:
+            lines.append(f"{role_display}: {content_display}")
+        elif msg["role"] == "assistant" and include_assistant:
+            if include_thinking:
+                content_display = content_display or "(Tiada jawapan utama)"
+            lines.append(f"{role_display}: {content_display}")
+            if thinking_display:
+                lines.append(f"  Proses Pemikiran AI:\n  ---------------------\n{thinking_display}\n  ---------------------")
+    return "\n\n".join(lines)
+
+def filter_history(chat_history, include_user=True, include_assistant=True):
+    return [msg for msg in chat_history
+            if (include_user and msg["role"] == "user") or (include_assistant and msg["role"] == "assistant")]
+
+def history_digest(chat_history):
+    """Cincangan kandungan sejarah; kunci cache eksport berubah sebaik sahaja sejarah berubah."""
+    payload = json.dumps(chat_history, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usable_logo(logo_path):
+    return bool(logo_path) and os.path.exists(logo_path)
+
+def export_word(text_content, logo_path=None, watermark_text=None):
+    doc = Document()
+    if _usable_logo(logo_path):
+        try:
+            paragraph = doc.add_paragraph()
+            paragraph.add_run().add_picture(logo_path, width=DocxInches(2.0)) # Saiz logo boleh laras
+            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+            doc.add_paragraph() # Baris kosong selepas logo
+        except Exception as e: # python-docx membangkitkan pelbagai jenis ralat bagi imej rosak
+            print(f"Gagal menambah logo pada Word: {e}")
+    if watermark_text:
+        watermark_para = doc.add_paragraph()
+        font = watermark_para.add_run(watermark_text).font
+        font.size = DocxPt(36) # Saiz tera air
+        font.color.rgb = DocxRGBColor(192, 192, 192) # Kelabu cair
+        font.bold = True
+        watermark_para.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        doc.add_paragraph()
+    for para_block in text_content.split("\n\n"):
+        doc.add_paragraph(para_block.strip())
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def export_pdf(text_content, logo_path=None, watermark_text=None):
+    # Fon, logo dan templat halaman (header, tera air, nombor halaman) disediakan sekali oleh pdf_export.py
+    return render_pdf(text_content, logo_path=logo_path if _usable_logo(logo_path) else None, watermark_text=watermark_text)
+
+def export_txt(text_content):
+    return text_content.encode("utf-8")
+
+def _sheet_title(name, used_titles):
+    title = re.sub(r"[\[\]:*?/\\]", "_", name).strip("'") or EXCEL_DEFAULT_SHEET
+    title = title[:EXCEL_SHEET_TITLE_CHARS]
+    candidate, suffix = title, 2
+    while candidate.lower() in used_titles: # Nama helaian Excel tidak peka huruf besar/kecil
+        tag = f"~{suffix}"
+        candidate, suffix = title[:EXCEL_SHEET_TITLE_CHARS - len(tag)] + tag, suffix + 1
+    used_titles.add(candidate.lower())
+    return candidate
+
+def _excel_value(sheet, value):
+    if not isinstance(value, str):
+        return value
+    value = ILLEGAL_CHARACTERS_RE.sub("", value)[:EXCEL_MAX_CELL_CHARS]
+    if value.startswith("="):
+        # Teks yang bermula dengan '=' disimpan sebagai teks, bukan formula
+        cell = WriteOnlyCell(sheet, value)
+        cell.data_type = "s"
+        return cell
+    return value
+
+def write_excel(target, sessions, include_thinking=False):
+    """Menulis buku kerja ke 'target' (laluan atau objek fail), satu helaian bagi setiap sesi.
+
+    Mod write-only openpyxl: setiap baris terus ditulis ke fail sementara dan tidak disimpan sebagai
+    objek sel, jadi memori tidak bergantung pada jumlah baris. 'sessions' ialah iterable (nama helaian,
+    mesej) dan boleh menjadi penjana yang memuatkan setiap sesi hanya apabila helaiannya ditulis."""
+    columns = [column for column in EXCEL_COLUMNS if include_thinking or column[0] != EXCEL_THINKING_COLUMN]
+    workbook = Workbook(write_only=True)
+    used_titles = set()
+    for name, history in sessions:
+        sheet = workbook.create_sheet(_sheet_title(name, used_titles))
+        for index, (_, width, _) in enumerate(columns, 1):
+            sheet.column_dimensions[get_column_letter(index)].width = width
+        sheet.freeze_panes = "A2"
+        header = []
+        for title, _, _ in columns:
+            cell = WriteOnlyCell(sheet, title)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        sheet.append(header)
+        for msg in history:
+            sheet.append([_excel_value(sheet, value(msg)) for _, _, value in columns])
+    if not used_titles:
+        workbook.create_sheet(EXCEL_DEFAULT_SHEET) # Buku kerja mesti mempunyai sekurang-kurangnya satu helaian
+    workbook.save(target)
+
+def export_excel(chat_history, include_thinking=False, sheet_name=EXCEL_DEFAULT_SHEET):
+    buffer = io.BytesIO()
+    write_excel(buffer, [(sheet_name, chat_history)], include_thinking)
+    return buffer.getvalue()
+
+def export_pptx(chat_history, logo_path=None, include_thinking=False):
+    # Logo dalam susun atur slaid, slaid sambungan bagi mesej panjang dan kod monospace: lihat pptx_export.py
+    return render_pptx(chat_history, logo_path=logo_path if _usable_logo(logo_path) else None, include_thinking=include_thinking)
+
+
+def export_conversation(format_label, chat_history, include_user=True, include_assistant=True,
+                        include_thinking=False, logo_path=None, watermark_text=None):
+    """Bait fail eksport bagi format (label EXPORT_FORMATS), atau None jika tiada mesej yang sepadan."""
+    extension, _, source = EXPORT_FORMATS[format_label]
+    if source == "history":
+        history = filter_history(chat_history, include_user, include_assistant)
+        if not history:
+            return None
+        if extension == "xlsx":
+            return export_excel(history, include_thinking)
+        return export_pptx(history, logo_path, include_thinking)
+    text_content = format_conversation_text(chat_history, include_user, include_assistant, include_thinking)
+    if not text_content:
+        return None
+    if extension == "docx":
+        return export_word(text_content, logo_path, watermark_text)
+    if extension == "pdf":
+        return export_pdf(text_content, logo_path, watermark_text)
+    return export_txt(text_content)
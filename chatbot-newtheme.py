@@ -1,56 +1,58 @@
 import streamlit as st
 import requests
-from docx import Document
-from docx.shared import Inches as DocxInches, Pt as DocxPt, RGBColor as DocxRGBColor
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from fpdf import FPDF
-import pandas as pd
 from datetime import datetime
 import os
-import json
-from pptx import Presentation
-from pptx.util import Inches as PptxInches, Pt as PptxPt
-from pptx.dml.color import RGBColor as PptxRGBColor
 import time
-from PIL import Image
-import pytesseract
-import fitz
-import bcrypt
+import base64
+import ollama_client
+from request_scheduler import RequestScheduler, QueueFullError, QueueTimeoutError
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED, has_images
+from session_store import get_session_store, SessionStoreError
+from context_window import ContextManager
+from model_residency import ModelResidencyManager, configured_models
+from file_extraction import ExtractionJobManager, ExtractionError, ACTIVE_STATES, JOB_QUEUED, JOB_DONE, JOB_CANCELLED # OCR/PDF dalam kolam proses
+from extraction_cache import ExtractionCache, EXTRACTION_CACHE_ENABLED
+from document_index import DocumentIndex, DocumentIndexError, RAG_ENABLED, augment_messages
+from knowledge_base import KnowledgeBase, KB_ENABLED, response_cache_options
+from chat_export import EXPORT_FORMATS, EXPORT_CACHE_ENABLED, export_conversation, history_digest
+from batch_export import BatchExportManager, BatchExportError, ERRORS_FILENAME, collect_sessions, is_batch_export_admin # ZIP banyak sesi dalam kolam proses
+from image_input import encode_image, supports_vision, use_vision # Imej terus ke model visi (bukan OCR)
+from user_store import UserStore, UserExistsError
+import login_security # bcrypt dalam kolam thread terhad + pengehad cubaan log masuk
+from login_security import LoginRateLimiter, LoginRateLimitError
 
 # --- KONFIGURASI ---
 HISTORY_DIR = "chat_sessions"
 UPLOAD_DIR = "uploaded_files"
-EXPORT_DIR = "exported_files"
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DEFAULT_OLLAMA_MODEL = os.getenv("DEFAULT_OLLAMA_MODEL", "STEMBot-4B")
 LOGO_PATH = os.getenv("logo_ikm", "logo_ikm.jpg") # PENAMBAHBAIKAN: Guna pembolehubah ini secara konsisten
 WATERMARK_TEXT = os.getenv("CHATBOT_WATERMARK_TEXT", "IKM Besut")
 USERS_DIR = "user_data"
 USERS_FILE = os.path.join(USERS_DIR, "users.json")
+STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "0.1")) # Saat minimum antara kemas kini placeholder semasa strim
+EXTRACTION_POLL_INTERVAL = float(os.getenv("EXTRACTION_POLL_INTERVAL", "0.5")) # Saat antara kemas kini bar kemajuan ekstraksi
+BATCH_EXPORT_POLL_INTERVAL = float(os.getenv("BATCH_EXPORT_POLL_INTERVAL", "1")) # Saat antara kemas kini bar kemajuan eksport pukal
 
 # Pastikan direktori wujud
 os.makedirs(HISTORY_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(EXPORT_DIR, exist_ok=True)
 os.makedirs(USERS_DIR, exist_ok=True)
 
 # --- FUNGSI PENGURUSAN AKAUN ---
-def load_users():
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            json.dump({}, f)
-    with open(USERS_FILE, "r") as f:
-        return json.load(f)
+@st.cache_resource
+def get_user_store():
+    """Direktori pengguna dikongsi (lihat user_store.py); users.json dibaca semula hanya apabila berubah."""
+    return UserStore(USERS_FILE)
 
-def save_users(users):
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+@st.cache_resource
+def get_login_rate_limiter():
+    return LoginRateLimiter()
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return login_security.hash_password(password)
 
 def verify_password(password, hashed):
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+    return login_security.verify_password(password, hashed)
 
 # --- HALAMAN LOGIN & PENDAFTARAN ---
 def login_page():
@@ -59,8 +61,17 @@ def login_page():
     password = st.text_input("Kata Laluan", type="password", key="login_password")
 
     if st.button("Log Masuk", type="primary", use_container_width=True):
-        users = load_users()
-        if username in users and verify_password(password, users[username]["password"]):
+        limiter = get_login_rate_limiter()
+        limits = login_security.login_limits(username)
+        try:
+            attempt = limiter.check(limits) # Ditempah sebagai kegagalan sehingga kata laluan disahkan
+        except LoginRateLimitError as e:
+            st.error(f"Terlalu banyak cubaan log masuk yang gagal. Sila cuba lagi dalam {e.retry_after} saat.")
+            return
+        user = get_user_store().get_user(username)
+        if user is not None and verify_password(password, user["password"]):
+            limiter.release(limits, attempt)
+            limiter.reset(f"user:{username}")
             st.session_state.authenticated = True
             st.session_state.username = username
             st.success("Berjaya log masuk!")
@@ -81,15 +92,18 @@ def register_page():
         if password != confirm_password:
             st.error("Kata laluan tidak sepadan.")
             return
-        users = load_users()
-        if username in users:
+        user_store = get_user_store()
+        if user_store.exists(username):
+            st.error("Nama pengguna telah wujud.")
+            return
+        try:
+            user_store.add_user(username, {
+                "password": hash_password(password),
+                "created_at": datetime.now().isoformat()
+            })
+        except UserExistsError:
             st.error("Nama pengguna telah wujud.")
             return
-        users[username] = {
-            "password": hash_password(password),
-            "created_at": datetime.now().isoformat()
-        }
-        save_users(users)
         st.success("Akaun berjaya didaftarkan! Sila log masuk.")
         st.rerun()
 
@@ -108,403 +122,403 @@ def authentication_ui():
     return True
 
 # --- FUNGSI HELPER ---
+@st.cache_resource
+def get_request_scheduler():
+    """Satu penjadual untuk semua sesi pelayar dalam proses Streamlit ini."""
+    return RequestScheduler()
+
+@st.cache_resource
+def get_response_cache():
+    """Cache respons dikongsi (SQLite) atau None jika dilumpuhkan melalui RESPONSE_CACHE_ENABLED."""
+    return ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+@st.cache_resource
+def get_context_manager():
+    """Mengehadkan sejarah yang dihantar ke Ollama mengikut bajet token (lihat context_window.py)."""
+    return ContextManager(scheduler=get_request_scheduler())
+
+@st.cache_resource
+def get_document_index():
+    """Indeks vektor dokumen yang dimuat naik (lihat document_index.py), atau None jika RAG_ENABLED=0."""
+    return DocumentIndex() if RAG_ENABLED else None
+
+@st.cache_resource
+def get_knowledge_base():
+    """Indeks bahan kursus dikongsi (bina dengan: python knowledge_base.py build), atau None jika KB_ENABLED=0."""
+    return KnowledgeBase() if KB_ENABLED else None
+
+@st.cache_resource
+def get_model_residency():
+    """Memanaskan model lalai sekali bagi setiap proses dan memuatkannya semula jika dipunggah oleh Ollama."""
+    return ModelResidencyManager(configured_models(DEFAULT_OLLAMA_MODEL), scheduler=get_request_scheduler()).start()
+
 @st.cache_data(ttl=300)
 def get_ollama_models_cached():
     try:
-        response = requests.get(f'{OLLAMA_BASE_URL}/api/tags', timeout=10)
-        response.raise_for_status()
-        models_data = response.json().get('models', [])
-        if not models_data:
-            return []
-        return sorted([model['name'] for model in models_data])
+        return ollama_client.list_models(timeout=10)
     except requests.exceptions.RequestException:
         return []
     except Exception:
         return []
 
-def query_ollama_non_stream(prompt, chat_history, selected_model):
-    messages_for_api = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history]
-    is_prompt_already_last_user_message = False
-    if messages_for_api and messages_for_api[-1]["role"] == "user" and messages_for_api[-1]["content"] == prompt:
-        is_prompt_already_last_user_message = True
-    if not is_prompt_already_last_user_message:
-        messages_for_api.append({"role": "user", "content": prompt})
-
+def query_ollama(prompt, chat_history, selected_model, response_placeholder, thinking_placeholder=None):
+    """Menghantar pertanyaan ke Ollama secara strim dan mengemas kini placeholder secara berkala.
+    Mengembalikan (jawapan, proses_pemikiran, masa_penjanaan, statistik)."""
+    history_for_api = [{key: msg[key] for key in ("role", "content", "images") if key in msg} for msg in chat_history]
+    if not history_for_api or history_for_api[-1]["role"] != "user" or history_for_api[-1]["content"] != prompt:
+        history_for_api.append({"role": "user", "content": prompt})
+    # Petikan dokumen yang dimuat naik disertakan pada soalan semasa sahaja, bukan dalam sejarah
+    retrieved = retrieve_document_context(chat_history, prompt)
+    history_for_api = augment_messages(history_for_api, retrieved)
+    # Hanya giliran terkini yang muat dalam bajet token dihantar; giliran lama diringkaskan
+    context = get_context_manager().build(history_for_api, selected_model, images=supports_vision(selected_model))
+    messages_for_api = context.messages
+
+    splitter = ollama_client.ThinkTagSplitter()
     start_time = time.time()
-    thinking_process = "" 
-    assistant_reply = "Maaf, saya tidak dapat respons yang betul." 
+    first_token_time = None
+    last_render_time = 0.0
+    chunk_count = 0
+    final_chunk = {}
+
+    def render(final=False):
+        cursor = "" if final else "▌"
+        if thinking_placeholder is not None and splitter.thinking:
+            thinking_placeholder.caption("💭 " + splitter.thinking + ("" if final or splitter.answer else cursor))
+        response_placeholder.markdown(splitter.answer + cursor if (splitter.answer or not final) else "*(Tiada respons kandungan)*")
+
     try:
-        payload = {'model': selected_model, 'messages': messages_for_api, 'stream': False}
-        response = requests.post(f'{OLLAMA_BASE_URL}/api/chat', json=payload, timeout=600) 
-        response.raise_for_status()
-        full_response_data = response.json()
-        raw_assistant_reply = full_response_data.get('message', {}).get('content')
-        if raw_assistant_reply is None:
-            raw_assistant_reply = "Maaf, respons dari model tidak mengandungi kandungan."
-            assistant_reply = raw_assistant_reply
-        else:
-            assistant_reply = raw_assistant_reply
-        thinking_start_tag = "<think>"
-        thinking_end_tag = "</think>"
-        if thinking_start_tag in raw_assistant_reply and thinking_end_tag in raw_assistant_reply:
-            try:
-                start_index = raw_assistant_reply.find(thinking_start_tag)
-                end_index = raw_assistant_reply.find(thinking_end_tag)
-                if 0 <= start_index < end_index:
-                    thinking_process = raw_assistant_reply[start_index + len(thinking_start_tag):end_index].strip()
-                    text_after_thinking = raw_assistant_reply[end_index + len(thinking_end_tag):].strip()
-                    text_before_thinking = raw_assistant_reply[:start_index].strip()
-                    if text_after_thinking:
-                        assistant_reply = text_after_thinking
-                    elif text_before_thinking:
-                        assistant_reply = text_before_thinking
-                    elif thinking_process: 
-                        assistant_reply = "" 
-            except Exception as e_parse:
-                st.warning(f"Ralat kecil semasa memproses tag pemikiran: {e_parse}. Menggunakan respons penuh.")
-                assistant_reply = raw_assistant_reply
-                thinking_process = ""
+        for chunk in ollama_client.stream_chat(messages_for_api, selected_model):
+            if splitter.feed_chunk(chunk):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                chunk_count += 1
+                now = time.time()
+                if now - last_render_time >= STREAM_UPDATE_INTERVAL:
+                    render()
+                    last_render_time = now
+            if chunk.get("done"):
+                final_chunk = chunk
+        splitter.finish()
         end_time = time.time()
-        processing_time = end_time - start_time
-        return assistant_reply, thinking_process, processing_time
+        render(final=True)
+        if not final_chunk.get("done"):
+            # Sambungan ditutup sebelum chunk 'done': jawapan separuh dipaparkan tetapi tiada statistik (tidak dicache)
+            st.warning("Respons dari Ollama terputus sebelum selesai.")
+            return splitter.answer, splitter.thinking, end_time - start_time, None
+        stats = ollama_client.compute_stream_stats(start_time, first_token_time, end_time, chunk_count, final_chunk)
+        stats["context"] = context.as_dict() # Direkodkan bersama jawapan: giliran yang digugurkan/diringkaskan
+        if retrieved:
+            stats["documents"] = [{"document": r["document"], "chunk": r["chunk"], "score": r["score"]} for r in retrieved]
+        return splitter.answer, splitter.thinking, end_time - start_time, stats
+    except ollama_client.OllamaStreamError as e:
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ollama melaporkan ralat semasa menjana jawapan: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, Ollama gagal menjana jawapan.", "", processing_time, None
     except requests.exceptions.HTTPError as http_err:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Ralat HTTP dari Ollama: {http_err} (selepas {processing_time:.2f}s)")
-        try:
-            error_details = response.json().get("error", "Tiada butiran ralat tambahan.")
-            st.error(f"Butiran dari Ollama: {error_details}")
-            return f"Maaf, berlaku ralat HTTP semasa menghubungi Ollama: {error_details}", "", processing_time
-        except:
-             return f"Maaf, berlaku ralat HTTP semasa menghubungi Ollama ({http_err.response.status_code}).", "", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ralat HTTP dari Ollama: {http_err} (selepas {processing_time:.2f}s)")
+        return f"Maaf, berlaku ralat HTTP semasa menghubungi Ollama ({http_err.response.status_code}).", "", processing_time, None
     except requests.exceptions.Timeout:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Gagal mendapatkan respons: Permintaan ke Ollama tamat masa selepas {processing_time:.2f}s.")
-        return "Maaf, permintaan tamat masa.", "", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Gagal mendapatkan respons: Permintaan ke Ollama tamat masa selepas {processing_time:.2f}s.")
+        return "Maaf, permintaan tamat masa.", "", processing_time, None
     except requests.exceptions.RequestException as e:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Masalah menyambung ke Ollama: {e} (selepas {processing_time:.2f}s)")
-        return "Maaf, berlaku masalah semasa menghubungi Ollama.", "", processing_time
-    except json.JSONDecodeError:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Format respons tidak dijangka (bukan JSON) dari Ollama (selepas {processing_time:.2f}s).")
-        return "Maaf, format respons dari Ollama tidak seperti yang dijangkakan.", "", processing_time
-    except KeyError:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Struktur data respons tidak dijangka dari Ollama (selepas {processing_time:.2f}s).")
-        return "Maaf, struktur data respons dari Ollama tidak seperti yang dijangkakan.", "", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Masalah menyambung ke Ollama: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, berlaku masalah semasa menghubungi Ollama.", "", processing_time, None
     except Exception as e:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Ralat tidak dijangka dalam query_ollama_non_stream: {e} (selepas {processing_time:.2f}s)")
-        return "Maaf, ralat tidak dijangka berlaku semasa memproses permintaan.", "", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ralat tidak dijangka semasa strim: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, ralat tidak dijangka berlaku.", "", processing_time, None
 
-# --- FUNGSI PENGURUSAN SESI (DIPERBAIKI) ---
-def get_user_history_dir(username):
-    user_dir = os.path.join(HISTORY_DIR, username)
-    os.makedirs(user_dir, exist_ok=True)
-    return user_dir
+# --- FUNGSI PENGURUSAN SESI (melalui session_store.py) ---
+@st.cache_resource
+def get_chat_session_store():
+    """Storan sesi dikongsi (SQLite, JSONL atau JSON, lihat SESSION_STORE dalam session_store.py)."""
+    return get_session_store(HISTORY_DIR)
 
 def save_chat_session(username, session_id, history):
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
-    except IOError as e:
+        get_chat_session_store().save_session(username, session_id, history)
+    except SessionStoreError as e:
         st.error(f"Gagal menyimpan sesi Perbualan '{session_id}' untuk pengguna '{username}': {e}")
 
-def load_chat_session(username, session_id):
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
+def load_chat_session(username, session_id, tail=None):
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except (json.JSONDecodeError, IOError) as e:
+        return get_chat_session_store().load_session(username, session_id, tail=tail)
+    except SessionStoreError as e:
         st.error(f"Gagal memuatkan sesi Perbualan '{session_id}' untuk pengguna '{username}': {e}")
         return []
 
 def load_all_session_ids(username):
-    user_history_dir = get_user_history_dir(username)
     try:
-        if not os.path.exists(user_history_dir):
-            return []
-        files = [f.replace(".json", "") for f in os.listdir(user_history_dir) if f.endswith(".json")]
-        def sort_key(filename):
-            try:
-                # PEMBETULAN: Menggunakan split('_') dan format yang betul
-                parts = filename.split('_')
-                if len(parts) >= 2:
-                    return datetime.strptime(f"{parts[0]}_{parts[1]}", "%Y%m%d_%H%M%S")
-            except (ValueError, IndexError): 
-                pass
-            return datetime.min
-        return sorted(files, key=sort_key, reverse=True)
-    except OSError as e:
-        st.error(f"Gagal membaca direktori sesi untuk pengguna '{username}': {e}")
+        return get_chat_session_store().list_sessions(username)
+    except SessionStoreError as e:
+        st.error(f"Gagal membaca senarai sesi untuk pengguna '{username}': {e}")
         return []
 
 def delete_chat_session_file(username, session_id):
-    user_history_dir = get_user_history_dir(username)
-    filepath = os.path.join(user_history_dir, f"{session_id}.json")
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if get_document_index() is not None:
+            get_document_index().delete_session(username, session_id)
+        if get_chat_session_store().delete_session(username, session_id):
             st.success(f"Sesi Perbualan '{session_id}' berjaya dipadam.")
             return True
         else:
-            st.warning(f"Fail sesi Perbualan '{session_id}' tidak ditemui untuk dipadam.")
+            st.warning(f"Sesi Perbualan '{session_id}' tidak ditemui untuk dipadam.")
             return False
-    except OSError as e:
+    except SessionStoreError as e:
         st.error(f"Gagal memadam sesi Perbualan '{session_id}': {e}")
         return False
 
 def delete_all_chat_sessions(username):
-    user_history_dir = get_user_history_dir(username)
-    deleted_count = 0
-    errors = []
     try:
-        if not os.path.exists(user_history_dir):
-            st.info("Tiada sesi Perbualan ditemui untuk pengguna ini.")
-            return True
-        for filename in os.listdir(user_history_dir):
-            if filename.endswith(".json"):
-                filepath = os.path.join(user_history_dir, filename)
-                try: 
-                    os.remove(filepath)
-                    deleted_count += 1
-                except OSError as e: 
-                    errors.append(f"Gagal memadam {filename}: {e}")
-        if errors:
-            for error in errors: st.error(error)
+        if get_document_index() is not None:
+            get_document_index().delete_all_sessions(username)
+        deleted_count = get_chat_session_store().delete_all_sessions(username)
         if deleted_count > 0: 
             st.success(f"{deleted_count} sesi Perbualan untuk pengguna '{username}' berjaya dipadam.")
         else: 
             st.info(f"Tiada sesi Perbualan ditemui untuk pengguna '{username}' untuk dipadam.")
         return True
-    except OSError as e:
-        st.error(f"Gagal mengakses direktori sesi untuk pengguna '{username}': {e}")
+    except SessionStoreError as e:
+        st.error(f"Gagal memadam sesi untuk pengguna '{username}': {e}")
         return False
 
-# --- FUNGSI EKSPORT & LAIN-LAIN ---
-def extract_text_from_file(uploaded_file_obj):
-    extracted_text = ""
-    filename = uploaded_file_obj.name
-    file_bytes = uploaded_file_obj.getvalue()
-    temp_docx_path = None
-    try:
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            image = Image.open(uploaded_file_obj)
-            extracted_text = pytesseract.image_to_string(image)
-            if not extracted_text.strip():
-                st.info(f"Tiada teks dapat diekstrak dari imej '{filename}' menggunakan OCR.")
-        elif filename.lower().endswith(".txt"):
-            extracted_text = file_bytes.decode('utf-8', errors='ignore')
-        elif filename.lower().endswith(".docx"):
-            temp_docx_path = os.path.join(UPLOAD_DIR, f"temp_{filename}")
-            try:
-                with open(temp_docx_path, "wb") as f:
-                    f.write(file_bytes)
-                doc = Document(temp_docx_path)
-                extracted_text = "\n".join([para.text for para in doc.paragraphs])
-            except Exception as e_docx:
-                st.error(f"Ralat semasa memproses fail DOCX '{filename}': {e_docx}")
-            finally:
-                if temp_docx_path and os.path.exists(temp_docx_path):
-                    try:
-                        os.remove(temp_docx_path)
-                    except OSError as e_remove:
-                        st.warning(f"Gagal memadam fail sementara DOCX '{temp_docx_path}': {e_remove}")
-        elif filename.lower().endswith(".pdf"):
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            for page in doc:
-                extracted_text += page.get_text()
-            doc.close()
-        else:
-            st.warning(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
-            return None
-        return extracted_text.strip() if isinstance(extracted_text, str) else None
-    except Exception as e:
-        st.error(f"Ralat umum semasa memproses fail '{filename}': {e}")
-        if temp_docx_path and os.path.exists(temp_docx_path):
+# --- EKSTRAKSI FAIL (kolam proses latar belakang, lihat file_extraction.py) ---
+@st.cache_resource
+def get_extraction_jobs():
+    """Satu kolam pekerja OCR/PDF untuk semua sesi pelayar dalam proses Streamlit ini.
+    Teks yang diekstrak dicache di bawah UPLOAD_DIR, jadi fail yang sama tidak diproses semula."""
+    return ExtractionJobManager(cache=ExtractionCache(UPLOAD_DIR) if EXTRACTION_CACHE_ENABLED else None)
+
+def submit_uploaded_files(uploaded_files):
+    """Menghantar semua fail ke kolam ekstraksi tanpa menunggu; pekerja kolam memproses fail serentak
+    dan kemajuan dipaparkan pada rerun seterusnya. Jika model menyokong visi, imej dikecilkan dan disimpan
+    untuk dihantar terus kepada model (tanpa OCR). Mengembalikan False jika mana-mana fail ditolak (jenis atau saiz)."""
+    jobs = get_extraction_jobs()
+    accepted = True
+    for uploaded_file in uploaded_files:
+        if use_vision(st.session_state.selected_ollama_model, uploaded_file.name):
             try:
-                os.remove(temp_docx_path)
-            except OSError as e_remove_outer:
-                st.warning(f"Gagal memadam fail sementara DOCX (luar) '{temp_docx_path}': {e_remove_outer}")
-        return None
-
-def format_conversation_text(chat_history, include_user=True, include_assistant=True):
-    lines = []
-    for msg in chat_history:
-        role_display = msg["role"].capitalize()
-        content_display = msg.get("content", "").strip()
-        thinking_display = msg.get("thinking_process", "").strip()
-        if (msg["role"] == "user" and include_user):
-            lines.append(f"{role_display}: {content_display}")
-        elif (msg["role"] == "assistant" and include_assistant):
-            main_line = f"{role_display}: {content_display if content_display else '(Tiada jawapan utama)'}"
-            lines.append(main_line)
-            if thinking_display:
-                lines.append(f"  Proses Pemikiran AI:\n  ---------------------\n{thinking_display}\n  ---------------------")
-    return "\n\n".join(lines)
-
-def save_to_word(text_content, filename='output.docx', logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT):
-    doc = Document()
-    if logo_path and os.path.exists(logo_path):
-        try:
-            paragraph = doc.add_paragraph()
-            run = paragraph.add_run()
-            run.add_picture(logo_path, width=DocxInches(2.0))
-            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            doc.add_paragraph()
-        except Exception as e:
-            st.warning(f"Gagal menambah logo pada Word: {e}. Pastikan fail imej sah.")
-    if watermark_text:
-        watermark_para = doc.add_paragraph()
-        run = watermark_para.add_run(watermark_text)
-        font = run.font
-        font.size = DocxPt(36)
-        font.color.rgb = DocxRGBColor(192, 192, 192)
-        font.bold = True
-        watermark_para.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        doc.add_paragraph()
-    for para_block in text_content.split("\n\n"):
-        doc.add_paragraph(para_block.strip())
-    try: 
-        doc.save(filename)
-        return True
-    except IOError as e: 
-        st.error(f"Gagal menyimpan ke Word: {e}")
-        return False
-
-def save_to_pdf(text_content, filename='output.pdf', logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    FONT_DIR = "fonts"
-    FONT_REGULAR_FILENAME = "DejaVuSans.ttf"
-    FONT_REGULAR_PATH = os.path.join(FONT_DIR, FONT_REGULAR_FILENAME)
-    UNICODE_FONT_FAMILY = "DejaVuSans"
-    DEFAULT_FALLBACK_FONT = "Arial"
-    current_font_family_for_content = DEFAULT_FALLBACK_FONT
-    current_font_family_for_watermark = DEFAULT_FALLBACK_FONT
-    watermark_style = 'B'
-    if os.path.exists(FONT_REGULAR_PATH):
-        try:
-            pdf.add_font(UNICODE_FONT_FAMILY, '', FONT_REGULAR_PATH, uni=True)
-            current_font_family_for_content = UNICODE_FONT_FAMILY
-            current_font_family_for_watermark = UNICODE_FONT_FAMILY
-            watermark_style = ''
-        except RuntimeError as e:
-            st.warning(f"Gagal memuatkan fon Unicode '{FONT_REGULAR_PATH}': {e}. Menggunakan fon lalai '{DEFAULT_FALLBACK_FONT}'.")
-    else:
-        st.warning(f"Fail fon Unicode '{FONT_REGULAR_PATH}' tidak ditemui. Menggunakan fon lalai '{DEFAULT_FALLBACK_FONT}'. Pastikan fail fon ada dalam direktori '{FONT_DIR}'.")
-    if logo_path and os.path.exists(logo_path):
+                image = encode_image(uploaded_file)
+            except (OSError, ValueError) as e:
+                st.warning(f"Imej '{uploaded_file.name}' tidak dapat dibaca: {e}")
+                accepted = False
+                continue
+            st.session_state.pending_images = st.session_state.get("pending_images", []) + [{"filename": uploaded_file.name, "image": image}]
+            continue
         try:
-            img_width = 30
-            page_width = pdf.w - 2 * pdf.l_margin
-            x_logo = (page_width - img_width) / 2 + pdf.l_margin
-            pdf.image(logo_path, x=x_logo, y=10, w=img_width)
-            pdf.ln(25)
-        except Exception as e:
-            st.warning(f"Gagal menambah logo pada PDF: {e}. Pastikan fail imej sah dan format disokong oleh FPDF (PNG, JPG, GIF).")
-    y_before_watermark = pdf.get_y()
-    if watermark_text:
-        pdf.set_font(current_font_family_for_watermark, style=watermark_style, size=30)
-        pdf.set_text_color(220, 220, 220)
-        text_w = pdf.get_string_width(watermark_text)
-        page_center_x = pdf.w / 2
-        page_center_y = pdf.h / 2
-        pdf.set_xy(page_center_x - (text_w / 2), page_center_y - 5)
-        pdf.cell(text_w, 10, watermark_text, 0, 0, 'C')
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_xy(pdf.l_margin, y_before_watermark)
-        if not (logo_path and os.path.exists(logo_path)):
-            pdf.ln(5)
-    pdf.set_font(current_font_family_for_content, size=12)
-    for para_block in text_content.split("\n\n"):
-        pdf.multi_cell(0, 10, para_block.strip())
-        pdf.ln(5)
-    try:
-        pdf.output(filename)
-        return True
-    except Exception as e:
-        st.error(f"Gagal menyimpan ke PDF: {e}")
-        return False
-
-def save_to_txt(text_content, filename='output.txt'):
-    try:
-        with open(filename, "w", encoding="utf-8") as f: 
-            f.write(text_content)
-        return True
-    except IOError as e: 
-        st.error(f"Gagal menyimpan ke Teks: {e}")
-        return False
-
-def save_to_excel(chat_history, filename='chat_output.xlsx'):
-    data = []
-    for msg in chat_history:
-        role = msg["role"].capitalize()
-        content = msg.get("content", "")
-        thinking = msg.get("thinking_process", "")
-        if thinking:
-            data.append([role, content, thinking])
+            job_id = jobs.submit(uploaded_file.name, uploaded_file, owner=st.session_state.username)
+        except ExtractionError as e:
+            st.warning(str(e))
+            accepted = False
+            continue
+        st.session_state.extraction_job_ids = st.session_state.get("extraction_job_ids", []) + [job_id]
+    return accepted
+
+def extraction_job_statuses(include_text=False):
+    jobs = get_extraction_jobs()
+    statuses = (jobs.status(job_id, owner=st.session_state.username, include_text=include_text)
+                for job_id in st.session_state.get("extraction_job_ids") or [])
+    return [job for job in statuses if job is not None]
+
+def poll_extraction_jobs():
+    """Status kerja ekstraksi sesi ini ([] jika tiada). Apabila semua kerja tamat, ia dikeluarkan dari sesi
+    dan dikembalikan bersama, supaya semua fail dari satu muat naik dijawab dalam satu giliran."""
+    statuses = extraction_job_statuses(include_text=True)
+    if not any(job["state"] in ACTIVE_STATES for job in statuses):
+        jobs = get_extraction_jobs()
+        for job_id in st.session_state.get("extraction_job_ids") or []:
+            jobs.forget(job_id, owner=st.session_state.username)
+        st.session_state.extraction_job_ids = []
+    return statuses
+
+def truncation_note(job):
+    truncation = job["truncation"]
+    if not truncation:
+        return ""
+    return (f"\n\n[Teks '{job['filename']}' dipotong: hanya {truncation['units_read']} daripada {truncation['units_total']} "
+            f"{truncation['unit']} pertama disertakan (had {truncation['max_chars']:,} aksara).]")
+
+def file_content_message_for(job):
+    """Mesej sembang bagi teks yang diekstrak, dengan nota jika teks dipotong mengikut bajet."""
+    return f"Kandungan dari fail '{job['filename']}':\n\n{job['text']}" + truncation_note(job)
+
+def upload_turn_message(extraction_jobs, images=()):
+    """Mengindeks teks setiap fail untuk RAG dan mengembalikan satu mesej pengguna yang pendek untuk sejarah.
+    Fail yang tidak dapat diindeks disertakan dengan teks penuh dalam mesej seperti sebelum ini;
+    imej untuk model visi dilampirkan dalam 'images'."""
+    index = get_document_index()
+    indexed, full_texts = [], []
+    for job in extraction_jobs:
+        document = None
+        if index is not None:
+            try:
+                document = index.add_document(st.session_state.username, st.session_state.session_id, job["filename"], job["text"])
+            except (requests.exceptions.RequestException, DocumentIndexError) as e:
+                st.warning(f"Gagal mengindeks '{job['filename']}' untuk carian ({e}); teks penuh disertakan dalam perbualan.")
+        if document is None:
+            full_texts.append(file_content_message_for(job))
         else:
-            data.append([role, content, ""])
-    df = pd.DataFrame(data, columns=["Role", "Message", "Thinking Process"])
-    try: 
-        df.to_excel(filename, index=False, engine='openpyxl')
-        return True
-    except Exception as e: 
-        st.error(f"Gagal menyimpan ke Excel: {e}")
-        return False
-
-def save_to_pptx(chat_history, filename='chat_output.pptx', logo_path=LOGO_PATH):
-    prs = Presentation()
-    slide_layout = prs.slide_layouts[6]
-    for msg in chat_history:
-        slide = prs.slides.add_slide(slide_layout)
-        if logo_path and os.path.exists(logo_path):
+            indexed.append((document, job))
+    parts = []
+    if indexed:
+        listing = ", ".join(f"'{document['filename']}' ({document['chunks']} bahagian diindeks untuk rujukan)" for document, _ in indexed)
+        parts.append(f"Saya telah memuat naik fail {listing}. Berikan ringkasan kandungannya."
+                     + "".join(truncation_note(job) for _, job in indexed))
+    if images:
+        listing = ", ".join(f"'{image['filename']}'" for image in images)
+        parts.append(f"Saya telah memuat naik imej {listing}. Terangkan kandungannya, termasuk rajah, graf, persamaan atau tulisan tangan.")
+    message = {"role": "user", "content": "\n\n".join(parts + full_texts), "timestamp": message_timestamp()}
+    if indexed:
+        message["documents"] = [document["filename"] for document, _ in indexed]
+    if images:
+        message["images"] = [image["image"] for image in images]
+        message["image_names"] = [image["filename"] for image in images]
+    return message
+
+def session_has_documents():
+    index = get_document_index()
+    session_id = st.session_state.get("session_id")
+    return index is not None and bool(session_id) and session_id != "new" and index.has_documents(st.session_state.username, session_id)
+
+def retrieve_document_context(chat_history, prompt):
+    """Petikan dokumen sesi ini dan bahan kursus (pangkalan pengetahuan) yang berkaitan dengan soalan semasa.
+    Giliran muat naik fail (mesej dengan kunci 'documents') hanya menggunakan bahagian awal dokumen itu."""
+    index = get_document_index()
+    knowledge_base = get_knowledge_base()
+    latest = chat_history[-1] if chat_history else {}
+    retrieved = []
+    try:
+        if session_has_documents():
+            if latest.get("documents") and latest.get("content") == prompt:
+                count = max(1, index.top_k // len(latest["documents"]))
+                return [chunk for filename in latest["documents"]
+                        for chunk in index.first_chunks(st.session_state.username, st.session_state.session_id, filename, count)]
+            retrieved = index.search(st.session_state.username, st.session_state.session_id, prompt)
+        if knowledge_base is not None:
+            retrieved += knowledge_base.search(prompt)
+    except (requests.exceptions.RequestException, DocumentIndexError) as e:
+        st.warning(f"Carian dokumen gagal: {e}")
+    return retrieved
+
+def render_extraction_progress(placeholder, extraction_jobs):
+    with placeholder.container():
+        for job in extraction_jobs:
+            if job["state"] not in ACTIVE_STATES:
+                fraction, text = 1.0, f"'{job['filename']}' selesai."
+            elif job["pages_total"]:
+                fraction = job["pages_done"] / job["pages_total"]
+                text = f"Memproses '{job['filename']}': halaman {job['pages_done']}/{job['pages_total']}"
+            else:
+                fraction = 0.0
+                text = f"'{job['filename']}' dalam giliran..." if job["state"] == JOB_QUEUED else f"Memproses '{job['filename']}'..."
+            st.progress(min(fraction, 1.0), text=text)
+
+def wait_for_extraction_jobs(progress_placeholder):
+    """Dipanggil di hujung skrip: mengemas kini bar kemajuan sehingga semua kerja tamat, kemudian rerun.
+    Halaman kekal responsif kerana sebarang interaksi pengguna memulakan rerun baru."""
+    if not st.session_state.get("extraction_job_ids") or progress_placeholder is None:
+        return
+    while True:
+        statuses = extraction_job_statuses()
+        if not any(job["state"] in ACTIVE_STATES for job in statuses):
+            break
+        render_extraction_progress(progress_placeholder, statuses)
+        time.sleep(EXTRACTION_POLL_INTERVAL)
+    st.rerun()
+
+# --- EKSPORT PUKAL (pentadbir sahaja, lihat batch_export.py) ---
+@st.cache_resource
+def get_batch_exports():
+    """Satu kolam pekerja eksport pukal untuk semua sesi pelayar; fail ZIP disimpan sementara di cakera."""
+    return BatchExportManager(HISTORY_DIR, logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT)
+
+def batch_export_status(username):
+    job_id = st.session_state.get("batch_export_job_id")
+    return get_batch_exports().status(job_id, owner=username) if job_id else None
+
+def render_batch_export_progress(placeholder, job):
+    total = job["sessions_total"]
+    if job["writing_workbook"]:
+        text = f"Menulis buku kerja Excel ({total} helaian)..."
+    else:
+        text = f"Mengeksport sesi {job['sessions_done']}/{total}..."
+    placeholder.progress(job["sessions_done"] / total if total else 0.0, text=text)
+
+def display_batch_export(username):
+    """Eksport semua sesi pengguna yang dipilih (cth. satu kelas) ke satu fail ZIP.
+    Mengembalikan placeholder bar kemajuan jika kerja sedang berjalan."""
+    manager = get_batch_exports()
+    job = batch_export_status(username)
+    with st.expander("📦 Eksport Pukal (Pentadbir)", expanded=job is not None):
+        if job is not None and job["state"] in ACTIVE_STATES:
+            progress_placeholder = st.empty()
+            render_batch_export_progress(progress_placeholder, job)
+            if st.button("Batal Eksport Pukal", key="cancel_batch_export", use_container_width=True):
+                manager.cancel(job["job_id"], owner=username)
+                st.rerun()
+            return progress_placeholder
+        if job is not None:
+            if job["state"] == JOB_DONE:
+                st.success(f"{job['files_written']} fail dari {job['sessions_total']} sesi sedia ({job['elapsed']:.1f}s).")
+                if job["errors"]:
+                    st.warning(f"{len(job['errors'])} fail gagal dijana; lihat {ERRORS_FILENAME} dalam ZIP.")
+                zip_path = manager.zip_path(job["job_id"], owner=username)
+                if zip_path:
+                    with open(zip_path, "rb") as f:
+                        st.download_button("📥 Muat Turun ZIP", data=f, file_name=f"eksport_pukal_{job['job_id'][:8]}.zip",
+                                           mime="application/zip", key="download_batch_zip", use_container_width=True)
+            elif job["state"] == JOB_CANCELLED:
+                st.info("Eksport pukal dibatalkan.")
+            else:
+                st.error(job["error"])
+        selected_users = st.multiselect("Pengguna:", get_user_store().usernames(), key="batch_export_users")
+        selected_formats = st.multiselect("Format:", list(EXPORT_FORMATS), default=["PDF (.pdf)"], key="batch_export_formats")
+        combined_workbook = st.checkbox("Satu buku kerja Excel untuk semua sesi (satu helaian setiap sesi)", key="batch_export_workbook")
+        if st.button("Jana ZIP", key="batch_export_button", type="primary", use_container_width=True):
+            sessions = collect_sessions(get_chat_session_store(), selected_users)
             try:
-                slide.shapes.add_picture(logo_path, PptxInches(0.2), PptxInches(0.2), height=PptxInches(0.75))
-            except Exception as e:
-                st.warning(f"Gagal menambah logo pada PowerPoint: {e}. Pastikan fail imej sah.")
-        left = PptxInches(0.5)
-        top = PptxInches(1.0) if logo_path and os.path.exists(logo_path) else PptxInches(0.5)
-        width = PptxInches(9.0)
-        height = PptxInches(5.5)
-        textbox = slide.shapes.add_textbox(left, top, width, height)
-        tf = textbox.text_frame
-        tf.word_wrap = True
-        p_role = tf.add_paragraph()
-        p_role.text = f"{msg['role'].capitalize()}:"
-        p_role.font.bold = True
-        p_role.font.size = PptxPt(18)
-        p_role.font.name = 'Arial'
-        content_text = msg.get("content", "")
-        thinking_text = msg.get("thinking_process", "")
-        p_content = tf.add_paragraph()
-        p_content.text = content_text
-        p_content.font.size = PptxPt(16)
-        p_content.font.name = 'Arial'
-        p_content.level = 1 
-        if thinking_text:
-            p_thinking_header = tf.add_paragraph()
-            run_thinking_header = p_thinking_header.add_run()
-            run_thinking_header.text = "Proses Pemikiran AI:"
-            run_thinking_header.font.italic = True
-            run_thinking_header.font.size = PptxPt(14)
-            p_thinking_content = tf.add_paragraph()
-            p_thinking_content.text = thinking_text
-            p_thinking_content.font.size = PptxPt(12)
-            p_thinking_content.level = 2 
-    # PEMBETULAN: Blok try/except untuk menyimpan fail hilang
-    try: 
-        prs.save(filename)
-        return True
-    except IOError as e: 
-        st.error(f"Gagal menyimpan ke PowerPoint: {e}")
-        return False
+                job_id = manager.submit(sessions, selected_formats, owner=username, workbook=combined_workbook)
+            except BatchExportError as e:
+                st.warning(str(e))
+            else:
+                if job is not None:
+                    manager.forget(job["job_id"], owner=username) # Fail ZIP sebelumnya tidak lagi diperlukan
+                st.session_state.batch_export_job_id = job_id
+                st.rerun()
+    return None
+
+def wait_for_batch_export(progress_placeholder, username):
+    """Seperti wait_for_extraction_jobs: mengemas kini bar kemajuan sehingga ZIP siap, kemudian rerun."""
+    if progress_placeholder is None:
+        return
+    while True:
+        job = batch_export_status(username)
+        if job is None or job["state"] not in ACTIVE_STATES:
+            break
+        render_batch_export_progress(progress_placeholder, job)
+        time.sleep(BATCH_EXPORT_POLL_INTERVAL)
+    st.rerun()
+
+# --- FUNGSI EKSPORT & LAIN-LAIN ---
+def cached_export(format_label, include_user, include_assistant):
+    """Bait fail eksport dalam memori. Eksport terakhir disimpan mengikut (sesi, format, penapis, cincangan
+    sejarah) supaya klik berulang tidak menjana semula fail yang sama."""
+    cache_key = (st.session_state.session_id, format_label, include_user, include_assistant,
+                 history_digest(st.session_state.chat_history))
+    cached = st.session_state.get("last_export")
+    if EXPORT_CACHE_ENABLED and cached is not None and cached[0] == cache_key:
+        return cached[1]
+    data = export_conversation(
+        format_label, st.session_state.chat_history, include_user, include_assistant,
+        include_thinking=True, logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT,
+    )
+    if EXPORT_CACHE_ENABLED:
+        st.session_state.last_export = (cache_key, data)
+    return data
 
 def initialize_session_state(available_models_list):
     if "session_id" not in st.session_state:
@@ -613,6 +627,98 @@ def handle_session_logic(username, selected_session_id_from_ui):
         st.session_state.current_filename_prefix = selected_session_id_from_ui
         st.session_state.chat_page_num = 1
 
+def format_generation_caption(msg):
+    caption_parts = [f"⏱️ {msg['time_taken']:.2f}s"]
+    if msg.get("time_to_first_token") is not None:
+        caption_parts.append(f"token pertama {msg['time_to_first_token']:.2f}s")
+    if msg.get("tokens_per_second"):
+        caption_parts.append(f"{msg['tokens_per_second']:.1f} token/s")
+    if msg.get("queue_wait"):
+        caption_parts.append(f"giliran {msg['queue_wait']:.1f}s")
+    if msg.get("cached"):
+        caption_parts.append("dari cache")
+    if msg.get("context", {}).get("dropped_messages"):
+        caption_parts.append(f"{msg['context']['dropped_messages']} mesej lama diringkaskan/digugurkan")
+    if msg.get("documents"):
+        caption_parts.append(f"{len(msg['documents'])} petikan dokumen")
+    return " · ".join(caption_parts)
+
+def message_timestamp():
+    # Disimpan bersama setiap mesej; dipaparkan dalam lajur Timestamp eksport Excel
+    return datetime.now().isoformat(timespec="seconds")
+
+def stream_assistant_reply(prompt):
+    """Memaparkan respons pembantu secara strim dan mengembalikan mesej untuk disimpan dalam sejarah."""
+    selected_model = st.session_state.selected_ollama_model
+    response_cache = get_response_cache()
+    if session_has_documents() or has_images(st.session_state.chat_history):
+        response_cache = None # Jawapan bergantung pada dokumen atau imej sesi ini; cache dikongsi tidak digunakan atau diisi
+    lookup_start = time.time()
+    cached_reply, question_embedding = None, None
+    cache_options = response_cache_options(get_knowledge_base()) # Generasi bahan kursus yang disertakan dalam prompt
+    if response_cache is not None:
+        cached_reply, question_embedding = response_cache.lookup(selected_model, st.session_state.chat_history, cache_options)
+    with st.chat_message("assistant"):
+        thinking_placeholder = st.empty()
+        response_placeholder = st.empty()
+
+        if cached_reply is not None:
+            # Soalan yang sama pernah dijawab; Ollama tidak dipanggil langsung
+            if cached_reply.get("thinking_process"):
+                thinking_placeholder.caption("💭 " + cached_reply["thinking_process"])
+            response_placeholder.markdown(cached_reply.get("content", ""))
+            assistant_message = dict(cached_reply, role="assistant", time_taken=time.time() - lookup_start, model=selected_model, timestamp=message_timestamp())
+            st.caption(format_generation_caption(assistant_message))
+            return assistant_message
+
+        def show_queue_position(ticket, estimated_wait):
+            response_placeholder.info(f"⏳ Dalam giliran (kedudukan {ticket.queue_position}, anggaran {estimated_wait:.0f}s)...")
+
+        ticket = None
+        try:
+            with get_request_scheduler().slot(selected_model, st.session_state.username, on_queued=show_queue_position) as ticket:
+                assistant_reply, thinking_text, gen_time, stream_stats = query_ollama(
+                    prompt,
+                    st.session_state.chat_history,
+                    selected_model,
+                    response_placeholder,
+                    thinking_placeholder
+                )
+        except QueueFullError as e:
+            response_placeholder.error(f"Pelayan sedang sibuk ({e.queue_depth} permintaan menunggu). Sila cuba lagi dalam {e.retry_after}s.")
+            assistant_reply, thinking_text, gen_time, stream_stats = "Maaf, pelayan sedang sibuk. Sila cuba sebentar lagi.", "", 0.0, None
+        except QueueTimeoutError as e:
+            response_placeholder.error(str(e))
+            assistant_reply, thinking_text, gen_time, stream_stats = "Maaf, permintaan tamat masa semasa menunggu giliran.", "", 0.0, None
+        assistant_message = {
+            "role": "assistant",
+            "content": assistant_reply,
+            "thinking_process": thinking_text,
+            "time_taken": gen_time,
+            "model": selected_model,
+            "timestamp": message_timestamp(),
+        }
+        if stream_stats:
+            assistant_message.update(stream_stats)
+            # Hanya respons yang berjaya (ada statistik strim) disimpan dalam cache
+            if response_cache is not None and assistant_reply:
+                response_cache.put(
+                    selected_model,
+                    st.session_state.chat_history,
+                    {"content": assistant_reply, "thinking_process": thinking_text},
+                    options=cache_options,
+                    embedding=question_embedding
+                )
+        if ticket is not None:
+            assistant_message.update(ticket.as_dict())
+        st.caption(format_generation_caption(assistant_message))
+    return assistant_message
+
+def render_message_images(msg):
+    """Imej yang dihantar kepada model visi dipaparkan bersama mesej pengguna."""
+    for image, name in zip(msg.get("images", []), msg.get("image_names", [])):
+        st.image(base64.b64decode(image), caption=name, width=320)
+
 def display_chat_messages_paginated():
     if not st.session_state.chat_history:
         st.info("💬 Mulakan perbualan dengan menaip di bawah atau muat naik fail untuk analisis.")
@@ -637,8 +743,9 @@ def display_chat_messages_paginated():
                 st.markdown(main_content_text)
             elif not thinking_process_text: 
                 st.markdown("*(Tiada respons kandungan)*")
+            render_message_images(msg)
             if msg["role"] == "assistant" and "time_taken" in msg and msg["time_taken"] is not None:
-                st.caption(f"⏱️ {msg['time_taken']:.2f}s")
+                st.caption(format_generation_caption(msg))
     if max_page > 1:
         cols_pagination = st.columns([1, 3, 1]) 
         with cols_pagination[1]:
@@ -668,10 +775,7 @@ def display_export_options():
                 index=2, key="export_content_radio"
             )
         with col_export2:
-            export_format_choice = st.selectbox("Format:", [
-                "Pilih format", "Word (.docx)", "Teks (.txt)", "PDF (.pdf)",
-                "Excel (.xlsx)", "PowerPoint (.pptx)"
-            ], key="export_format_select")
+            export_format_choice = st.selectbox("Format:", ["Pilih format"] + list(EXPORT_FORMATS), key="export_format_select")
         
         custom_filename_prefix_ui = st.text_input(
             "Nama fail awalan:",
@@ -683,74 +787,34 @@ def display_export_options():
             if export_format_choice == "Pilih format":
                 st.warning("Sila pilih format eksport."); return
             
-            filename_base = custom_filename_prefix_ui
             include_user = "Pengguna" in export_content_choice or "Keseluruhan" in export_content_choice
             include_assistant = "Pembantu" in export_content_choice or "Keseluruhan" in export_content_choice
-            
-            text_for_common_formats = format_conversation_text(st.session_state.chat_history, include_user, include_assistant)
-            history_for_excel_pptx = [
-                msg for msg in st.session_state.chat_history
-                if (include_user and msg["role"] == "user") or 
-                   (include_assistant and msg["role"] == "assistant")
-            ]
-
-            if not history_for_excel_pptx and (export_format_choice in ["Excel (.xlsx)", "PowerPoint (.pptx)"]):
+            # Fail dijana dalam memori dan terus distrim ke muat turun; tiada fail disimpan pada pelayan
+            try:
+                data = cached_export(export_format_choice, include_user, include_assistant)
+            except Exception as e: # docx/pptx/openpyxl/fpdf2 membangkitkan pelbagai jenis ralat
+                st.error(f"Gagal mengeksport ke {export_format_choice}: {e}")
+                return
+            if not data:
                 st.warning(f"Tiada mesej '{export_content_choice.lower().replace(' keseluruhan perbualan', '')}' untuk dieksport.")
                 return
 
-            success, exported_filepath = False, ""
-            
-            # --- PERUBAHAN DI SINI ---
-            # Bina nama fail dan laluan penuh
-            def get_full_path(extension):
-                # Bina nama fail sahaja dahulu
-                file_name_only = f"{filename_base}.{extension}"
-                # Gabungkan dengan direktori eksport untuk mendapatkan laluan penuh
-                return os.path.join(EXPORT_DIR, file_name_only), file_name_only
-
-            actions = {
-                "Word (.docx)": (save_to_word, text_for_common_formats, get_full_path("docx")),
-                "Teks (.txt)": (save_to_txt, text_for_common_formats, get_full_path("txt")),
-                "PDF (.pdf)": (save_to_pdf, text_for_common_formats, get_full_path("pdf")),
-                "Excel (.xlsx)": (save_to_excel, history_for_excel_pptx, get_full_path("xlsx")),
-                "PowerPoint (.pptx)": (save_to_pptx, history_for_excel_pptx, get_full_path("pptx"))
-            }
-
-            if export_format_choice in actions:
-                func, data_to_export, (full_path, file_name) = actions[export_format_choice]
-                
-                if not data_to_export:
-                    st.warning(f"Tiada kandungan untuk dieksport ke {export_format_choice}.")
-                    return
-
-                # Hantar laluan penuh ke fungsi simpan
-                success = func(data_to_export, full_path) 
-                if success:
-                    exported_filepath = full_path
-                    exported_filename_only = file_name
-            
-            if success and exported_filepath:
-                # Paparkan laluan penuh di mana fail disimpan
-                st.success(f"Fail disimpan di: {exported_filepath}")
-                try:
-                    # Buka fail menggunakan laluan penuh
-                    with open(exported_filepath, "rb") as f_download:
-                        st.download_button(
-                            "📥 Muat Turun", 
-                            data=f_download, 
-                            # Gunakan nama fail sahaja untuk butang muat turun
-                            file_name=exported_filename_only, 
-                            key=f"download_btn_{exported_filename_only.replace('.', '_')}_{time.time()}",
-                            use_container_width=True
-                        )
-                except FileNotFoundError: 
-                    st.error(f"Gagal mencari {exported_filepath} untuk dimuat turun.")
-                except Exception as e: 
-                    st.error(f"Ralat muat turun: {e}")
+            extension, mime, _ = EXPORT_FORMATS[export_format_choice]
+            exported_filename = f"{custom_filename_prefix_ui}.{extension}"
+            st.success(f"Fail sedia: {exported_filename}")
+            st.download_button(
+                "📥 Muat Turun", 
+                data=data, 
+                file_name=exported_filename, 
+                mime=mime,
+                key=f"download_btn_{extension}",
+                use_container_width=True
+            )
 
 # --- FUNGSI UTAMA (DIPERBAIKI) ---
 def main():
     st.set_page_config(page_title="DFK Stembot", layout="wide", initial_sidebar_state="expanded", page_icon="🤖")
+    get_model_residency() # Pemanasan berjalan di latar belakang; tidak menyekat halaman
 
     # Paparkan logo (menggunakan LOGO_PATH)
     if os.path.exists(LOGO_PATH):
@@ -797,65 +861,74 @@ def main():
     with st.sidebar:
         st.markdown("#### 📎 Muat Naik & Analisis Fail")
         uploader_key = f"file_uploader_{st.session_state.uploader_key_counter}"
-        uploaded_file = st.file_uploader(
-            "Pilih fail (Imej, PDF, DOCX, TXT):", 
-            type=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'txt', 'docx'],
+        uploaded_files = st.file_uploader(
+            "Pilih fail (Imej, PDF, DOCX, PPTX, XLSX, TXT):", 
+            type=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'txt', 'docx', 'pptx', 'xlsx'],
+            accept_multiple_files=True,
             key=uploader_key,
             label_visibility="collapsed"
         )
 
-        if uploaded_file is not None:
-            with st.spinner(f"Memproses '{uploaded_file.name}'..."):
-                extracted_text = extract_text_from_file(uploaded_file)
-            
-            if extracted_text:
-                st.success(f"Teks diekstrak dari '{uploaded_file.name}'.")
-                file_content_message = f"Kandungan dari fail '{uploaded_file.name}':\n\n{extracted_text}"
-                st.session_state.chat_history.append({"role": "user", "content": file_content_message})
-                
-                with st.spinner(f"Menganalisis kandungan fail..."):
-                    assistant_response, thinking_text, gen_time = query_ollama_non_stream(
-                        file_content_message,
-                        st.session_state.chat_history, 
-                        st.session_state.selected_ollama_model
-                    )
-                st.session_state.chat_history.append({
-                    "role": "assistant", 
-                    "content": assistant_response,
-                    "thinking_process": thinking_text,
-                    "time_taken": gen_time
-                })
+        if uploaded_files:
+            # Ekstraksi berjalan di latar belakang, serentak bagi beberapa fail; pemuat naik dikosongkan dan kemajuan dipaparkan selepas rerun
+            st.session_state.uploader_key_counter += 1
+            if submit_uploaded_files(uploaded_files):
+                st.rerun()
+
+        file_content_message = None
+        extraction_progress = None
+        extraction_jobs = poll_extraction_jobs()
+        if any(job["state"] in ACTIVE_STATES for job in extraction_jobs):
+            extraction_progress = st.empty()
+            render_extraction_progress(extraction_progress, extraction_jobs)
+            if st.button("Batal Ekstraksi", key=f"cancel_extraction_{extraction_jobs[0]['job_id']}", use_container_width=True):
+                for job in extraction_jobs:
+                    if job["state"] in ACTIVE_STATES:
+                        get_extraction_jobs().cancel(job["job_id"], owner=current_username)
+        elif extraction_jobs or st.session_state.get("pending_images"):
+            for job in extraction_jobs:
+                if job["state"] == JOB_DONE and not job["text"]:
+                    st.warning(f"Tiada teks diekstrak dari '{job['filename']}'.")
+                elif job["state"] == JOB_CANCELLED:
+                    st.info(f"Ekstraksi '{job['filename']}' dibatalkan.")
+                elif job["state"] != JOB_DONE:
+                    st.error(job["error"])
+            extracted = [job for job in extraction_jobs if job["state"] == JOB_DONE and job["text"]]
+            images = st.session_state.pop("pending_images", [])
+            if extracted or images:
+                if extracted:
+                    st.success("Teks diekstrak dari " + ", ".join(f"'{job['filename']}'" for job in extracted) + ".")
                 if st.session_state.session_id == "new":
+                    # Indeks dokumen disimpan mengikut sesi, jadi ID sesi diperlukan sebelum mengindeks
                     st.session_state.session_id = st.session_state.current_filename_prefix
-                save_chat_session(current_username, st.session_state.session_id, st.session_state.chat_history)
-            
-            elif extracted_text is None: 
-                pass 
-            else: 
-                st.warning(f"Tiada teks diekstrak dari '{uploaded_file.name}'.")
-            st.session_state.uploader_key_counter += 1
-            st.rerun()
+                file_message = upload_turn_message(extracted, images)
+                file_content_message = file_message["content"]
+                st.session_state.chat_history.append(file_message)
+
+        batch_export_progress = None
+        if is_batch_export_admin(current_username):
+            st.markdown("---")
+            batch_export_progress = display_batch_export(current_username)
 
     chat_container = st.container() 
     with chat_container:
         display_chat_messages_paginated()
 
+    if file_content_message:
+        # Respons untuk fail distrim di kawasan utama, bukan di sidebar
+        st.session_state.chat_history.append(stream_assistant_reply(file_content_message))
+        if st.session_state.session_id == "new":
+            st.session_state.session_id = st.session_state.current_filename_prefix
+        save_chat_session(current_username, st.session_state.session_id, st.session_state.chat_history)
+        st.rerun()
+
     user_input = st.chat_input(f"Tanya {st.session_state.selected_ollama_model.split(':')[0].capitalize()}...")
 
     if user_input:
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        with st.spinner(f"Sedang berfikir..."): 
-            assistant_response_text, thinking_text, generation_time = query_ollama_non_stream(
-                user_input, 
-                st.session_state.chat_history, 
-                st.session_state.selected_ollama_model
-            )
-        st.session_state.chat_history.append({
-            "role": "assistant", 
-            "content": assistant_response_text,
-            "thinking_process": thinking_text,
-            "time_taken": generation_time
-        })
+        st.session_state.chat_history.append({"role": "user", "content": user_input, "timestamp": message_timestamp()})
+        with st.chat_message("user"):
+            st.markdown(user_input)
+        st.session_state.chat_history.append(stream_assistant_reply(user_input))
         if st.session_state.session_id == "new":
             st.session_state.session_id = st.session_state.current_filename_prefix
         save_chat_session(current_username, st.session_state.session_id, st.session_state.chat_history)
@@ -866,6 +939,8 @@ def main():
         st.rerun()
 
     display_export_options()
+    wait_for_extraction_jobs(extraction_progress) # Mesti terakhir: menunggu sehingga kerja ekstraksi tamat
+    wait_for_batch_export(batch_export_progress, current_username)
 
 # PEMBETULAN: Ralat sintaks di sini
 if __name__ == "__main__":
@@ -1,48 +1,75 @@
 import streamlit as st
 import requests
-from docx import Document
-from docx.shared import Inches as DocxInches, Pt as DocxPt, RGBColor as DocxRGBColor
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from fpdf import FPDF # Pastikan ini adalah fpdf2: pip install fpdf2
-import pandas as pd
 from datetime import datetime
 import os
-import json
-from pptx import Presentation
-from pptx.util import Inches as PptxInches, Pt as PptxPt
-from pptx.dml.color import RGBColor as PptxRGBColor
 import time
-from PIL import Image
-import pytesseract # Anda mungkin perlu memasang Tesseract OCR: https://github.com/tesseract-ocr/tesseract
-import fitz  # PyMuPDF untuk PDF: pip install PyMuPDF
+import base64
+import ollama_client # Klien Ollama dikongsi (kolam sambungan, timeout, cubaan semula)
+from request_scheduler import RequestScheduler, QueueFullError, QueueTimeoutError
+from response_cache import ResponseCache, RESPONSE_CACHE_ENABLED, has_images
+from session_store import get_session_store, SessionStoreError
+from context_window import ContextManager
+from model_residency import ModelResidencyManager, configured_models
+from file_extraction import ExtractionJobManager, ExtractionError, ACTIVE_STATES, JOB_QUEUED, JOB_DONE, JOB_CANCELLED # OCR/PDF dalam kolam proses
+from extraction_cache import ExtractionCache, EXTRACTION_CACHE_ENABLED
+from document_index import DocumentIndex, DocumentIndexError, RAG_ENABLED, augment_messages
+from knowledge_base import KnowledgeBase, KB_ENABLED, response_cache_options
+from chat_export import EXPORT_FORMATS, EXPORT_CACHE_ENABLED, export_conversation, history_digest
+from image_input import encode_image, supports_vision, use_vision # Imej terus ke model visi (bukan OCR)
+import uuid
 
 # --- KONFIGURASI ---
 HISTORY_DIR = "chat_sessions"
 UPLOAD_DIR = "uploaded_files" # Direktori untuk fail yang dimuat naik
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DEFAULT_OLLAMA_MODEL = os.getenv("DEFAULT_OLLAMA_MODEL", "llama3") # Model lalai
 
 # Konfigurasi untuk ciri dari chatbot2
 LOGO_PATH = os.getenv("ikm_logo", "ikm_logo.png") # Letakkan logo anda di sini dan namakannya ikm_logo.png atau set pembolehubah persekitaran
 WATERMARK_TEXT = os.getenv("CHATBOT_WATERMARK_TEXT", "IKM Besut")
-# Pastikan Tesseract OCR dipasang dan dikonfigurasi dalam PATH sistem anda, atau setkan laluan tesseract_cmd
-# Contoh: pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "0.1")) # Saat minimum antara kemas kini placeholder semasa strim
+EXTRACTION_POLL_INTERVAL = float(os.getenv("EXTRACTION_POLL_INTERVAL", "0.5")) # Saat antara kemas kini bar kemajuan ekstraksi
+# Pastikan Tesseract OCR dipasang dan dikonfigurasi dalam PATH sistem anda, atau setkan TESSERACT_CMD (lihat ocr_pipeline.py)
 
 os.makedirs(HISTORY_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # --- FUNGSI HELPER (Gabungan dan Penambahbaikan) ---
 
+@st.cache_resource
+def get_request_scheduler():
+    """Satu penjadual untuk semua sesi pelayar dalam proses Streamlit ini."""
+    return RequestScheduler()
+
+@st.cache_resource
+def get_response_cache():
+    """Cache respons dikongsi (SQLite) atau None jika dilumpuhkan melalui RESPONSE_CACHE_ENABLED."""
+    return ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+@st.cache_resource
+def get_context_manager():
+    """Mengehadkan sejarah yang dihantar ke Ollama mengikut bajet token (lihat context_window.py)."""
+    return ContextManager(scheduler=get_request_scheduler())
+
+@st.cache_resource
+def get_document_index():
+    """Indeks vektor dokumen yang dimuat naik (lihat document_index.py), atau None jika RAG_ENABLED=0."""
+    return DocumentIndex() if RAG_ENABLED else None
+
+@st.cache_resource
+def get_knowledge_base():
+    """Indeks bahan kursus dikongsi (bina dengan: python knowledge_base.py build), atau None jika KB_ENABLED=0."""
+    return KnowledgeBase() if KB_ENABLED else None
+
+@st.cache_resource
+def get_model_residency():
+    """Memanaskan model lalai sekali bagi setiap proses dan memuatkannya semula jika dipunggah oleh Ollama."""
+    return ModelResidencyManager(configured_models(DEFAULT_OLLAMA_MODEL), scheduler=get_request_scheduler()).start()
+
 @st.cache_data(ttl=300)
 def get_ollama_models_cached():
     """Mendapatkan senarai model yang tersedia dari Ollama dan mengcache hasilnya."""
     try:
-        response = requests.get(f'{OLLAMA_BASE_URL}/api/tags', timeout=10)
-        response.raise_for_status()
-        models_data = response.json().get('models', [])
-        if not models_data:
-            return []
-        return sorted([model['name'] for model in models_data])
+        return ollama_client.list_models(timeout=10)
     except requests.exceptions.Timeout:
         st.error(f"Gagal mendapatkan senarai model: Permintaan ke Ollama tamat masa.")
         return []
@@ -52,401 +79,290 @@ def get_ollama_models_cached():
         st.error("Format respons senarai model tidak dijangka dari Ollama.")
         return []
 
-# Namakan semula fungsi asal
-def query_ollama_non_stream(prompt, chat_history, selected_model):
-    """Menghantar pertanyaan ke Ollama dan mengembalikan respons serta masa penjanaan (NON-STREAM)."""
-    messages_for_api = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history]
-    if not messages_for_api or messages_for_api[-1]["content"] != prompt or messages_for_api[-1]["role"] != "user":
-         messages_for_api.append({"role": "user", "content": prompt})
-
+# Fungsi untuk strim
+def query_ollama(prompt, chat_history, selected_model, response_placeholder, thinking_placeholder=None):
+    """Menghantar pertanyaan ke Ollama dan stream respons ke placeholder Streamlit secara berkala.
+    Mengembalikan (jawapan, proses_pemikiran, masa_penjanaan, statistik)."""
+    history_for_api = [{key: msg[key] for key in ("role", "content", "images") if key in msg} for msg in chat_history]
+    if not history_for_api or history_for_api[-1]["role"] != "user" or history_for_api[-1]["content"] != prompt:
+        history_for_api.append({"role": "user", "content": prompt})
+    # Petikan dokumen yang dimuat naik disertakan pada soalan semasa sahaja, bukan dalam sejarah
+    retrieved = retrieve_document_context(chat_history, prompt)
+    history_for_api = augment_messages(history_for_api, retrieved)
+    # Hanya giliran terkini yang muat dalam bajet token dihantar; giliran lama diringkaskan
+    context = get_context_manager().build(history_for_api, selected_model, images=supports_vision(selected_model))
+    messages_for_api = context.messages
+
+    splitter = ollama_client.ThinkTagSplitter()
     start_time = time.time()
-    try:
-        payload = {'model': selected_model, 'messages': messages_for_api, 'stream': False} # STREAM FALSE
-        # Anda mungkin mahu menggunakan OLLAMA_REQUEST_TIMEOUT di sini juga jika anda melaksanakannya
-        response = requests.post(f'{OLLAMA_BASE_URL}/api/chat', json=payload, timeout=600) # Timeout asal
-        response.raise_for_status()
-        
-        end_time = time.time()
-        processing_time = end_time - start_time
-        full_response_data = response.json()
-        assistant_reply = full_response_data.get('message', {}).get('content', "Maaf, saya tidak dapat respons yang betul.")
-        return assistant_reply, processing_time
+    first_token_time = None
+    last_render_time = 0.0
+    chunk_count = 0
+    final_chunk = {}
 
-    except requests.exceptions.Timeout:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Gagal mendapatkan respons: Permintaan ke Ollama tamat masa selepas {processing_time:.2f}s.")
-        return "Maaf, permintaan tamat masa.", processing_time
-    except requests.exceptions.RequestException as e:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Masalah menyambung ke Ollama: {e} (selepas {processing_time:.2f}s)")
-        return "Maaf, berlaku masalah semasa menghubungi Ollama.", processing_time
-    except KeyError:
-        end_time = time.time(); processing_time = end_time - start_time
-        st.error(f"Format respons tidak dijangka dari Ollama (selepas {processing_time:.2f}s).")
-        return "Maaf, format respons dari Ollama tidak seperti yang dijangkakan.", processing_time
-
-# Fungsi baru untuk strim
-def query_ollama(prompt, chat_history, selected_model, response_placeholder): # Tambah response_placeholder
-    """Menghantar pertanyaan ke Ollama dan stream respons ke placeholder Streamlit."""
-    messages_for_api = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history]
-    # Jika prompt bukan sebahagian daripada mesej terakhir dalam chat_history, tambahkannya
-    # Ini penting kerana chat_history yang dihantar mungkin sudah termasuk prompt pengguna terkini
-    # Kita hanya mahu memastikan ia ada untuk API.
-    # Untuk strim, prompt pengguna sudah ada dalam chat_history yang dihantar dari main().
+    def render(final=False):
+        cursor = "" if final else "▌"
+        if thinking_placeholder is not None and splitter.thinking:
+            thinking_placeholder.caption("💭 " + splitter.thinking + ("" if final or splitter.answer else cursor))
+        response_placeholder.markdown(splitter.answer + cursor if (splitter.answer or not final) else "*(Tiada respons kandungan)*")
 
-    start_time = time.time()
-    full_response_content = ""
     try:
-        payload = {'model': selected_model, 'messages': messages_for_api, 'stream': True}
-        # Anda mungkin mahu menggunakan OLLAMA_REQUEST_TIMEOUT di sini juga jika anda melaksanakannya
-        with requests.post(f'{OLLAMA_BASE_URL}/api/chat', json=payload, stream=True, timeout=600) as response: # Timeout asal
-            response.raise_for_status()
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    try:
-                        chunk = json.loads(decoded_line)
-                        # Semak jika 'message' wujud dan ia adalah kamus
-                        if 'message' in chunk and isinstance(chunk['message'], dict):
-                            content_piece = chunk['message'].get('content', '')
-                            if content_piece:
-                                full_response_content += content_piece
-                                response_placeholder.markdown(full_response_content + "▌")
-                        
-                        if chunk.get("done"): # Semak status 'done'
-                            # Kadang-kadang mesej terakhir ada dalam chunk 'done' itu sendiri
-                            # atau ia menandakan akhir strim
-                            final_message_in_done_chunk = chunk.get('message', {}).get('content', '')
-                            if final_message_in_done_chunk and not full_response_content.endswith(final_message_in_done_chunk):
-                                full_response_content += final_message_in_done_chunk
-                            break # Keluar dari gelung iter_lines apabila 'done' adalah True
-                    except json.JSONDecodeError:
-                        # Abaikan baris yang tidak dapat diproses sebagai JSON, mungkin baris kosong atau metadata lain
-                        # st.warning(f"Gagal memproses baris strim: {decoded_line}")
-                        pass
-        
+        for chunk in ollama_client.stream_chat(messages_for_api, selected_model):
+            if splitter.feed_chunk(chunk):
+                if first_token_time is None:
+                    first_token_time = time.time()
+                chunk_count += 1
+                now = time.time()
+                if now - last_render_time >= STREAM_UPDATE_INTERVAL:
+                    render()
+                    last_render_time = now
+            if chunk.get("done"):
+                final_chunk = chunk
+        splitter.finish()
         end_time = time.time()
-        processing_time = end_time - start_time
-        response_placeholder.markdown(full_response_content) # Papar respons akhir tanpa kursor
-        return full_response_content, processing_time
-
+        render(final=True)
+        if not final_chunk.get("done"):
+            # Sambungan ditutup sebelum chunk 'done': jawapan separuh dipaparkan tetapi tiada statistik (tidak dicache)
+            st.warning("Respons dari Ollama terputus sebelum selesai.")
+            return splitter.answer, splitter.thinking, end_time - start_time, None
+        stats = ollama_client.compute_stream_stats(start_time, first_token_time, end_time, chunk_count, final_chunk)
+        stats["context"] = context.as_dict() # Direkodkan bersama jawapan: giliran yang digugurkan/diringkaskan
+        if retrieved:
+            stats["documents"] = [{"document": r["document"], "chunk": r["chunk"], "score": r["score"]} for r in retrieved]
+        return splitter.answer, splitter.thinking, end_time - start_time, stats
+    except ollama_client.OllamaStreamError as e:
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ollama melaporkan ralat semasa menjana jawapan: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, Ollama gagal menjana jawapan.", "", processing_time, None
+    except requests.exceptions.HTTPError as http_err:
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ralat HTTP dari Ollama: {http_err} (selepas {processing_time:.2f}s)")
+        return f"Maaf, berlaku ralat HTTP semasa menghubungi Ollama ({http_err.response.status_code}).", "", processing_time, None
     except requests.exceptions.Timeout:
-        end_time = time.time(); processing_time = end_time - start_time
-        error_message = f"Gagal mendapatkan respons: Permintaan ke Ollama tamat masa selepas {processing_time:.2f}s."
-        response_placeholder.error(error_message)
-        return "Maaf, permintaan tamat masa.", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Gagal mendapatkan respons: Permintaan ke Ollama tamat masa selepas {processing_time:.2f}s.")
+        return "Maaf, permintaan tamat masa.", "", processing_time, None
     except requests.exceptions.RequestException as e:
-        end_time = time.time(); processing_time = end_time - start_time
-        error_message = f"Masalah menyambung ke Ollama: {e} (selepas {processing_time:.2f}s)"
-        response_placeholder.error(error_message)
-        return "Maaf, berlaku masalah semasa menghubungi Ollama.", processing_time
-    except Exception as e: # Tangkap ralat lain yang mungkin berlaku
-        end_time = time.time(); processing_time = end_time - start_time
-        error_message = f"Ralat tidak dijangka semasa strim: {e} (selepas {processing_time:.2f}s)"
-        response_placeholder.error(error_message)
-        return "Maaf, ralat tidak dijangka berlaku.", processing_time
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Masalah menyambung ke Ollama: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, berlaku masalah semasa menghubungi Ollama.", "", processing_time, None
+    except Exception as e:
+        processing_time = time.time() - start_time
+        response_placeholder.error(f"Ralat tidak dijangka semasa strim: {e} (selepas {processing_time:.2f}s)")
+        return "Maaf, ralat tidak dijangka berlaku.", "", processing_time, None
+
+@st.cache_resource
+def get_chat_session_store():
+    """Storan sesi dikongsi (SQLite, JSONL atau JSON, lihat SESSION_STORE dalam session_store.py)."""
+    return get_session_store(HISTORY_DIR)
 
+# Aplikasi ini tiada log masuk; sesi disimpan dengan username=None
 def save_chat_session(session_id, history):
-    filepath = os.path.join(HISTORY_DIR, f"{session_id}.json")
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
-    except IOError as e:
+        get_chat_session_store().save_session(None, session_id, history)
+    except SessionStoreError as e:
         st.error(f"Gagal menyimpan sesi Perbualan '{session_id}': {e}")
 
-def load_chat_session(session_id):
-    filepath = os.path.join(HISTORY_DIR, f"{session_id}.json")
+def load_chat_session(session_id, tail=None):
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except (json.JSONDecodeError, IOError) as e:
+        return get_chat_session_store().load_session(None, session_id, tail=tail)
+    except SessionStoreError as e:
         st.error(f"Gagal memuatkan atau membaca sesi Perbualan '{session_id}': {e}")
         return []
 
 def load_all_session_ids():
     try:
-        files = [f.replace(".json", "") for f in os.listdir(HISTORY_DIR) if f.endswith(".json")]
-        def sort_key(filename):
-            try:
-                parts = filename.split('_')
-                if len(parts) >= 2:
-                    return datetime.strptime(f"{parts[0]}_{parts[1]}", "%Y%m%d_%H%M%S")
-            except (ValueError, IndexError): pass
-            return datetime.min # Fallback untuk nama fail yang tidak mengikut format tarikh
-        return sorted(files, key=sort_key, reverse=True)
-    except OSError as e:
-        st.error(f"Gagal membaca direktori sesi: {e}")
+        return get_chat_session_store().list_sessions(None)
+    except SessionStoreError as e:
+        st.error(f"Gagal membaca senarai sesi: {e}")
         return []
 
 def delete_chat_session_file(session_id):
-    filepath = os.path.join(HISTORY_DIR, f"{session_id}.json")
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        if get_document_index() is not None:
+            get_document_index().delete_session(None, session_id)
+        if get_chat_session_store().delete_session(None, session_id):
             st.success(f"Sesi Perbualan '{session_id}' berjaya dipadam.")
             return True
         else:
-            st.warning(f"Fail sesi Perbualan '{session_id}' tidak ditemui untuk dipadam.")
+            st.warning(f"Sesi Perbualan '{session_id}' tidak ditemui untuk dipadam.")
             return False
-    except OSError as e:
+    except SessionStoreError as e:
         st.error(f"Gagal memadam sesi Perbualan '{session_id}': {e}")
         return False
 
 def delete_all_chat_sessions():
-    deleted_count = 0; errors = []
     try:
-        for filename in os.listdir(HISTORY_DIR):
-            if filename.endswith(".json"):
-                filepath = os.path.join(HISTORY_DIR, filename)
-                try: os.remove(filepath); deleted_count += 1
-                except OSError as e: errors.append(f"Gagal memadam {filename}: {e}")
-        if errors:
-            for error in errors: st.error(error)
+        if get_document_index() is not None:
+            get_document_index().delete_all_sessions(None)
+        deleted_count = get_chat_session_store().delete_all_sessions(None)
         if deleted_count > 0: st.success(f"{deleted_count} sesi Perbualan berjaya dipadam.")
         else: st.info("Tiada sesi Perbualan ditemui untuk dipadam.")
         return True
-    except OSError as e:
-        st.error(f"Gagal mengakses direktori sesi: {e}")
+    except SessionStoreError as e:
+        st.error(f"Gagal memadam sesi: {e}")
         return False
 
-# --- FUNGSI EKSTRAKSI TEKS DARI FAIL (dari chatbot2) ---
-def extract_text_from_file(uploaded_file_obj):
-    extracted_text = ""
-    filename = uploaded_file_obj.name
-    file_bytes = uploaded_file_obj.getvalue() # Dapatkan bytes terus
-    temp_docx_path = None # Inisialisasi di luar untuk rujukan dalam except utama jika perlu
-
-    try:
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            image = Image.open(uploaded_file_obj) # PIL boleh buka objek fail secara terus
-            extracted_text = pytesseract.image_to_string(image)
-            if not extracted_text.strip():
-                 st.info(f"Tiada teks dapat diekstrak dari imej '{filename}' menggunakan OCR.")
-        elif filename.lower().endswith(".txt"):
-            extracted_text = file_bytes.decode('utf-8', errors='ignore')
-        elif filename.lower().endswith(".docx"):
-            # Simpan sementara untuk dibaca oleh python-docx
-            temp_docx_path = os.path.join(UPLOAD_DIR, f"temp_{filename}") # Tetapkan temp_docx_path di sini
-            try:
-                with open(temp_docx_path, "wb") as f:
-                    f.write(file_bytes)
-                doc = Document(temp_docx_path)
-                extracted_text = "\n".join([para.text for para in doc.paragraphs])
-            except Exception as e_docx:
-                st.error(f"Ralat semasa memproses fail DOCX '{filename}': {e_docx}")
-                # Biarkan extracted_text sebagai string kosong atau set kepada None jika lebih sesuai
-                # extracted_text = None # Jika anda mahu return None secara eksplisit pada ralat DOCX
-            finally:
-                if temp_docx_path and os.path.exists(temp_docx_path): # Periksa jika temp_docx_path telah ditetapkan
-                    try:
-                        os.remove(temp_docx_path)
-                    except OSError as e_remove:
-                        st.warning(f"Gagal memadam fail sementara DOCX '{temp_docx_path}': {e_remove}")
-        elif filename.lower().endswith(".pdf"):
-            # PyMuPDF boleh buka bytes terus
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            for page in doc:
-                extracted_text += page.get_text()
-            doc.close()
-        else:
-            st.warning(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
-            return None # Return None jika jenis fail tidak disokong
-
-        # Hanya strip jika extracted_text adalah string
-        return extracted_text.strip() if isinstance(extracted_text, str) else None
-
-    except Exception as e:
-        st.error(f"Ralat umum semasa memproses fail '{filename}': {e}")
-        # Cuba padam fail sementara DOCX jika ia dicipta dan ralat berlaku di luar blok DOCX
-        if temp_docx_path and os.path.exists(temp_docx_path): # Periksa jika temp_docx_path telah ditetapkan
+# --- EKSTRAKSI FAIL (kolam proses latar belakang, lihat file_extraction.py) ---
+@st.cache_resource
+def get_extraction_jobs():
+    """Satu kolam pekerja OCR/PDF untuk semua sesi pelayar dalam proses Streamlit ini.
+    Teks yang diekstrak dicache di bawah UPLOAD_DIR, jadi fail yang sama tidak diproses semula."""
+    return ExtractionJobManager(cache=ExtractionCache(UPLOAD_DIR) if EXTRACTION_CACHE_ENABLED else None)
+
+def submit_uploaded_files(uploaded_files):
+    """Menghantar semua fail ke kolam ekstraksi tanpa menunggu; pekerja kolam memproses fail serentak
+    dan kemajuan dipaparkan pada rerun seterusnya. Jika model menyokong visi, imej dikecilkan dan disimpan
+    untuk dihantar terus kepada model (tanpa OCR). Mengembalikan False jika mana-mana fail ditolak (jenis atau saiz)."""
+    jobs = get_extraction_jobs()
+    accepted = True
+    for uploaded_file in uploaded_files:
+        if use_vision(st.session_state.selected_ollama_model, uploaded_file.name):
             try:
-                os.remove(temp_docx_path)
-            except OSError as e_remove_outer:
-                st.warning(f"Gagal memadam fail sementara DOCX (luar) '{temp_docx_path}': {e_remove_outer}")
-        return None
-
-# --- FUNGSI EKSPORT (Gabungan dengan logo/watermark dari chatbot2) ---
-def format_conversation_text(chat_history, include_user=True, include_assistant=True):
-    lines = []
-    for msg in chat_history:
-        if (msg["role"] == "user" and include_user) or \
-           (msg["role"] == "assistant" and include_assistant):
-            lines.append(f"{msg['role'].capitalize()}: {msg['content'].strip()}")
-    return "\n\n".join(lines)
-
-def save_to_word(text_content, filename='output.docx', logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT):
-    doc = Document()
-    if logo_path and os.path.exists(logo_path):
-        try:
-            paragraph = doc.add_paragraph()
-            run = paragraph.add_run()
-            run.add_picture(logo_path, width=DocxInches(2.0)) # Saiz logo boleh laras
-            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-            doc.add_paragraph() # Baris kosong selepas logo
-        except Exception as e:
-            st.warning(f"Gagal menambah logo pada Word: {e}. Pastikan fail imej sah.")
-
-    if watermark_text:
-        watermark_para = doc.add_paragraph()
-        run = watermark_para.add_run(watermark_text)
-        font = run.font
-        font.size = DocxPt(36) # Saiz tera air
-        font.color.rgb = DocxRGBColor(192, 192, 192)  # Kelabu cair
-        font.bold = True
-        watermark_para.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-        doc.add_paragraph()
-
-    for para_block in text_content.split("\n\n"):
-        doc.add_paragraph(para_block.strip())
-    try: doc.save(filename); return True
-    except IOError as e: st.error(f"Gagal menyimpan ke Word: {e}"); return False
-
-def save_to_pdf(text_content, filename='output.pdf', logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    # --- PERUBAHAN BERMULA DI SINI UNTUK SOKONGAN UNICODE ---
-    FONT_DIR = "fonts"  # Pastikan direktori ini wujud
-    # Nama fail fon. Anda boleh menamakannya apa sahaja, tetapi pastikan ia sepadan dengan fail sebenar.
-    FONT_REGULAR_FILENAME = "DejaVuSans.ttf"
-    FONT_REGULAR_PATH = os.path.join(FONT_DIR, FONT_REGULAR_FILENAME)
-
-    # Nama keluarga fon yang akan digunakan dalam FPDF
-    UNICODE_FONT_FAMILY = "DejaVuSans"
-    DEFAULT_FALLBACK_FONT = "Arial" # Fon lalai FPDF jika fon Unicode gagal dimuatkan
-
-    current_font_family_for_content = DEFAULT_FALLBACK_FONT
-    current_font_family_for_watermark = DEFAULT_FALLBACK_FONT
-    watermark_style = 'B' # Gaya Bold untuk watermark jika guna fon lalai
-
-    if os.path.exists(FONT_REGULAR_PATH):
+                image = encode_image(uploaded_file)
+            except (OSError, ValueError) as e:
+                st.warning(f"Imej '{uploaded_file.name}' tidak dapat dibaca: {e}")
+                accepted = False
+                continue
+            st.session_state.pending_images = st.session_state.get("pending_images", []) + [{"filename": uploaded_file.name, "image": image}]
+            continue
         try:
-            # Tambah fon Unicode. '' untuk gaya biasa. uni=True adalah penting.
-            pdf.add_font(UNICODE_FONT_FAMILY, '', FONT_REGULAR_PATH, uni=True)
-            current_font_family_for_content = UNICODE_FONT_FAMILY
-            current_font_family_for_watermark = UNICODE_FONT_FAMILY
-            watermark_style = '' # Fon Unicode mungkin sudah cukup tebal atau tidak memerlukan gaya 'B' eksplisit
-                                 # Jika anda mempunyai versi Bold (cth., DejaVuSans-Bold.ttf), anda boleh menambahkannya secara berasingan:
-                                 # pdf.add_font(UNICODE_FONT_FAMILY, 'B', "path/to/DejaVuSans-Bold.ttf", uni=True)
-                                 # dan kemudian gunakan watermark_style = 'B'
-            # st.sidebar.info(f"Berjaya memuatkan fon Unicode: {UNICODE_FONT_FAMILY}") # Mesej debug
-        except RuntimeError as e:
-            st.warning(f"Gagal memuatkan fon Unicode '{FONT_REGULAR_PATH}': {e}. Menggunakan fon lalai '{DEFAULT_FALLBACK_FONT}'.")
-            # current_font_family_for_content dan current_font_family_for_watermark kekal sebagai DEFAULT_FALLBACK_FONT
-    else:
-        st.warning(f"Fail fon Unicode '{FONT_REGULAR_PATH}' tidak ditemui. Menggunakan fon lalai '{DEFAULT_FALLBACK_FONT}'. Pastikan fail fon ada dalam direktori '{FONT_DIR}'.")
-        # current_font_family_for_content dan current_font_family_for_watermark kekal sebagai DEFAULT_FALLBACK_FONT
-    # --- PERUBAHAN TAMAT DI SINI ---
-
-    if logo_path and os.path.exists(logo_path):
-        try:
-            img_width = 30 # mm
-            page_width = pdf.w - 2 * pdf.l_margin
-            x_logo = (page_width - img_width) / 2 + pdf.l_margin
-            pdf.image(logo_path, x=x_logo, y=10, w=img_width)
-            pdf.ln(25) # Ruang selepas logo
-        except Exception as e:
-            st.warning(f"Gagal menambah logo pada PDF: {e}. Pastikan fail imej sah dan format disokong oleh FPDF (PNG, JPG, GIF).")
-
-    # Simpan kedudukan Y semasa sebelum tera air, jika ada logo
-    y_before_watermark = pdf.get_y()
-
-    if watermark_text:
-        # --- PERUBAHAN: Gunakan fon yang telah ditentukan untuk tera air ---
-        pdf.set_font(current_font_family_for_watermark, style=watermark_style, size=30)
-        # --- TAMAT PERUBAHAN ---
-        pdf.set_text_color(220, 220, 220) # Kelabu sangat cair
-        text_w = pdf.get_string_width(watermark_text) # Perlu set fon dahulu sebelum get_string_width
-
-        # Letakkan tera air di tengah halaman secara menegak dan mendatar
-        page_center_x = pdf.w / 2
-        page_center_y = pdf.h / 2
-        pdf.set_xy(page_center_x - (text_w / 2), page_center_y - 5) # -5 untuk sedikit penyesuaian ketinggian teks
-
-        pdf.cell(text_w, 10, watermark_text, 0, 0, 'C')
-        pdf.set_text_color(0, 0, 0) # Reset warna teks
-
-        # Reset kedudukan Y ke kedudukan sebelum tera air atau selepas logo
-        # Ini penting supaya kandungan utama tidak bertindih dengan tera air atau logo
-        pdf.set_xy(pdf.l_margin, y_before_watermark)
-        if not (logo_path and os.path.exists(logo_path)): # Jika tiada logo, tambah sedikit ruang
-            pdf.ln(5)
-
-
-    # --- PERUBAHAN: Gunakan fon Unicode untuk kandungan utama ---
-    pdf.set_font(current_font_family_for_content, size=12)
-    # --- TAMAT PERUBAHAN ---
-
-    for para_block in text_content.split("\n\n"):
-        # FPDF multi_cell menangani pemecahan baris secara automatik jika teks terlalu panjang
-        # Ia juga menghormati \n dalam string
-        pdf.multi_cell(0, 10, para_block.strip())
-        pdf.ln(5) # Ruang antara perenggan (blok)
-    try:
-        # Simpan ke fail tempatan. 'F' tidak diperlukan jika nama fail diberikan.
-        pdf.output(filename)
-        return True
-    except Exception as e:
-        st.error(f"Gagal menyimpan ke PDF: {e}")
-        return False
-
-def save_to_txt(text_content, filename='output.txt'):
+            job_id = jobs.submit(uploaded_file.name, uploaded_file, owner=st.session_state.client_id)
+        except ExtractionError as e:
+            st.warning(str(e))
+            accepted = False
+            continue
+        st.session_state.extraction_job_ids = st.session_state.get("extraction_job_ids", []) + [job_id]
+    return accepted
+
+def extraction_job_statuses(include_text=False):
+    jobs = get_extraction_jobs()
+    statuses = (jobs.status(job_id, owner=st.session_state.client_id, include_text=include_text)
+                for job_id in st.session_state.get("extraction_job_ids") or [])
+    return [job for job in statuses if job is not None]
+
+def poll_extraction_jobs():
+    """Status kerja ekstraksi sesi ini ([] jika tiada). Apabila semua kerja tamat, ia dikeluarkan dari sesi
+    dan dikembalikan bersama, supaya semua fail dari satu muat naik dijawab dalam satu giliran."""
+    statuses = extraction_job_statuses(include_text=True)
+    if not any(job["state"] in ACTIVE_STATES for job in statuses):
+        jobs = get_extraction_jobs()
+        for job_id in st.session_state.get("extraction_job_ids") or []:
+            jobs.forget(job_id, owner=st.session_state.client_id)
+        st.session_state.extraction_job_ids = []
+    return statuses
+
+def truncation_note(job):
+    truncation = job["truncation"]
+    if not truncation:
+        return ""
+    return (f"\n\n[Teks '{job['filename']}' dipotong: hanya {truncation['units_read']} daripada {truncation['units_total']} "
+            f"{truncation['unit']} pertama disertakan (had {truncation['max_chars']:,} aksara).]")
+
+def file_content_message_for(job):
+    """Mesej sembang bagi teks yang diekstrak, dengan nota jika teks dipotong mengikut bajet."""
+    return f"Kandungan dari fail '{job['filename']}':\n\n{job['text']}" + truncation_note(job)
+
+def upload_turn_message(extraction_jobs, images=()):
+    """Mengindeks teks setiap fail untuk RAG dan mengembalikan satu mesej pengguna yang pendek untuk sejarah.
+    Fail yang tidak dapat diindeks disertakan dengan teks penuh dalam mesej seperti sebelum ini;
+    imej untuk model visi dilampirkan dalam 'images'."""
+    index = get_document_index()
+    indexed, full_texts = [], []
+    for job in extraction_jobs:
+        document = None
+        if index is not None:
+            try:
+                document = index.add_document(None, st.session_state.session_id, job["filename"], job["text"])
+            except (requests.exceptions.RequestException, DocumentIndexError) as e:
+                st.warning(f"Gagal mengindeks '{job['filename']}' untuk carian ({e}); teks penuh disertakan dalam perbualan.")
+        if document is None:
+            full_texts.append(file_content_message_for(job))
+        else:
+            indexed.append((document, job))
+    parts = []
+    if indexed:
+        listing = ", ".join(f"'{document['filename']}' ({document['chunks']} bahagian diindeks untuk rujukan)" for document, _ in indexed)
+        parts.append(f"Saya telah memuat naik fail {listing}. Berikan ringkasan kandungannya."
+                     + "".join(truncation_note(job) for _, job in indexed))
+    if images:
+        listing = ", ".join(f"'{image['filename']}'" for image in images)
+        parts.append(f"Saya telah memuat naik imej {listing}. Terangkan kandungannya, termasuk rajah, graf, persamaan atau tulisan tangan.")
+    message = {"role": "user", "content": "\n\n".join(parts + full_texts), "timestamp": message_timestamp()}
+    if indexed:
+        message["documents"] = [document["filename"] for document, _ in indexed]
+    if images:
+        message["images"] = [image["image"] for image in images]
+        message["image_names"] = [image["filename"] for image in images]
+    return message
+
+def session_has_documents():
+    index = get_document_index()
+    session_id = st.session_state.get("session_id")
+    return index is not None and bool(session_id) and session_id != "new" and index.has_documents(None, session_id)
+
+def retrieve_document_context(chat_history, prompt):
+    """Petikan dokumen sesi ini dan bahan kursus (pangkalan pengetahuan) yang berkaitan dengan soalan semasa.
+    Giliran muat naik fail (mesej dengan kunci 'documents') hanya menggunakan bahagian awal dokumen itu."""
+    index = get_document_index()
+    knowledge_base = get_knowledge_base()
+    latest = chat_history[-1] if chat_history else {}
+    retrieved = []
     try:
-        with open(filename, "w", encoding="utf-8") as f: f.write(text_content)
-        return True
-    except IOError as e: st.error(f"Gagal menyimpan ke Teks: {e}"); return False
-
-def save_to_excel(chat_history, filename='chat_output.xlsx'):
-    # Eksport semua mesej (user dan assistant) seperti dalam chatbot1
-    data = [[msg["role"].capitalize(), msg["content"]] for msg in chat_history]
-    df = pd.DataFrame(data, columns=["Role", "Message"])
-    try: df.to_excel(filename, index=False, engine='openpyxl'); return True
-    except Exception as e: st.error(f"Gagal menyimpan ke Excel: {e}"); return False
-
-def save_to_pptx(chat_history, filename='chat_output.pptx', logo_path=LOGO_PATH):
-    prs = Presentation()
-    # Gunakan susun atur yang lebih fleksibel, contohnya 'Blank' atau 'Title and Content'
-    # slide_layout = prs.slide_layouts[5] # Title Only
-    slide_layout = prs.slide_layouts[6] # Blank, lebih fleksibel
-
-    for msg in chat_history:
-        slide = prs.slides.add_slide(slide_layout)
+        if session_has_documents():
+            if latest.get("documents") and latest.get("content") == prompt:
+                count = max(1, index.top_k // len(latest["documents"]))
+                return [chunk for filename in latest["documents"]
+                        for chunk in index.first_chunks(None, st.session_state.session_id, filename, count)]
+            retrieved = index.search(None, st.session_state.session_id, prompt)
+        if knowledge_base is not None:
+            retrieved += knowledge_base.search(prompt)
+    except (requests.exceptions.RequestException, DocumentIndexError) as e:
+        st.warning(f"Carian dokumen gagal: {e}")
+    return retrieved
+
+def render_extraction_progress(placeholder, extraction_jobs):
+    with placeholder.container():
+        for job in extraction_jobs:
+            if job["state"] not in ACTIVE_STATES:
+                fraction, text = 1.0, f"'{job['filename']}' selesai."
+            elif job["pages_total"]:
+                fraction = job["pages_done"] / job["pages_total"]
+                text = f"Memproses '{job['filename']}': halaman {job['pages_done']}/{job['pages_total']}"
+            else:
+                fraction = 0.0
+                text = f"'{job['filename']}' dalam giliran..." if job["state"] == JOB_QUEUED else f"Memproses '{job['filename']}'..."
+            st.progress(min(fraction, 1.0), text=text)
+
+def wait_for_extraction_jobs(progress_placeholder):
+    """Dipanggil di hujung skrip: mengemas kini bar kemajuan sehingga semua kerja tamat, kemudian rerun.
+    Halaman kekal responsif kerana sebarang interaksi pengguna memulakan rerun baru."""
+    if not st.session_state.get("extraction_job_ids") or progress_placeholder is None:
+        return
+    while True:
+        statuses = extraction_job_statuses()
+        if not any(job["state"] in ACTIVE_STATES for job in statuses):
+            break
+        render_extraction_progress(progress_placeholder, statuses)
+        time.sleep(EXTRACTION_POLL_INTERVAL)
+    st.rerun()
 
-        if logo_path and os.path.exists(logo_path):
-            try:
-                # Logo di penjuru atas kiri
-                pic = slide.shapes.add_picture(logo_path, PptxInches(0.2), PptxInches(0.2), height=PptxInches(0.75))
-            except Exception as e:
-                 st.warning(f"Gagal menambah logo pada PowerPoint: {e}. Pastikan fail imej sah.")
-
-        # Kotak teks untuk peranan dan kandungan
-        # Laraskan kedudukan dan saiz berdasarkan kehadiran logo
-        left = PptxInches(0.5)
-        top = PptxInches(1.0) if logo_path and os.path.exists(logo_path) else PptxInches(0.5)
-        width = PptxInches(9.0)
-        height = PptxInches(5.5)
-
-        textbox = slide.shapes.add_textbox(left, top, width, height)
-        tf = textbox.text_frame
-        tf.word_wrap = True
-
-        p_role = tf.add_paragraph()
-        p_role.text = f"{msg['role'].capitalize()}:"
-        p_role.font.bold = True
-        p_role.font.size = PptxPt(18)
-        p_role.font.name = 'Arial'
-
-        p_content = tf.add_paragraph()
-        p_content.text = msg['content']
-        p_content.font.size = PptxPt(16)
-        p_content.font.name = 'Arial'
-        p_content.level = 1 # Inden sedikit untuk kandungan
-
-    try: prs.save(filename); return True
-    except IOError as e: st.error(f"Gagal menyimpan ke PowerPoint: {e}"); return False
+# --- FUNGSI EKSPORT (Gabungan dengan logo/watermark dari chatbot2) ---
+def cached_export(format_label, include_user, include_assistant):
+    """Bait fail eksport dalam memori. Eksport terakhir disimpan mengikut (sesi, format, penapis, cincangan
+    sejarah) supaya klik berulang tidak menjana semula fail yang sama."""
+    cache_key = (st.session_state.session_id, format_label, include_user, include_assistant,
+                 history_digest(st.session_state.chat_history))
+    cached = st.session_state.get("last_export")
+    if EXPORT_CACHE_ENABLED and cached is not None and cached[0] == cache_key:
+        return cached[1]
+    data = export_conversation(
+        format_label, st.session_state.chat_history, include_user, include_assistant,
+        include_thinking=False, logo_path=LOGO_PATH, watermark_text=WATERMARK_TEXT,
+    )
+    if EXPORT_CACHE_ENABLED:
+        st.session_state.last_export = (cache_key, data)
+    return data
 
 # --- PENGURUSAN STATE STREAMLIT ---
 def initialize_session_state(available_models_list):
@@ -474,6 +390,10 @@ def initialize_session_state(available_models_list):
         st.session_state.uploader_key_counter = 0
     # --- TAMAT LOGIK BARU ---
 
+    # Pengenal pelayar untuk giliran adil (aplikasi ini tiada log masuk)
+    if "client_id" not in st.session_state:
+        st.session_state.client_id = uuid.uuid4().hex
+
 
 # --- KOMPONEN UI ---
 def display_sidebar(available_models_list):
@@ -562,7 +482,7 @@ def display_sidebar(available_models_list):
     #     **Nota:**
     #     Pastikan servis Ollama anda berjalan.
     #     Model yang tersedia akan disenaraikan di atas.
-    #     URL Ollama: `{OLLAMA_BASE_URL}`
+    #     URL Ollama: `{ollama_client.OLLAMA_BASE_URL}`
     #     Logo: `{LOGO_PATH if os.path.exists(LOGO_PATH) else "Tidak ditemui"}`
     #     Tera Air: `{WATERMARK_TEXT}`
     #     """
@@ -629,9 +549,105 @@ def display_chat_messages_paginated():
 
     for msg in messages_to_display:
         with st.chat_message(msg["role"]):
+            if msg["role"] == "assistant" and msg.get("thinking_process"):
+                with st.expander("Tunjukkan Proses Pemikiran AI", expanded=False):
+                    st.markdown(msg["thinking_process"])
             st.markdown(msg["content"])
+            render_message_images(msg)
             if msg["role"] == "assistant" and "time_taken" in msg and msg["time_taken"] is not None:
-                st.caption(f"Dijana dalam {msg['time_taken']:.2f} saat")
+                st.caption(format_generation_caption(msg))
+
+def render_message_images(msg):
+    """Imej yang dihantar kepada model visi dipaparkan bersama mesej pengguna."""
+    for image, name in zip(msg.get("images", []), msg.get("image_names", [])):
+        st.image(base64.b64decode(image), caption=name, width=320)
+
+def format_generation_caption(msg):
+    caption = f"Dijana dalam {msg['time_taken']:.2f} saat"
+    if msg.get("time_to_first_token") is not None:
+        caption += f" · token pertama {msg['time_to_first_token']:.2f} saat"
+    if msg.get("tokens_per_second"):
+        caption += f" · {msg['tokens_per_second']:.1f} token/saat"
+    if msg.get("queue_wait"):
+        caption += f" · menunggu giliran {msg['queue_wait']:.1f} saat"
+    if msg.get("cached"):
+        caption += " · dari cache"
+    if msg.get("context", {}).get("dropped_messages"):
+        caption += f" · {msg['context']['dropped_messages']} mesej lama diringkaskan/digugurkan"
+    if msg.get("documents"):
+        caption += f" · {len(msg['documents'])} petikan dokumen"
+    return caption
+
+def message_timestamp():
+    # Disimpan bersama setiap mesej; dipaparkan dalam lajur Timestamp eksport Excel
+    return datetime.now().isoformat(timespec="seconds")
+
+def stream_assistant_reply(prompt):
+    """Memaparkan respons pembantu secara strim dan mengembalikan mesej untuk disimpan dalam sejarah."""
+    selected_model = st.session_state.selected_ollama_model
+    response_cache = get_response_cache()
+    if session_has_documents() or has_images(st.session_state.chat_history):
+        response_cache = None # Jawapan bergantung pada dokumen atau imej sesi ini; cache dikongsi tidak digunakan atau diisi
+    lookup_start = time.time()
+    cached_reply, question_embedding = None, None
+    cache_options = response_cache_options(get_knowledge_base()) # Generasi bahan kursus yang disertakan dalam prompt
+    if response_cache is not None:
+        cached_reply, question_embedding = response_cache.lookup(selected_model, st.session_state.chat_history, cache_options)
+    with st.chat_message("assistant"):
+        thinking_placeholder = st.empty()
+        response_placeholder = st.empty()
+
+        if cached_reply is not None:
+            # Soalan yang sama pernah dijawab; Ollama tidak dipanggil langsung
+            if cached_reply.get("thinking_process"):
+                thinking_placeholder.caption("💭 " + cached_reply["thinking_process"])
+            response_placeholder.markdown(cached_reply.get("content", ""))
+            assistant_message = dict(cached_reply, role="assistant", time_taken=time.time() - lookup_start, model=selected_model, timestamp=message_timestamp())
+            st.caption(format_generation_caption(assistant_message))
+            return assistant_message
+
+        def show_queue_position(ticket, estimated_wait):
+            response_placeholder.info(f"⏳ Dalam giliran (kedudukan {ticket.queue_position}, anggaran {estimated_wait:.0f}s)...")
+
+        ticket = None
+        try:
+            with get_request_scheduler().slot(selected_model, st.session_state.client_id, on_queued=show_queue_position) as ticket:
+                assistant_reply, thinking_text, gen_time, stream_stats = query_ollama(
+                    prompt,
+                    st.session_state.chat_history,
+                    selected_model,
+                    response_placeholder,
+                    thinking_placeholder
+                )
+        except QueueFullError as e:
+            response_placeholder.error(f"Pelayan sedang sibuk ({e.queue_depth} permintaan menunggu). Sila cuba lagi dalam {e.retry_after}s.")
+            assistant_reply, thinking_text, gen_time, stream_stats = "Maaf, pelayan sedang sibuk. Sila cuba sebentar lagi.", "", 0.0, None
+        except QueueTimeoutError as e:
+            response_placeholder.error(str(e))
+            assistant_reply, thinking_text, gen_time, stream_stats = "Maaf, permintaan tamat masa semasa menunggu giliran.", "", 0.0, None
+        assistant_message = {
+            "role": "assistant",
+            "content": assistant_reply,
+            "thinking_process": thinking_text,
+            "time_taken": gen_time,
+            "model": selected_model,
+            "timestamp": message_timestamp(),
+        }
+        if stream_stats:
+            assistant_message.update(stream_stats)
+            # Hanya respons yang berjaya (ada statistik strim) disimpan dalam cache
+            if response_cache is not None and assistant_reply:
+                response_cache.put(
+                    selected_model,
+                    st.session_state.chat_history,
+                    {"content": assistant_reply, "thinking_process": thinking_text},
+                    options=cache_options,
+                    embedding=question_embedding
+                )
+        if ticket is not None:
+            assistant_message.update(ticket.as_dict())
+        st.caption(format_generation_caption(assistant_message))
+    return assistant_message
 
 def display_export_options():
     st.divider()
@@ -648,10 +664,7 @@ def display_export_options():
             index=2, key="export_content_radio"
         )
     with col_export2:
-        export_format_choice = st.selectbox("Format eksport:", [
-            "Pilih format", "Word (.docx)", "Teks (.txt)", "PDF (.pdf)",
-            "Excel (.xlsx)", "PowerPoint (.pptx)"
-        ], key="export_format_select")
+        export_format_choice = st.selectbox("Format eksport:", ["Pilih format"] + list(EXPORT_FORMATS), key="export_format_select")
 
     custom_filename_prefix_ui = st.text_input(
         "Nama fail awalan (tanpa sambungan):",
@@ -665,61 +678,31 @@ def display_export_options():
         if export_format_choice == "Pilih format":
             st.warning("Sila pilih format eksport yang sah."); return
         
-        filename_base = st.session_state.current_filename_prefix
         include_user = "Pengguna" in export_content_choice or "Keseluruhan" in export_content_choice
         include_assistant = "Pembantu" in export_content_choice or "Keseluruhan" in export_content_choice
-        
-        text_for_common_formats = format_conversation_text(st.session_state.chat_history, include_user, include_assistant)
-        
-        # Tapis sejarah untuk Excel dan PowerPoint berdasarkan pilihan radio
-        history_for_excel_pptx = [
-            msg for msg in st.session_state.chat_history 
-            if (include_user and msg["role"] == "user") or \
-               (include_assistant and msg["role"] == "assistant")
-        ]
-        # Pastikan history_for_excel_pptx tidak kosong jika pengguna memilih untuk eksport hanya satu peranan
-        # dan peranan itu tiada dalam sejarah. Fungsi eksport mungkin gagal.
-        if not history_for_excel_pptx and (export_format_choice == "Excel (.xlsx)" or export_format_choice == "PowerPoint (.pptx)"):
+        # Fail dijana dalam memori dan terus dihantar ke butang muat turun; tiada fail ditulis ke direktori kerja
+        try:
+            data = cached_export(export_format_choice, include_user, include_assistant)
+        except Exception as e: # docx/pptx/openpyxl/fpdf2 membangkitkan pelbagai jenis ralat
+            st.error(f"Gagal mengeksport ke {export_format_choice}: {e}")
+            return
+        if not data:
             st.warning(f"Tiada mesej '{export_content_choice.lower().replace(' keseluruhan perbualan', '')}' ditemui untuk dieksport ke {export_format_choice}.")
             return
 
-        success, exported_filename = False, ""
-        
-        # Fungsi save_to_word dan save_to_pdf menggunakan LOGO_PATH dan WATERMARK_TEXT secara lalai dari pembolehubah global.
-        # Fungsi save_to_pptx menggunakan LOGO_PATH secara lalai.
-        actions = {
-            "Word (.docx)": (save_to_word, text_for_common_formats, f"{filename_base}.docx"),
-            "Teks (.txt)": (save_to_txt, text_for_common_formats, f"{filename_base}.txt"),
-            "PDF (.pdf)": (save_to_pdf, text_for_common_formats, f"{filename_base}.pdf"),
-            "Excel (.xlsx)": (save_to_excel, history_for_excel_pptx, f"{filename_base}.xlsx"),
-            "PowerPoint (.pptx)": (save_to_pptx, history_for_excel_pptx, f"{filename_base}.pptx")
-        }
-
-        if export_format_choice in actions:
-            func, data_to_export, fname = actions[export_format_choice]
-            # Semak jika data untuk dieksport kosong (terutamanya untuk Excel/PPTX selepas penapisan)
-            if not data_to_export: # Jika data_to_export adalah senarai kosong atau string kosong
-                 st.warning(f"Tiada kandungan untuk dieksport ke {export_format_choice} berdasarkan pilihan anda.")
-                 return
-
-            success = func(data_to_export, fname)
-            exported_filename = fname
-        
-        if success and exported_filename:
-            st.success(f"Fail disimpan: {exported_filename}")
-            try:
-                with open(exported_filename, "rb") as f_download:
-                    st.download_button(
-                        "📥 Muat Turun Fail", data=f_download, file_name=exported_filename, 
-                        key=f"download_btn_{exported_filename.replace('.', '_')}_{time.time()}"
-                    )
-            except FileNotFoundError: st.error(f"Gagal mencari fail {exported_filename} untuk dimuat turun.")
-            except Exception as e: st.error(f"Ralat semasa menyediakan muat turun: {e}")
+        extension, mime, _ = EXPORT_FORMATS[export_format_choice]
+        exported_filename = f"{st.session_state.current_filename_prefix}.{extension}"
+        st.success(f"Fail sedia untuk dimuat turun: {exported_filename}")
+        st.download_button(
+            "📥 Muat Turun Fail", data=data, file_name=exported_filename, mime=mime,
+            key=f"download_btn_{extension}"
+        )
 
 # --- FUNGSI UTAMA APLIKASI ---
 def main():
     st.set_page_config(page_title="DFK Stembot", layout="wide", initial_sidebar_state="expanded", page_icon="🤖")
     st.title("🤖 DFK Stembot")
+    get_model_residency() # Pemanasan berjalan di latar belakang; tidak menyekat halaman
 
     available_ollama_models = get_ollama_models_cached()
     if not available_ollama_models:
@@ -737,54 +720,61 @@ def main():
     st.sidebar.header("📎 Muat Naik Fail")
     
     uploader_key = f"file_uploader_{st.session_state.uploader_key_counter}"
-    uploaded_file = st.sidebar.file_uploader(
-        "Muat naik imej, PDF, DOCX, atau TXT untuk diproses:", 
-        type=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'txt', 'docx'],
+    uploaded_files = st.sidebar.file_uploader(
+        "Muat naik imej, PDF, DOCX, PPTX, XLSX atau TXT untuk diproses (boleh pilih beberapa fail):", 
+        type=['png', 'jpg', 'jpeg', 'gif', 'pdf', 'txt', 'docx', 'pptx', 'xlsx'],
+        accept_multiple_files=True,
         key=uploader_key
     )
 
-    if uploaded_file is not None:
-        with st.spinner(f"Memproses fail '{uploaded_file.name}'..."):
-            extracted_text = extract_text_from_file(uploaded_file)
-        
-        if extracted_text:
-            st.info(f"Teks diekstrak dari '{uploaded_file.name}'. Anda boleh bertanya mengenainya atau ia akan disertakan dalam konteks seterusnya.")
-            file_content_message = f"Kandungan dari fail '{uploaded_file.name}':\n\n{extracted_text}"
-            
-            st.session_state.chat_history.append({"role": "user", "content": file_content_message})
-            
-            with st.spinner(f"{st.session_state.selected_ollama_model.split(':')[0].capitalize()} sedang memproses kandungan fail..."):
-                assistant_response, gen_time = query_ollama_non_stream(
-                    file_content_message,
-                    st.session_state.chat_history, 
-                    st.session_state.selected_ollama_model
-                )
-
-            st.session_state.chat_history.append({
-                "role": "assistant", 
-                "content": assistant_response,
-                "time_taken": gen_time
-            })
-            
+    if uploaded_files:
+        # Ekstraksi berjalan di latar belakang, serentak bagi beberapa fail; pemuat naik dikosongkan dan kemajuan dipaparkan selepas rerun
+        st.session_state.uploader_key_counter += 1
+        if submit_uploaded_files(uploaded_files):
+            st.rerun()
+
+    extraction_progress = None
+    extraction_jobs = poll_extraction_jobs()
+    if any(job["state"] in ACTIVE_STATES for job in extraction_jobs):
+        extraction_progress = st.sidebar.empty()
+        render_extraction_progress(extraction_progress, extraction_jobs)
+        if st.sidebar.button("Batal Ekstraksi", key=f"cancel_extraction_{extraction_jobs[0]['job_id']}"):
+            for job in extraction_jobs:
+                if job["state"] in ACTIVE_STATES:
+                    get_extraction_jobs().cancel(job["job_id"], owner=st.session_state.client_id)
+    elif extraction_jobs or st.session_state.get("pending_images"):
+        for job in extraction_jobs:
+            if job["state"] == JOB_DONE and not job["text"]:
+                st.warning(f"Tiada teks dapat diekstrak dari fail '{job['filename']}'.")
+            elif job["state"] == JOB_CANCELLED:
+                st.info(f"Ekstraksi fail '{job['filename']}' dibatalkan.")
+            elif job["state"] != JOB_DONE:
+                st.error(job["error"])
+        extracted = [job for job in extraction_jobs if job["state"] == JOB_DONE and job["text"]]
+        images = st.session_state.pop("pending_images", [])
+        if extracted or images:
+            if extracted:
+                extracted_filenames = ", ".join(f"'{job['filename']}'" for job in extracted)
+                st.info(f"Teks diekstrak dari {extracted_filenames}. Anda boleh bertanya mengenainya atau ia akan disertakan dalam konteks seterusnya.")
             # --- LOGIK PENYIMPANAN DIPERBAIKI ---
             if st.session_state.session_id == "new":
-                # Ini adalah mesej pertama dalam sesi baru.
-                # Gunakan current_filename_prefix (yang sepatutnya cap masa) sebagai ID sesi baru.
+                # Ini adalah mesej pertama dalam sesi baru. ID ditetapkan sebelum mengindeks
+                # kerana indeks dokumen disimpan mengikut sesi.
                 st.session_state.session_id = st.session_state.current_filename_prefix
-                # Selepas ini, session_id tidak lagi "new" untuk interaksi seterusnya dalam sesi ini.
+
+            file_message = upload_turn_message(extracted, images) # Teks penuh ke indeks; sejarah hanya menyimpan mesej pendek
+            file_content_message = file_message["content"]
+            st.session_state.chat_history.append(file_message)
+            
+            with st.chat_message("user"):
+                st.markdown(file_content_message)
+                render_message_images(file_message)
+            st.session_state.chat_history.append(stream_assistant_reply(file_content_message))
             
             # Simpan sesi (sama ada sesi baru yang IDnya baru ditetapkan, atau sesi sedia ada yang dikemas kini)
             save_chat_session(st.session_state.session_id, st.session_state.chat_history)
             # --- TAMAT LOGIK PENYIMPANAN DIPERBAIKI ---
-        
-        elif extracted_text is None: 
-            # Mesej ralat/amaran sudah dipaparkan oleh extract_text_from_file
-            pass
-        else: # extracted_text adalah string kosong
-            st.warning(f"Tiada teks dapat diekstrak dari fail '{uploaded_file.name}'.")
-
-        st.session_state.uploader_key_counter += 1
-        st.rerun() # Rerun diperlukan untuk memaparkan mesej baru dan mengosongkan pemuat naik fail
+            st.rerun() # Rerun diperlukan untuk memaparkan mesej baru
 
     display_chat_messages_paginated()
 
@@ -792,20 +782,11 @@ def main():
     user_input = st.chat_input(f"Taip mesej anda kepada {friendly_model_name}...")
 
     if user_input:
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        
-        with st.spinner(f"{friendly_model_name} sedang menaip..."): 
-            assistant_response_text, generation_time = query_ollama_non_stream(
-                user_input, 
-                st.session_state.chat_history, 
-                st.session_state.selected_ollama_model
-            )
+        st.session_state.chat_history.append({"role": "user", "content": user_input, "timestamp": message_timestamp()})
         
-        st.session_state.chat_history.append({
-            "role": "assistant", 
-            "content": assistant_response_text,
-            "time_taken": generation_time
-        })
+        with st.chat_message("user"):
+            st.markdown(user_input)
+        st.session_state.chat_history.append(stream_assistant_reply(user_input))
 
         # --- LOGIK PENYIMPANAN DIPERBAIKI ---
         if st.session_state.session_id == "new":
@@ -825,6 +806,7 @@ def main():
         st.rerun() # Rerun diperlukan untuk memaparkan mesej baru
 
     display_export_options()
+    wait_for_extraction_jobs(extraction_progress) # Mesti terakhir: menunggu sehingga kerja ekstraksi tamat
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""Pembina tetingkap konteks: mengehadkan sejarah yang dihantar ke /api/chat mengikut bajet token.
+
+Giliran terkini disimpan selagi muat dalam bajet. Giliran lama digantikan dengan ringkasan
+bergulir yang dijana di latar belakang dan dicache, jadi membina konteks tidak pernah menunggu
+model meringkaskan; giliran yang belum diringkaskan hanya digugurkan untuk giliran itu.
+Maklumat giliran yang digugurkan dikembalikan supaya boleh direkodkan bersama jawapan.
+Tetingkap hanya beralih pada titik tetap (CONTEXT_WINDOW_STEP) supaya awalan mesej kekal
+sama merentas giliran dan cache prompt Ollama boleh diguna semula.
+"""
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama_client
+
+# --- KONFIGURASI ---
+CONTEXT_NUM_CTX = int(os.getenv("CONTEXT_NUM_CTX", str(ollama_client.OLLAMA_NUM_CTX or 4096))) # Mesti sepadan dengan num_ctx model
+CONTEXT_RESPONSE_RESERVE = int(os.getenv("CONTEXT_RESPONSE_RESERVE", "1024")) # Token dikhaskan untuk jawapan
+CONTEXT_SYSTEM_RESERVE = int(os.getenv("CONTEXT_SYSTEM_RESERVE", "512")) # Token untuk SYSTEM dalam Modelfile
+CONTEXT_MAX_MESSAGE_TOKENS = int(os.getenv("CONTEXT_MAX_MESSAGE_TOKENS", "1500")) # Had bagi satu mesej lama (cth. kandungan fail)
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5")) # Anggaran; tiada tokenizer tempatan
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "1") == "1"
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "") # Kosong = guna model perbualan (sudah dimuatkan)
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+CONTEXT_SUMMARY_CACHE_SIZE = 256
+CONTEXT_WINDOW_STEP = int(os.getenv("CONTEXT_WINDOW_STEP", "4")) # Giliran pengguna antara titik permulaan tetingkap
+CONTEXT_MIN_PRIOR_MESSAGES = int(os.getenv("CONTEXT_MIN_PRIOR_MESSAGES", "2")) # Mesej terdahulu minimum sebelum penjajaran diabaikan
+MESSAGE_OVERHEAD_TOKENS = 4 # Token templat sembang bagi setiap mesej
+CONTEXT_KEEP_ALL_IMAGES = os.getenv("CONTEXT_KEEP_ALL_IMAGES", "0") == "1" # 0 = imej hanya pada giliran terkini yang mempunyainya
+CONTEXT_IMAGE_TOKENS = int(os.getenv("CONTEXT_IMAGE_TOKENS", "300")) # Anggaran token bagi satu imej (Gemma 3: 256 + penanda)
+TRUNCATION_MARKER = "\n\n[... kandungan dipotong untuk memuatkan konteks ...]"
+
+SUMMARY_PROMPT = (
+    "Ringkaskan perbualan berikut antara pengguna dan STEMBot dalam Bahasa Melayu, dalam tidak lebih "
+    "daripada 150 patah perkataan. Kekalkan fakta, nombor, formula, nama fail dan soalan yang belum dijawab."
+)
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text or "") / CONTEXT_CHARS_PER_TOKEN)
+
+def message_tokens(message):
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS + CONTEXT_IMAGE_TOKENS * len(message.get("images") or ())
+
+def truncate_content(content, max_tokens):
+    """Memotong kandungan kepada lebih kurang max_tokens token (awal teks dikekalkan)."""
+    max_chars = int(max_tokens * CONTEXT_CHARS_PER_TOKEN) - len(TRUNCATION_MARKER)
+    if len(content) <= max_chars + len(TRUNCATION_MARKER):
+        return content, False
+    return content[:max(max_chars, 0)] + TRUNCATION_MARKER, True
+
+def prefix_digests(messages):
+    """Cincang berantai: digests[i] mewakili messages[:i + 1], jadi setiap awalan sejarah mempunyai kunci sendiri."""
+    digests = []
+    current = b""
+    for msg in messages:
+        h = hashlib.sha256(current)
+        h.update(msg.get("role", "").encode("utf-8") + b"\0" + msg.get("content", "").encode("utf-8"))
+        current = h.digest()
+        digests.append(current.hex())
+    return digests
+
+def summary_messages(summary):
+    # Ringkasan dihantar sebagai pasangan pengguna/pembantu, bukan mesej "system": Ollama hanya
+    # menambah SYSTEM dari Modelfile jika mesej pertama bukan "system".
+    return [
+        {"role": "user", "content": f"[Ringkasan perbualan terdahulu]\n{summary}"},
+        {"role": "assistant", "content": "Baik, saya akan mengambil kira ringkasan ini."},
+    ]
+
+
+class ContextWindow:
+    """Hasil build(): mesej untuk /api/chat dan rekod apa yang digugurkan atau dipotong."""
+    def __init__(self, messages, dropped, summarised, truncated, estimated_tokens):
+        self.messages = messages
+        self.dropped = dropped # Bilangan mesej terawal yang tidak dihantar secara penuh
+        self.summarised = summarised # Daripada mesej yang digugurkan, berapa yang diwakili oleh ringkasan
+        self.truncated = truncated # Indeks (dalam sejarah asal) mesej yang kandungannya dipotong
+        self.estimated_tokens = estimated_tokens
+
+    def as_dict(self):
+        return {
+            "dropped_messages": self.dropped,
+            "summarised_messages": self.summarised,
+            "truncated_messages": self.truncated,
+            "estimated_tokens": self.estimated_tokens,
+        }
+
+
+class ContextManager:
+    def __init__(self, token_budget=None, max_message_tokens=CONTEXT_MAX_MESSAGE_TOKENS,
+                 summarise=CONTEXT_SUMMARY_ENABLED, summary_model=CONTEXT_SUMMARY_MODEL, scheduler=None,
+                 window_step=CONTEXT_WINDOW_STEP, min_prior_messages=CONTEXT_MIN_PRIOR_MESSAGES,
+                 keep_all_images=CONTEXT_KEEP_ALL_IMAGES):
+        if token_budget is None:
+            token_budget = CONTEXT_NUM_CTX - CONTEXT_RESPONSE_RESERVE - CONTEXT_SYSTEM_RESERVE
+        self.token_budget = max(token_budget, 256)
+        self.max_message_tokens = max_message_tokens
+        self.window_step = max(1, window_step)
+        self.min_prior_messages = max(0, min_prior_messages)
+        self.keep_all_images = keep_all_images
+        self.summarise = summarise
+        self.summary_model = summary_model
+        self.scheduler = scheduler # Jika diberi, ringkasan latar belakang beratur seperti permintaan lain
+        self._summaries = OrderedDict() # cincang awalan -> teks ringkasan
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+
+    # --- Cache ringkasan ---
+    def _best_summary(self, digests):
+        """Ringkasan bagi awalan terpanjang yang sudah dicache. Mengembalikan (bilangan mesej, teks)."""
+        with self._lock:
+            for count in range(len(digests), 0, -1):
+                summary = self._summaries.get(digests[count - 1])
+                if summary is not None:
+                    self._summaries.move_to_end(digests[count - 1])
+                    return count, summary
+        return 0, None
+
+    def _store_summary(self, digest, summary):
+        with self._lock:
+            self._summaries[digest] = summary
+            self._summaries.move_to_end(digest)
+            while len(self._summaries) > CONTEXT_SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+
+    def _schedule_summary(self, dropped, digests, covered, previous_summary, model):
+        key = digests[-1]
+        with self._lock:
+            if key in self._pending or key in self._summaries:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._summarise_job, dropped[covered:], key, previous_summary, model)
+
+    def _summarise_job(self, new_messages, key, previous_summary, model):
+        try:
+            model = self.summary_model or model
+            if self.scheduler is not None:
+                with self.scheduler.slot(model, "__context_summary__"):
+                    summary = self._request_summary(new_messages, previous_summary, model)
+            else:
+                summary = self._request_summary(new_messages, previous_summary, model)
+            if summary:
+                self._store_summary(key, summary[:CONTEXT_SUMMARY_MAX_CHARS])
+        except Exception as e:
+            print(f"Gagal menjana ringkasan konteks: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _request_summary(self, new_messages, previous_summary, model):
+        # Ringkasan bergulir: ringkasan lama + giliran yang baru digugurkan -> ringkasan baru
+        parts = []
+        if previous_summary:
+            parts.append(f"Ringkasan sebelum ini:\n{previous_summary}")
+        for msg in new_messages:
+            content, _ = truncate_content(msg.get("content", ""), self.max_message_tokens)
+            speaker = "Pengguna" if msg.get("role") == "user" else "STEMBot"
+            parts.append(f"{speaker}: {content}")
+        request_messages = [{"role": "user", "content": SUMMARY_PROMPT + "\n\n" + "\n\n".join(parts)}]
+        data = ollama_client.chat(request_messages, model)
+        splitter = ollama_client.ThinkTagSplitter()
+        splitter.feed_chunk(data)
+        splitter.finish()
+        return splitter.answer
+
+    # --- Pembinaan konteks ---
+    def _window_start(self, history, start):
+        """Indeks permulaan tetingkap yang sah pada atau selepas 'start'.
+
+        Tetingkap sentiasa bermula pada mesej pengguna, dan hanya pada setiap window_step giliran
+        pengguna (dikira dari awal sesi). Jadi apabila sejarah bertambah, permulaan tetingkap dan
+        ringkasan di hadapannya kekal sama untuk beberapa giliran; awalan mesej yang dihantar
+        adalah identik bait demi bait dan Ollama boleh mengguna semula cache KV prompt.
+        Jika titik tetap itu meninggalkan kurang daripada min_prior_messages mesej terdahulu, tetingkap
+        bermula pada mesej pengguna pertama selepas 'start': konteks perbualan lebih penting daripada cache."""
+        last = len(history) - 1
+        user_turn = 0
+        first_user = None
+        for index, msg in enumerate(history[:-1]):
+            if msg["role"] != "user":
+                continue
+            if index >= start:
+                if first_user is None:
+                    first_user = index
+                if user_turn % self.window_step == 0:
+                    if last - index >= self.min_prior_messages:
+                        return index
+                    break
+            user_turn += 1
+        return first_user if first_user is not None else last
+
+    @staticmethod
+    def _advance(window, start, used, new_start):
+        while start < new_start:
+            used -= message_tokens(window.pop(0))
+            start += 1
+        return start, used
+
+    @staticmethod
+    def _api_message(msg, images):
+        message = {"role": msg["role"], "content": msg.get("content", "")}
+        if images and msg.get("images"):
+            message["images"] = list(msg["images"])
+        return message
+
+    def build(self, chat_history, model, images=False):
+        """Membina senarai mesej untuk /api/chat. Mesej terakhir (soalan semasa) sentiasa dihantar.
+        Imej ('images') hanya dikekalkan jika images=True, iaitu model menyokong visi, dan secara lalai
+        hanya pada mesej pengguna terkini yang mempunyainya: imej lama tidak dihantar dan dikod semula
+        oleh model pada setiap giliran."""
+        image_index = None
+        if images and not self.keep_all_images:
+            image_index = next((index for index in range(len(chat_history) - 1, -1, -1)
+                                if chat_history[index].get("role") == "user" and chat_history[index].get("images")), None)
+        history = [self._api_message(msg, images and (image_index is None or index == image_index))
+                   for index, msg in enumerate(chat_history)]
+        if not history:
+            return ContextWindow([], 0, 0, [], 0)
+        truncated = []
+
+        # Soalan semasa: dipotong hanya jika ia sendiri melebihi bajet
+        latest = history[-1]
+        content, was_truncated = truncate_content(latest["content"], self.token_budget - MESSAGE_OVERHEAD_TOKENS)
+        if was_truncated:
+            latest = dict(latest, content=content)
+            truncated.append(len(history) - 1)
+        window = [latest]
+        used = message_tokens(latest)
+
+        # Tetingkap gelongsor: tambah giliran dari yang terbaru selagi muat dalam bajet
+        start = len(history) - 1
+        for index in range(len(history) - 2, -1, -1):
+            msg = history[index]
+            content, was_truncated = truncate_content(msg["content"], self.max_message_tokens)
+            candidate = dict(msg, content=content) if was_truncated else msg
+            cost = message_tokens(candidate)
+            if used + cost > self.token_budget:
+                break
+            window.insert(0, candidate)
+            used += cost
+            start = index
+            if was_truncated:
+                truncated.append(index)
+        if start > 0:
+            start, used = self._advance(window, start, used, self._window_start(history, start))
+
+        summarised = 0
+        if start > 0 and self.summarise:
+            dropped = history[:start]
+            digests = prefix_digests(dropped)
+            covered, summary = self._best_summary(digests)
+            if summary is not None:
+                prefix = summary_messages(summary)
+                prefix_cost = sum(message_tokens(msg) for msg in prefix)
+                # Beri ruang untuk ringkasan dengan menggugurkan giliran tertua dari tetingkap
+                while window[:-1] and used + prefix_cost > self.token_budget:
+                    start, used = self._advance(window, start, used, self._window_start(history, start + 1))
+                if used + prefix_cost <= self.token_budget:
+                    window = prefix + window
+                    used += prefix_cost
+                    summarised = covered
+            if covered < start:
+                # Ringkasan untuk semua giliran yang digugurkan akan sedia untuk giliran seterusnya
+                dropped = history[:start]
+                digests = prefix_digests(dropped)
+                self._schedule_summary(dropped, digests, covered, summary, model)
+
+        truncated = sorted(index for index in truncated if index >= start)
+        return ContextWindow(window, start, summarised, truncated, used)
@@ -0,0 +1,291 @@
+"""Indeks vektor tempatan bagi dokumen yang dimuat naik (RAG).
+
+Teks yang diekstrak dipecahkan kepada bahagian bertindih, di-embed melalui /api/embed secara
+berkelompok dan disimpan sebagai matriks NumPy (vektor dinormalkan) bagi setiap pengguna/sesi.
+Untuk setiap soalan, hanya RAG_TOP_K bahagian yang paling serupa (persamaan kosinus) disertakan
+dalam prompt yang dihantar ke Ollama; dokumen penuh tidak lagi disimpan dalam sejarah sembang
+dan dihantar semula pada setiap giliran.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import ollama_client
+
+# --- KONFIGURASI ---
+RAG_ENABLED = os.getenv("RAG_ENABLED", "1") == "1"
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", "document_index")
+RAG_EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", ollama_client.OLLAMA_EMBED_MODEL)
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "1200")) # Saiz sasaran satu bahagian
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200")) # Aksara dari bahagian sebelum yang diulang
+RAG_EMBED_BATCH = int(os.getenv("RAG_EMBED_BATCH", "32")) # Bahagian bagi setiap panggilan /api/embed
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.2")) # Bahagian di bawah persamaan ini tidak disertakan
+RAG_CACHE_SIZE = 32 # Indeks sesi yang disimpan dalam memori
+RAG_QUERY_CACHE_SIZE = 256 # Embedding soalan terkini; indeks sesi dan pangkalan pengetahuan berkongsi satu panggilan
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_query_embeddings = OrderedDict() # (model, teks) -> vektor dinormalkan
+_query_lock = threading.Lock()
+
+
+class DocumentIndexError(Exception):
+    pass
+
+
+def _split_long(text, size):
+    """Memecah teks yang lebih panjang dari 'size' pada ruang kosong terdekat."""
+    pieces = []
+    while len(text) > size:
+        cut = text.rfind(" ", size // 2, size)
+        if cut <= 0:
+            cut = size
+        pieces.append(text[:cut].strip())
+        text = text[cut:]
+    if text.strip():
+        pieces.append(text.strip())
+    return pieces
+
+def chunk_text(text, size=RAG_CHUNK_CHARS, overlap=RAG_CHUNK_OVERLAP):
+    """Perenggan digabungkan sehingga 'size' aksara; setiap bahagian bermula dengan hujung
+    bahagian sebelumnya (overlap) supaya ayat di sempadan tidak hilang konteks."""
+    chunks = []
+    current = ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        for piece in _split_long(paragraph.strip(), size):
+            if current and len(current) + len(piece) + 2 > size:
+                chunks.append(current)
+                keep = min(overlap, size - len(piece) - 2) # Pertindihan tidak boleh melebihkan saiz bahagian
+                tail = current[-keep:] if keep > 0 else ""
+                space = tail.find(" ")
+                current = tail[space + 1:] if space >= 0 else tail
+            current = f"{current}\n\n{piece}" if current else piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def _normalise(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _cached_query(model, text):
+    with _query_lock:
+        vector = _query_embeddings.get((model, text))
+        if vector is not None:
+            _query_embeddings.move_to_end((model, text))
+        return vector
+
+def _store_query(model, text, embedding):
+    vector = _normalise(embedding)[0]
+    with _query_lock:
+        _query_embeddings[(model, text)] = vector
+        while len(_query_embeddings) > RAG_QUERY_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return vector
+
+def embed_query(text, model=RAG_EMBED_MODEL):
+    """Embedding soalan (dinormalkan), dicache supaya beberapa indeks boleh dicari dengan satu panggilan."""
+    vector = _cached_query(model, text)
+    if vector is None:
+        vector = _store_query(model, text, ollama_client.embed([text], model=model)[0])
+    return vector
+
+async def async_embed_query(text, model=RAG_EMBED_MODEL):
+    vector = _cached_query(model, text)
+    if vector is None:
+        vector = _store_query(model, text, (await ollama_client.async_embed([text], model=model))[0])
+    return vector
+
+def top_k_rows(matrix, query, k, min_score):
+    """Indeks dan skor baris 'matrix' (dinormalkan) yang paling serupa dengan 'query', menurun."""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return [(int(i), round(float(scores[i]), 4)) for i in best if scores[i] >= min_score]
+
+def format_context(results):
+    """Petikan yang diperoleh, dalam bentuk untuk disertakan sebelum soalan pengguna."""
+    lines = ["Petikan rujukan yang berkaitan (gunakan jika relevan):"]
+    for result in results:
+        lines.append(f"[{result['document']}, bahagian {result['chunk'] + 1}]\n{result['text']}")
+    return "\n\n".join(lines)
+
+def augment_messages(messages, results):
+    """Salinan 'messages' dengan petikan ditambah pada mesej terakhir (soalan semasa) sahaja."""
+    if not results or not messages:
+        return messages
+    latest = messages[-1]
+    content = f"{format_context(results)}\n\nSoalan: {latest['content']}"
+    return messages[:-1] + [dict(latest, content=content)]
+
+
+class _SessionIndex:
+    def __init__(self, documents, chunks, matrix):
+        self.documents = documents # [{"filename", "sha256", "chunks"}]
+        self.chunks = chunks # [{"document", "chunk", "text"}], sejajar dengan baris matrix
+        self.matrix = matrix
+
+
+class DocumentIndex:
+    def __init__(self, index_dir=RAG_INDEX_DIR, embed_model=RAG_EMBED_MODEL, top_k=RAG_TOP_K,
+                 min_score=RAG_MIN_SCORE, batch_size=RAG_EMBED_BATCH):
+        self.index_dir = index_dir
+        self.embed_model = embed_model
+        self.top_k = top_k
+        self.min_score = min_score
+        self.batch_size = max(1, batch_size)
+        self._indexes = OrderedDict() # direktori sesi -> _SessionIndex
+        self._lock = threading.Lock()
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _user_dir(self, username):
+        # Nama direktori dicincang: nama pengguna/session_id dari API tidak boleh keluar dari RAG_INDEX_DIR
+        return os.path.join(self.index_dir, hashlib.sha256((username or "").encode("utf-8")).hexdigest()[:32])
+
+    def _session_dir(self, username, session_id):
+        return os.path.join(self._user_dir(username), hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32])
+
+    # --- Storan ---
+    def _load_locked(self, session_dir):
+        index = self._indexes.get(session_dir)
+        if index is not None:
+            self._indexes.move_to_end(session_dir)
+            return index
+        try:
+            with open(os.path.join(session_dir, "index.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(os.path.join(session_dir, "vectors.npy"))
+        except FileNotFoundError:
+            meta, matrix = {"documents": [], "chunks": []}, np.empty((0, 0), dtype=np.float32)
+        rows = min(len(meta["chunks"]), len(matrix)) # Tulisan separa: abaikan baris tanpa pasangan
+        index = _SessionIndex(meta["documents"], meta["chunks"][:rows], matrix[:rows])
+        self._indexes[session_dir] = index
+        while len(self._indexes) > RAG_CACHE_SIZE:
+            self._indexes.popitem(last=False)
+        return index
+
+    def _save_locked(self, session_dir, index):
+        os.makedirs(session_dir, exist_ok=True)
+        vectors_path = os.path.join(session_dir, "vectors.npy")
+        meta_path = os.path.join(session_dir, "index.json")
+        with open(f"{vectors_path}.tmp", "wb") as f:
+            np.save(f, index.matrix)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"model": self.embed_model, "documents": index.documents, "chunks": index.chunks}, f, ensure_ascii=False)
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    # --- Penambahan dokumen ---
+    def _prepare(self, username, session_id, text):
+        """Mengembalikan (direktori sesi, sha256, rekod dokumen sedia ada atau None)."""
+        session_dir = self._session_dir(username, session_id)
+        sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            index = self._load_locked(session_dir)
+            for doc in index.documents:
+                if doc["sha256"] == sha256:
+                    return session_dir, sha256, dict(doc)
+        return session_dir, sha256, None
+
+    def _append(self, session_dir, filename, sha256, chunks, vectors):
+        if not chunks:
+            return {"filename": filename, "sha256": sha256, "chunks": 0}
+        if len(vectors) != len(chunks):
+            raise DocumentIndexError(f"Ollama mengembalikan {len(vectors)} embedding untuk {len(chunks)} bahagian.")
+        matrix = _normalise(vectors)
+        with self._lock:
+            index = self._load_locked(session_dir)
+            if index.matrix.size and index.matrix.shape[1] != matrix.shape[1]:
+                raise DocumentIndexError(f"Dimensi embedding ({matrix.shape[1]}) tidak sepadan dengan indeks sedia ada.")
+            index.matrix = np.vstack([index.matrix, matrix]) if index.matrix.size else matrix
+            index.chunks = index.chunks + [{"document": filename, "chunk": i, "text": chunk} for i, chunk in enumerate(chunks)]
+            document = {"filename": filename, "sha256": sha256, "chunks": len(chunks)}
+            index.documents = index.documents + [document]
+            self._save_locked(session_dir, index)
+        return dict(document)
+
+    def add_document(self, username, session_id, filename, text):
+        """Memecah, meng-embed (berkelompok) dan menyimpan dokumen. Mengembalikan rekod dokumen
+        {"filename", "sha256", "chunks"}; kandungan yang sama tidak diindeks dua kali dalam satu sesi."""
+        session_dir, sha256, existing = self._prepare(username, session_id, text)
+        if existing is not None:
+            return existing
+        chunks = chunk_text(text)
+        vectors = []
+        for batch in _batches(chunks, self.batch_size):
+            vectors.extend(ollama_client.embed(batch, model=self.embed_model))
+        return self._append(session_dir, filename, sha256, chunks, vectors)
+
+    async def async_add_document(self, username, session_id, filename, text):
+        session_dir, sha256, existing = self._prepare(username, session_id, text)
+        if existing is not None:
+            return existing
+        chunks = chunk_text(text)
+        vectors = []
+        for batch in _batches(chunks, self.batch_size):
+            vectors.extend(await ollama_client.async_embed(batch, model=self.embed_model))
+        return self._append(session_dir, filename, sha256, chunks, vectors)
+
+    # --- Carian ---
+    def documents(self, username, session_id):
+        with self._lock:
+            return [dict(doc) for doc in self._load_locked(self._session_dir(username, session_id)).documents]
+
+    def has_documents(self, username, session_id):
+        with self._lock:
+            return len(self._load_locked(self._session_dir(username, session_id)).chunks) > 0
+
+    def _top_k(self, username, session_id, query, top_k):
+        with self._lock:
+            index = self._load_locked(self._session_dir(username, session_id))
+            if not index.chunks or index.matrix.shape[1] != query.shape[0]:
+                return []
+            rows = top_k_rows(index.matrix, query, top_k or self.top_k, self.min_score)
+            return [dict(index.chunks[i], score=score) for i, score in rows]
+
+    def first_chunks(self, username, session_id, filename, count=None):
+        """Bahagian awal sesebuah dokumen, untuk giliran yang tidak mempunyai soalan (cth. ringkasan fail)."""
+        with self._lock:
+            index = self._load_locked(self._session_dir(username, session_id))
+            chunks = [chunk for chunk in index.chunks if chunk["document"] == filename]
+        return [dict(chunk, score=None) for chunk in chunks[:count or self.top_k]]
+
+    def search(self, username, session_id, query, top_k=None):
+        """Bahagian paling relevan bagi 'query' ([] jika sesi tiada dokumen)."""
+        if not self.has_documents(username, session_id):
+            return []
+        return self._top_k(username, session_id, embed_query(query, self.embed_model), top_k)
+
+    async def async_search(self, username, session_id, query, top_k=None):
+        if not self.has_documents(username, session_id):
+            return []
+        return self._top_k(username, session_id, await async_embed_query(query, self.embed_model), top_k)
+
+    # --- Pemadaman (dipanggil bersama pemadaman sesi) ---
+    def delete_session(self, username, session_id):
+        session_dir = self._session_dir(username, session_id)
+        with self._lock:
+            self._indexes.pop(session_dir, None)
+            shutil.rmtree(session_dir, ignore_errors=True)
+
+    def delete_all_sessions(self, username=None):
+        user_dir = self._user_dir(username)
+        with self._lock:
+            for session_dir in [key for key in self._indexes if os.path.dirname(key) == user_dir]:
+                del self._indexes[session_dir]
+            shutil.rmtree(user_dir, ignore_errors=True)
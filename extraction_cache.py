@@ -0,0 +1,137 @@
+"""Cache cakera bagi teks yang diekstrak dari fail yang dimuat naik.
+
+Kunci ialah SHA-256 kandungan fail bersama sambungan fail dan versi pengekstrak, jadi lembaran
+makmal yang sama yang dimuat naik semula tidak perlu melalui OCR/PDF lagi, dan menaikkan
+EXTRACTOR_VERSION (file_extraction.py) membatalkan semua entri lama dengan sendirinya.
+Setiap entri ialah satu fail <kunci>.json (teks dan maklumat pemotongan) di bawah UPLOAD_DIR.
+Saiz keseluruhan dihadkan dan entri yang paling lama tidak digunakan (mtime) dibuang dahulu;
+mtime dikemas kini pada setiap hit supaya susunan LRU dikongsi oleh semua proses (Streamlit dan
+backend) yang guna direktori sama.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+# --- KONFIGURASI ---
+UPLOAD_DIR = "uploaded_files"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", UPLOAD_DIR)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "1") == "1"
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+EXTRACTION_CACHE_LOW_WATERMARK = 0.9 # Selepas penghapusan, saiz dikurangkan ke 90% had
+
+_ENTRY_RE = re.compile(r"^[0-9a-f]{64}\.(json|txt)$") # .txt: entri format lama, dibuang melalui LRU seperti biasa
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def make_key(filename, source, version):
+    """Kunci cache: versi pengekstrak + sambungan fail + kandungan (bait atau laluan fail).
+    Nama fail sendiri diabaikan."""
+    h = hashlib.sha256()
+    h.update(f"{version}\0{os.path.splitext(filename)[1].lower()}\0".encode("utf-8"))
+    if isinstance(source, (bytes, bytearray)):
+        h.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, cache_dir=EXTRACTION_CACHE_DIR, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None # Dikira semasa pertama kali digunakan
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _scan(self):
+        """Senarai (mtime, saiz, laluan) bagi semua entri; fail lain dalam direktori tidak disentuh."""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not _ENTRY_RE.match(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue # Dibuang oleh proses lain
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def _ensure_total_locked(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def get(self, key):
+        """Rekod yang dicache (kamus) atau None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            os.utime(path) # Tandakan sebagai baru digunakan
+        except (FileNotFoundError, ValueError): # Tiada, atau ditulis separa oleh versi lama
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return record
+
+    def put(self, key, record):
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"Gagal menyimpan cache ekstraksi: {e}")
+            return
+        with self._lock:
+            self._ensure_total_locked()
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        # Imbas semula direktori: proses lain mungkin telah menambah atau membuang entri
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EXTRACTION_CACHE_LOW_WATERMARK)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def stats(self):
+        with self._lock:
+            self._ensure_total_locked()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
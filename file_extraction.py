@@ -0,0 +1,582 @@
+"""Ekstraksi teks dari fail yang dimuat naik (imej, PDF, DOCX, PPTX, XLSX, TXT) dalam kolam proses latar belakang.
+
+ExtractionJobManager menerima fail dan mengembalikan ID kerja serta-merta. OCR dan penghuraian
+PDF dijalankan dalam proses pekerja, jadi skrip Streamlit dan gelung acara FastAPI tidak tersekat.
+Kemajuan dilaporkan bagi setiap halaman dan kerja boleh dibatalkan di antara halaman.
+Jika ExtractionCache diberi, fail yang pernah diekstrak selesai serta-merta tanpa ke kolam.
+Digunakan oleh chatbot.py, chatbot-newtheme.py dan /api/uploads dalam backend_api.py.
+"""
+import codecs
+import io
+import math
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz # PyMuPDF
+from docx import Document
+from docx.table import Table
+from openpyxl import load_workbook
+from PIL import Image
+from pptx import Presentation
+
+from context_window import CONTEXT_CHARS_PER_TOKEN
+from extraction_cache import make_key
+from ocr_pipeline import ocr_image
+
+# --- KONFIGURASI ---
+EXTRACTOR_VERSION = "5" # Naikkan apabila output extract_text berubah; entri cache lama tidak lagi dipadankan
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2")) # Proses pekerja OCR/PDF
+EXTRACTION_MAX_BYTES = int(os.getenv("EXTRACTION_MAX_BYTES", str(50 * 1024 * 1024)))
+EXTRACTION_MAX_TOKENS = int(os.getenv("EXTRACTION_MAX_TOKENS", "0")) # Jika diberi, menggantikan EXTRACTION_MAX_CHARS
+EXTRACTION_MAX_CHARS = int(EXTRACTION_MAX_TOKENS * CONTEXT_CHARS_PER_TOKEN) if EXTRACTION_MAX_TOKENS else int(os.getenv("EXTRACTION_MAX_CHARS", "100000"))
+EXTRACTION_SPOOL_BYTES = int(os.getenv("EXTRACTION_SPOOL_BYTES", str(8 * 1024 * 1024))) # Fail lebih besar dihantar ke pekerja melalui fail sementara
+TXT_BLOCK_BYTES = 1024 * 1024
+EXTRACTION_JOB_TTL = float(os.getenv("EXTRACTION_JOB_TTL", "3600")) # Saat kerja yang selesai disimpan untuk ditinjau
+PDF_OCR_ENABLED = os.getenv("PDF_OCR_ENABLED", "1") == "1" # OCR halaman PDF yang tiada lapisan teks (imbasan)
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "300")) # Resolusi rasterisasi; Tesseract paling tepat sekitar 300 DPI
+PDF_OCR_THREADS = int(os.getenv("PDF_OCR_THREADS", str(max(1, (os.cpu_count() or 2) // max(1, EXTRACTION_WORKERS)))))
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "20")) # Kurang dari ini dianggap halaman tanpa lapisan teks
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+OFFICE_EXTENSIONS = ('.docx', '.pptx', '.xlsx') # Dihurai terus dari memori (ZIP), tanpa fail sementara
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS + ('.pdf', '.txt') + OFFICE_EXTENSIONS
+XLSX_ROWS_PER_UNIT = 200 # Baris hamparan bagi setiap unit kemajuan
+
+# Keadaan kerja
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class ExtractionError(Exception):
+    pass
+
+class UnsupportedFileTypeError(ExtractionError):
+    pass
+
+class ExtractionCancelled(ExtractionError):
+    pass
+
+
+# --- EKSTRAKSI (dijalankan dalam proses pekerja) ---
+def _source_size(source):
+    return len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+
+@contextmanager
+def _mapped(source):
+    """Kandungan fail sebagai objek boleh-hiris. Fail di cakera dipetakan ke memori (mmap),
+    jadi hanya bahagian yang sedang dinyahkod berada dalam memori."""
+    if isinstance(source, (bytes, bytearray)):
+        yield source
+        return
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def _iter_image(source, report):
+    report(0, 1)
+    with Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+        text = ocr_image(image)
+    report(1, 1)
+    yield 1, 1, text
+
+def _iter_txt(source, report):
+    with _mapped(source) as view:
+        total = math.ceil(len(view) / TXT_BLOCK_BYTES)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore") # Aksara yang terbelah antara blok disambung
+        for index in range(total):
+            text = decoder.decode(view[index * TXT_BLOCK_BYTES:(index + 1) * TXT_BLOCK_BYTES], final=index == total - 1)
+            report(index + 1, total)
+            yield index + 1, total, text
+
+def _office_file(source):
+    # Bait dibaca terus dari memori; laluan (fail besar yang di-spool) dibuka oleh pustaka itu sendiri
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def _table_text(rows, merge_repeats=True):
+    """Jadual sebagai baris teks dengan sel dipisahkan ' | '. Jadual Word/PowerPoint mengulang sel
+    bercantum bagi setiap lajur yang diliputi, jadi nilai berulang bersebelahan digabungkan."""
+    lines = []
+    for cells in rows:
+        values = []
+        for value in cells:
+            value = "" if value is None else str(value).strip()
+            if not merge_repeats or not values or value != values[-1]:
+                values.append(value)
+        while values and not values[-1]:
+            values.pop()
+        if values:
+            lines.append(" | ".join(values))
+    return "\n".join(lines) + "\n" if lines else ""
+
+def _docx_block_text(block):
+    if isinstance(block, Table):
+        return _table_text([cell.text for cell in row.cells] for row in block.rows)
+    return block.text + "\n"
+
+def _iter_docx(source, report):
+    doc = Document(_office_file(source))
+    # Pengepala/pengaki (selalunya kod kursus atau tajuk) sekali sahaja, kemudian perenggan dan jadual mengikut susunan
+    seen = set()
+    header_lines = []
+    for section in doc.sections:
+        for part in (section.header, section.footer):
+            if part.is_linked_to_previous:
+                continue
+            for block in part.iter_inner_content():
+                text = _docx_block_text(block)
+                if text.strip() and text not in seen:
+                    seen.add(text)
+                    header_lines.append(text)
+    blocks = list(doc.iter_inner_content())
+    total = len(blocks) + 1
+    report(0, total)
+    yield 1, total, "".join(header_lines)
+    for index, block in enumerate(blocks, 2):
+        if index % 50 == 0 or index == total: # Kemajuan merentas proses ada kos; lapor setiap 50 blok
+            report(index, total)
+        yield index, total, _docx_block_text(block)
+
+def _pptx_shape_texts(shapes):
+    for shape in shapes:
+        if shape.shape_type == 6: # MSO_SHAPE_TYPE.GROUP
+            yield from _pptx_shape_texts(shape.shapes)
+        elif shape.has_text_frame:
+            text = shape.text_frame.text.strip()
+            if text:
+                yield text + "\n"
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            yield _table_text([cell.text for cell in row.cells] for row in shape.table.rows)
+
+def _iter_pptx(source, report):
+    slides = list(Presentation(_office_file(source)).slides)
+    total = len(slides)
+    report(0, total)
+    for index, slide in enumerate(slides, 1):
+        parts = [f"--- Slaid {index} ---\n", *_pptx_shape_texts(slide.shapes)]
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame.text.strip() if slide.notes_slide.notes_text_frame else ""
+            if notes:
+                parts.append(f"Nota: {notes}\n")
+        report(index, total)
+        yield index, total, "".join(parts)
+
+def _iter_xlsx(source, report):
+    # read_only: baris distrim dari XML helaian, jadi hamparan besar tidak dimuatkan sepenuhnya
+    workbook = load_workbook(_office_file(source), read_only=True, data_only=True)
+    try:
+        sheets = workbook.worksheets
+        total = len(sheets)
+        report(0, total)
+        for index, sheet in enumerate(sheets, 1):
+            rows = sheet.iter_rows(values_only=True)
+            header = f"--- Helaian: {sheet.title} ---\n"
+            while True:
+                block = [row for _, row in zip(range(XLSX_ROWS_PER_UNIT), rows)]
+                if not block:
+                    break
+                yield index, total, header + _table_text(block, merge_repeats=False)
+                header = ""
+                report(index - 1, total) # Semakan pembatalan di antara blok baris
+            report(index, total)
+    finally:
+        workbook.close()
+
+def _ocr_page(pixmap):
+    image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    return ocr_image(image, dpi=PDF_OCR_DPI).strip() + "\n"
+
+def _iter_pdf(source, report):
+    """Lapisan teks digunakan jika ada; hanya halaman imej sahaja dirasterkan dan di-OCR.
+
+    OCR dijalankan dalam PDF_OCR_THREADS thread serentak (Tesseract ialah proses berasingan,
+    jadi ia benar-benar selari merentas teras). Bilangan halaman yang dirasterkan tetapi belum
+    di-OCR dihadkan supaya PDF imbasan yang panjang tidak memenuhi memori. Halaman dihasilkan
+    mengikut susunan; jika pengguna penjana berhenti awal, halaman yang belum dimulakan dibatalkan."""
+    if isinstance(source, (bytes, bytearray)):
+        doc = fitz.open(stream=source, filetype="pdf")
+    else:
+        doc = fitz.open(source, filetype="pdf") # Halaman dibaca dari cakera apabila diperlukan
+    with doc:
+        total = doc.page_count
+        ready = {} # indeks halaman -> teks, menunggu halaman sebelumnya
+        next_index = 0
+        done = 0
+        report(0, total)
+        threads = max(1, PDF_OCR_THREADS)
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pdf-ocr") as pool:
+            pending = {}
+
+            def collect(return_when):
+                nonlocal done
+                finished, _ = wait(pending, return_when=return_when)
+                for future in finished:
+                    ready[pending.pop(future)] = future.result()
+                    done += 1
+                    report(done, total)
+
+            try:
+                for index, page in enumerate(doc):
+                    page_text = page.get_text()
+                    if len(page_text.strip()) >= PDF_TEXT_MIN_CHARS or not PDF_OCR_ENABLED or not page.get_images():
+                        ready[index] = page_text
+                        done += 1
+                        report(done, total)
+                    else:
+                        pixmap = page.get_pixmap(dpi=PDF_OCR_DPI, colorspace=fitz.csGRAY)
+                        pending[pool.submit(_ocr_page, pixmap)] = index
+                        if len(pending) >= 2 * threads:
+                            collect(FIRST_COMPLETED)
+                    while next_index in ready:
+                        yield next_index + 1, total, ready.pop(next_index)
+                        next_index += 1
+                while pending:
+                    collect(FIRST_COMPLETED)
+                    while next_index in ready:
+                        yield next_index + 1, total, ready.pop(next_index)
+                        next_index += 1
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+def iter_text(filename, source, progress=None, is_cancelled=None):
+    """Menghasilkan (unit, jumlah unit, teks) mengikut susunan: satu halaman PDF, satu perenggan
+    atau jadual DOCX, satu slaid PPTX, satu blok baris XLSX atau satu blok TXT pada satu masa.
+    'source' ialah bait atau laluan fail.
+
+    progress(selesai, jumlah) dipanggil semasa kerja berjalan; jika is_cancelled() benar,
+    ExtractionCancelled dibangkitkan pada laporan seterusnya. Menutup penjana lebih awal
+    menghentikan ekstraksi, jadi bahagian fail selepas had bajet tidak diproses langsung."""
+    def report(done, total):
+        if progress:
+            progress(done, total)
+        if is_cancelled and is_cancelled():
+            raise ExtractionCancelled(f"Ekstraksi '{filename}' dibatalkan.")
+
+    name = filename.lower()
+    if not name.endswith(SUPPORTED_EXTENSIONS):
+        raise UnsupportedFileTypeError(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
+    if name.endswith(IMAGE_EXTENSIONS):
+        chunks = _iter_image(source, report)
+    elif name.endswith(".txt"):
+        chunks = _iter_txt(source, report)
+    elif name.endswith(".docx"):
+        chunks = _iter_docx(source, report)
+    elif name.endswith(".pptx"):
+        chunks = _iter_pptx(source, report)
+    elif name.endswith(".xlsx"):
+        chunks = _iter_xlsx(source, report)
+    else:
+        chunks = _iter_pdf(source, report)
+    try:
+        yield from chunks
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Ralat semasa memproses fail '{filename}': {e}") from e
+
+def unit_name(filename):
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return "halaman"
+    if name.endswith(".pptx"):
+        return "slaid"
+    if name.endswith(".xlsx"):
+        return "helaian"
+    return "blok" if name.endswith((".txt", ".docx")) else "imej"
+
+def extract_text(filename, source, progress=None, is_cancelled=None, max_chars=EXTRACTION_MAX_CHARS):
+    """Mengekstrak teks sehingga max_chars aksara. Mengembalikan kamus:
+    text, truncated, unit ("halaman", "perenggan", ...), units_read, units_total, max_chars."""
+    parts = []
+    used = 0
+    unit = total = 0
+    truncated = False
+    chunks = iter_text(filename, source, progress, is_cancelled)
+    try:
+        for unit, total, text in chunks:
+            remaining = max_chars - used
+            if len(text) > remaining:
+                if remaining > 0:
+                    parts.append(text[:remaining])
+                else:
+                    unit -= 1 # Tiada satu aksara pun dari unit ini disertakan
+                truncated = True
+                break
+            parts.append(text)
+            used += len(text)
+    finally:
+        chunks.close()
+    return {
+        "text": "".join(parts).strip(),
+        "truncated": truncated,
+        "unit": unit_name(filename),
+        "units_read": unit,
+        "units_total": total,
+        "max_chars": max_chars,
+    }
+
+_worker_progress = None
+_worker_cancelled = None
+
+def _init_worker(progress, cancelled):
+    global _worker_progress, _worker_cancelled
+    # Setiap panggilan Tesseract satu thread; keselarian datang dari PDF_OCR_THREADS dan kolam proses
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    _worker_progress = progress
+    _worker_cancelled = cancelled
+
+def _run_job(job_id, filename, source):
+    def progress(done, total):
+        _worker_progress[job_id] = (done, total)
+
+    def is_cancelled():
+        return job_id in _worker_cancelled
+
+    return extract_text(filename, source, progress, is_cancelled)
+
+
+# --- PENGURUS KERJA (proses utama) ---
+class _Job:
+    def __init__(self, job_id, filename, size, owner):
+        self.job_id = job_id
+        self.filename = filename
+        self.size = size
+        self.owner = owner
+        self.cache_key = None
+        self.cached = False
+        self.spool_path = None # Fail sementara milik kerja ini, dipadam apabila kerja tamat
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+
+class ExtractionJobManager:
+    """Kolam proses dikongsi dengan ID kerja, kemajuan, pembatalan dan tinjauan status."""
+    def __init__(self, max_workers=EXTRACTION_WORKERS, job_ttl=EXTRACTION_JOB_TTL, cache=None):
+        self.max_workers = max(1, max_workers)
+        self.job_ttl = job_ttl
+        self.cache = cache # ExtractionCache pilihan
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("spawn") # fork tidak selamat dalam proses berbilang thread
+        self._manager = None
+        self._executor = None
+
+    def _ensure_pool_locked(self):
+        if self._manager is None:
+            self._manager = self._context.Manager()
+            self._progress = self._manager.dict() # job_id -> (halaman selesai, jumlah halaman)
+            self._cancelled = self._manager.dict() # job_id -> True
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=self._context,
+                initializer=_init_worker, initargs=(self._progress, self._cancelled),
+            )
+        return self._executor
+
+    @staticmethod
+    def _spool(write):
+        fd, path = tempfile.mkstemp(prefix="extract-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def _prepare_source(self, filename, source):
+        """Mengembalikan (source untuk pekerja, saiz, laluan sementara atau None).
+
+        Bait atau objek fail yang besar ditulis ke fail sementara supaya tidak dihantar melalui
+        paip ke proses pekerja; pekerja memetakan fail itu ke memori. Laluan fail yang diberi
+        terus menjadi milik pengurus dan dipadam apabila kerja tamat (atau ditolak)."""
+        if isinstance(source, str):
+            size = os.path.getsize(source)
+            if size > EXTRACTION_MAX_BYTES:
+                os.remove(source)
+            return source, size, source
+        if not isinstance(source, (bytes, bytearray)):
+            source.seek(0, os.SEEK_END)
+            size = source.tell()
+            source.seek(0)
+            if size > EXTRACTION_MAX_BYTES:
+                return None, size, None
+            if size > EXTRACTION_SPOOL_BYTES:
+                path = self._spool(lambda f: shutil.copyfileobj(source, f, TXT_BLOCK_BYTES))
+                return path, size, path
+            source = source.read()
+        size = len(source)
+        if size > EXTRACTION_SPOOL_BYTES and size <= EXTRACTION_MAX_BYTES:
+            path = self._spool(lambda f: f.write(source))
+            return path, size, path
+        return source, size, None
+
+    def submit(self, filename, source, owner=None):
+        """Menghantar fail untuk diekstrak dan mengembalikan ID kerja tanpa menunggu.
+        'source' ialah bait, objek fail (cth. UploadedFile Streamlit) atau laluan fail sementara."""
+        if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            if isinstance(source, str):
+                os.remove(source)
+            raise UnsupportedFileTypeError(f"Jenis fail '{filename}' tidak disokong untuk ekstraksi teks.")
+        source, size, spool_path = self._prepare_source(filename, source)
+        if size > EXTRACTION_MAX_BYTES:
+            raise ExtractionError(f"Fail '{filename}' melebihi had {EXTRACTION_MAX_BYTES // (1024 * 1024)} MB.")
+        job = _Job(uuid.uuid4().hex, filename, size, owner)
+        job.spool_path = spool_path
+        if self.cache is not None:
+            # Bajet aksara mengubah hasil, jadi ia sebahagian daripada versi kunci
+            job.cache_key = make_key(filename, source, f"{EXTRACTOR_VERSION}:{EXTRACTION_MAX_CHARS}")
+            result = self.cache.get(job.cache_key)
+            if result is not None:
+                job.cached = True
+                job.future = Future()
+                job.future.set_result(result)
+                job.finished_at = time.time()
+                self._remove_spool(job)
+                with self._lock:
+                    self._prune_locked()
+                    self._jobs[job.job_id] = job
+                return job.job_id
+        with self._lock:
+            self._prune_locked()
+            try:
+                job.future = self._ensure_pool_locked().submit(_run_job, job.job_id, filename, source)
+            except BrokenProcessPool:
+                # Pekerja mati (cth. PDF rosak menyebabkan crash); bina semula kolam dan cuba sekali lagi
+                self._executor = None
+                job.future = self._ensure_pool_locked().submit(_run_job, job.job_id, filename, source)
+            self._jobs[job.job_id] = job
+        job.future.add_done_callback(lambda _future, job=job: self._on_done(job))
+        return job.job_id
+
+    @staticmethod
+    def _remove_spool(job):
+        if job.spool_path is not None:
+            try:
+                os.remove(job.spool_path)
+            except FileNotFoundError:
+                pass
+            job.spool_path = None
+
+    def _on_done(self, job):
+        job.finished_at = time.time()
+        self._remove_spool(job)
+        if job.future.cancelled():
+            return
+        error = job.future.exception()
+        if error is None:
+            if self.cache is not None:
+                self.cache.put(job.cache_key, job.future.result())
+        elif isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._executor = None # Kerja seterusnya akan membina kolam baru
+
+    def _prune_locked(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and now - job.finished_at > self.job_ttl]:
+            self._forget_locked(job_id)
+
+    def _forget_locked(self, job_id):
+        self._jobs.pop(job_id, None)
+        if self._manager is not None:
+            self._progress.pop(job_id, None)
+            self._cancelled.pop(job_id, None)
+
+    def _get(self, job_id, owner=None):
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def status(self, job_id, owner=None, include_text=False):
+        """Status kerja sebagai kamus, atau None jika tidak wujud (atau milik pengguna lain)."""
+        with self._lock:
+            job = self._get(job_id, owner)
+            if job is None:
+                return None
+            progress = self._progress.get(job_id) if self._manager is not None else None
+        future = job.future
+        info = {"job_id": job.job_id, "filename": job.filename, "size": job.size, "cached": job.cached,
+                "error": None, "text": None, "truncated": False, "truncation": None}
+        if future.cancelled():
+            info["state"] = JOB_CANCELLED
+        elif future.done():
+            error = future.exception()
+            if error is None:
+                info["state"] = JOB_DONE
+                result = future.result()
+                if include_text:
+                    info["text"] = result["text"]
+                if result["truncated"]:
+                    info["truncated"] = True
+                    info["truncation"] = {key: result[key] for key in ("unit", "units_read", "units_total", "max_chars")}
+            elif isinstance(error, ExtractionCancelled):
+                info["state"] = JOB_CANCELLED
+            else:
+                info["state"] = JOB_FAILED
+                info["error"] = str(error) if isinstance(error, ExtractionError) else f"Ralat semasa memproses fail '{job.filename}': {error}"
+        else:
+            info["state"] = JOB_RUNNING if progress is not None else JOB_QUEUED
+        done, total = progress or (0, 0)
+        info["pages_done"] = done
+        info["pages_total"] = total
+        info["elapsed"] = round((job.finished_at or time.time()) - job.created_at, 3)
+        return info
+
+    def result(self, job_id, owner=None, timeout=None):
+        """Menunggu dan mengembalikan hasil extract_text(). Membangkitkan ExtractionError jika gagal atau dibatalkan."""
+        with self._lock:
+            job = self._get(job_id, owner)
+        if job is None:
+            raise KeyError(job_id)
+        try:
+            return job.future.result(timeout)
+        except CancelledError:
+            raise ExtractionCancelled(f"Ekstraksi '{job.filename}' dibatalkan.")
+
+    def cancel(self, job_id, owner=None):
+        """Membatalkan kerja. Kerja dalam giliran dibatalkan serta-merta; kerja yang sedang berjalan
+        berhenti selepas halaman semasa."""
+        with self._lock:
+            job = self._get(job_id, owner)
+            if job is None:
+                return False
+            if job.future.cancel():
+                return True
+            if not job.future.done() and self._manager is not None:
+                self._cancelled[job_id] = True
+        return True
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else {"enabled": False}
+
+    def forget(self, job_id, owner=None):
+        with self._lock:
+            if self._get(job_id, owner) is not None:
+                self._forget_locked(job_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
@@ -0,0 +1,100 @@
+"""Imej sebagai input terus kepada model visi Ollama (cth. Gemma 3), sebagai alternatif kepada OCR.
+
+Jika model yang dipilih mempunyai keupayaan "vision" (/api/show), imej yang dimuat naik tidak
+dihantar ke Tesseract; ia dikecilkan, dikod semula sebagai JPEG dan dihantar dalam medan
+'images' mesej /api/chat. Rajah, graf dan persamaan tulisan tangan boleh difahami model, dan
+OCR yang berat CPU tidak lagi berjalan pada hos aplikasi. Model tanpa visi terus menggunakan OCR.
+"""
+import base64
+import io
+import os
+
+import httpx
+import requests
+from PIL import Image, ImageOps
+
+import ollama_client
+from file_extraction import IMAGE_EXTENSIONS
+
+# --- KONFIGURASI ---
+IMAGE_INPUT_MODE = os.getenv("IMAGE_INPUT_MODE", "auto") # auto = imej terus ke model visi jika disokong; ocr = sentiasa Tesseract
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024")) # Gemma 3 mengubah saiz ke 896x896; imej lebih besar hanya membazir
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+VISION_MAX_IMAGE_BYTES = int(os.getenv("VISION_MAX_IMAGE_BYTES", str(20 * 1024 * 1024))) # Saiz fail imej maksimum sebelum dinyahkod
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", str(40_000_000))) # Had piksel; melindungi daripada "bom nyahmampat"
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def supports_vision(model):
+    """True jika model menerima imej. Jika /api/show gagal, OCR digunakan (False)."""
+    if not model:
+        return False
+    try:
+        return "vision" in ollama_client.model_capabilities(model)
+    except requests.exceptions.RequestException:
+        return False
+
+async def async_supports_vision(model):
+    if not model:
+        return False
+    try:
+        return "vision" in await ollama_client.async_model_capabilities(model)
+    except httpx.HTTPError:
+        return False
+
+def is_image_file(filename):
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+def use_vision(model, filename):
+    """Sama ada fail ini dihantar sebagai imej kepada model (bukan melalui OCR)."""
+    return IMAGE_INPUT_MODE != "ocr" and is_image_file(filename) and supports_vision(model)
+
+def decode_base64_image(data):
+    """Bait imej dari rentetan base64 klien. Saiz disemak sebelum dinyahkod.
+    Membangkitkan ImageTooLargeError atau binascii.Error."""
+    if len(data) > (VISION_MAX_IMAGE_BYTES + 2) // 3 * 4:
+        raise ImageTooLargeError(f"imej melebihi {VISION_MAX_IMAGE_BYTES} bait")
+    return base64.b64decode(data, validate=True)
+
+def _open_image(source):
+    if isinstance(source, (bytes, bytearray)):
+        size = len(source)
+        source = io.BytesIO(source)
+    elif hasattr(source, "seek"):
+        size = source.seek(0, io.SEEK_END)
+        source.seek(0)
+    else:
+        size = os.path.getsize(source)
+    if size > VISION_MAX_IMAGE_BYTES:
+        raise ImageTooLargeError(f"imej melebihi {VISION_MAX_IMAGE_BYTES} bait")
+    try:
+        image = Image.open(source) # Hanya pengepala dibaca di sini
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    if image.width * image.height > VISION_MAX_PIXELS:
+        image.close()
+        raise ImageTooLargeError(f"imej {image.width}x{image.height} melebihi {VISION_MAX_PIXELS} piksel")
+    return image
+
+def encode_image(source, max_side=VISION_MAX_SIDE, quality=VISION_JPEG_QUALITY):
+    """Imej (bait, laluan atau objek fail) sebagai JPEG base64 untuk medan 'images' Ollama.
+    Membangkitkan OSError/ValueError jika data bukan imej yang sah, dan ImageTooLargeError
+    (subkelas ValueError) jika fail atau dimensinya melebihi had."""
+    with _open_image(source) as image:
+        if image.format == "JPEG" and max(image.size) > max_side:
+            scale = max_side / max(image.size)
+            image.draft("RGB", (int(image.width * scale), int(image.height * scale))) # Nyahkod terus pada saiz lebih kecil
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS) # Imej kecil sahaja; kos diabaikan
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
@@ -0,0 +1,368 @@
+"""Pangkalan pengetahuan STEM dikongsi, dibina di luar talian dari folder bahan kursus.
+
+Bina (atau kemas kini) indeks:
+    python knowledge_base.py build --source course_materials
+Fail diekstrak melalui file_extraction.extract_text dalam kolam proses, dipecahkan dengan
+document_index.chunk_text dan di-embed secara berkelompok oleh beberapa thread serentak.
+Setiap binaan ditulis sebagai satu generasi baru di bawah KB_INDEX_DIR:
+    vectors.f32  - matriks float32 mentah (vektor dinormalkan), dibaca melalui np.memmap
+    chunks.jsonl - satu bahagian teks bagi setiap baris matriks
+    offsets.npy  - kedudukan bait setiap baris dalam chunks.jsonl
+    meta.json    - model, dimensi dan senarai fail (sha256, saiz, mtime, julat baris)
+dan fail CURRENT ditukar secara atomik kepada generasi itu. Binaan semula hanya mengekstrak dan
+meng-embed fail yang berubah; baris fail lain disalin dari generasi sebelumnya.
+
+KnowledgeBase (untuk laluan sembang) memetakan generasi semasa ke memori sekali bagi setiap
+proses, menyemak CURRENT sekali-sekala untuk binaan baru, dan mencari dengan satu hasil darab
+matriks-vektor.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import ollama_client
+from document_index import (RAG_CHUNK_CHARS, RAG_CHUNK_OVERLAP, RAG_EMBED_BATCH, RAG_EMBED_MODEL,
+                            _batches, _normalise, async_embed_query, chunk_text, embed_query, top_k_rows)
+from file_extraction import SUPPORTED_EXTENSIONS, ExtractionError, extract_text
+
+# --- KONFIGURASI ---
+KB_ENABLED = os.getenv("KB_ENABLED", "1") == "1"
+KB_SOURCE_DIR = os.getenv("KB_SOURCE_DIR", "course_materials")
+KB_INDEX_DIR = os.getenv("KB_INDEX_DIR", "knowledge_base")
+KB_EMBED_MODEL = os.getenv("KB_EMBED_MODEL", RAG_EMBED_MODEL)
+KB_TOP_K = int(os.getenv("KB_TOP_K", "3"))
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", "0.3"))
+KB_INGEST_WORKERS = int(os.getenv("KB_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1)))) # Proses ekstraksi semasa binaan
+KB_EMBED_WORKERS = int(os.getenv("KB_EMBED_WORKERS", "4")) # Panggilan /api/embed serentak semasa binaan
+KB_MAX_CHARS_PER_FILE = int(os.getenv("KB_MAX_CHARS_PER_FILE", str(5 * 1000 * 1000)))
+KB_RECHECK_INTERVAL = float(os.getenv("KB_RECHECK_INTERVAL", "60")) # Saat antara semakan binaan baru
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+
+class KnowledgeBaseError(Exception):
+    pass
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _current_generation(index_dir):
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name.startswith(GENERATION_PREFIX) else None
+
+def _read_meta(generation_dir):
+    with open(os.path.join(generation_dir, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _open_vectors(generation_dir, rows, dim):
+    if not rows:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.memmap(os.path.join(generation_dir, "vectors.f32"), dtype=np.float32, mode="r", shape=(rows, dim))
+
+def _open_chunks(generation_dir):
+    """(mmap chunks.jsonl atau None jika kosong, offsets)."""
+    offsets = np.load(os.path.join(generation_dir, "offsets.npy"), mmap_mode="r")
+    if offsets[-1] == 0:
+        return None, offsets
+    with open(os.path.join(generation_dir, "chunks.jsonl"), "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), offsets
+
+def _scan_sources(source_dir):
+    """{laluan relatif (garis miring '/'): (laluan penuh, stat)} bagi semua fail yang disokong."""
+    sources = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            sources[os.path.relpath(path, source_dir).replace(os.sep, "/")] = (path, os.stat(path))
+    return sources
+
+
+# --- BINAAN ---
+def _init_ingest_worker():
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def _extract_file(relpath, path):
+    """Dijalankan dalam proses pekerja. Mengembalikan (relpath, bahagian, ralat)."""
+    try:
+        result = extract_text(os.path.basename(path), path, max_chars=KB_MAX_CHARS_PER_FILE)
+    except ExtractionError as e:
+        return relpath, None, str(e)
+    return relpath, chunk_text(result["text"], RAG_CHUNK_CHARS, RAG_CHUNK_OVERLAP), None
+
+def _collect_vectors(chunks, futures):
+    vectors = []
+    for future in futures:
+        vectors.extend(future.result())
+    if len(vectors) != len(chunks):
+        raise KnowledgeBaseError(f"Ollama mengembalikan {len(vectors)} embedding untuk {len(chunks)} bahagian.")
+    return _normalise(vectors) if vectors else None
+
+def build_index(source_dir=KB_SOURCE_DIR, index_dir=KB_INDEX_DIR, embed_model=KB_EMBED_MODEL, full=False,
+                workers=KB_INGEST_WORKERS, embed_workers=KB_EMBED_WORKERS, batch_size=RAG_EMBED_BATCH, log=print):
+    """Membina generasi baru indeks. Mengembalikan ringkasan binaan (kamus).
+    Jika full=False, fail yang tidak berubah (saiz/mtime atau sha256 sama) diguna semula dari generasi semasa."""
+    if not os.path.isdir(source_dir):
+        raise KnowledgeBaseError(f"Folder bahan kursus '{source_dir}' tidak wujud.")
+    os.makedirs(index_dir, exist_ok=True)
+    start_time = time.time()
+    sources = _scan_sources(source_dir)
+
+    old_name = None if full else _current_generation(index_dir)
+    old_dir = os.path.join(index_dir, old_name) if old_name else None
+    old_meta = {"files": {}}
+    if old_dir:
+        try:
+            old_meta = _read_meta(old_dir)
+        except (OSError, ValueError):
+            old_dir = None
+        else:
+            if old_meta.get("model") != embed_model or old_meta.get("chunk_chars") != RAG_CHUNK_CHARS \
+                    or old_meta.get("chunk_overlap") != RAG_CHUNK_OVERLAP:
+                log("Model embedding atau saiz bahagian berubah; semua fail diindeks semula.")
+                old_dir, old_meta = None, {"files": {}}
+    old_files = old_meta.get("files", {})
+
+    # Fail yang tidak berubah diguna semula; yang lain diekstrak semula
+    reused, changed = {}, []
+    for relpath, (path, stat) in sources.items():
+        old = old_files.get(relpath)
+        if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            reused[relpath] = dict(old)
+            continue
+        sha256 = _file_sha256(path)
+        if old is not None and old["sha256"] == sha256:
+            reused[relpath] = dict(old, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        else:
+            changed.append((relpath, path, sha256))
+    removed = sorted(set(old_files) - set(sources))
+    log(f"{len(sources)} fail: {len(changed)} baru/berubah, {len(reused)} tidak berubah, {len(removed)} dibuang.")
+
+    # Ekstraksi (proses) dan embedding (thread) bagi fail yang berubah; kelompok embedding dihantar
+    # sebaik sahaja fail siap diekstrak, jadi kedua-dua peringkat berjalan serentak
+    new_chunks, new_vectors, failed = {}, {}, {}
+    if changed:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(changed))), initializer=_init_ingest_worker,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool, \
+                ThreadPoolExecutor(max_workers=max(1, embed_workers), thread_name_prefix="kb-embed") as embedder:
+            futures = [pool.submit(_extract_file, relpath, path) for relpath, path, _ in changed]
+            for done, future in enumerate(futures, start=1):
+                relpath, chunks, error = future.result()
+                if error is not None:
+                    failed[relpath] = error
+                    log(f"[{done}/{len(changed)}] {relpath}: GAGAL - {error}")
+                    continue
+                new_vectors[relpath] = [embedder.submit(ollama_client.embed, batch, model=embed_model)
+                                        for batch in _batches(chunks, max(1, batch_size))]
+                new_chunks[relpath] = chunks
+                log(f"[{done}/{len(changed)}] {relpath}: {len(chunks)} bahagian")
+            for relpath, chunks in new_chunks.items():
+                new_vectors[relpath] = _collect_vectors(chunks, new_vectors[relpath])
+
+    # Tulis generasi baru: baris disusun mengikut laluan fail
+    dims = {v.shape[1] for v in new_vectors.values() if v is not None}
+    if old_dir and reused:
+        dims.add(old_meta["dim"])
+    if len(dims) > 1:
+        raise KnowledgeBaseError(f"Dimensi embedding tidak konsisten: {sorted(dims)}")
+    dim = dims.pop() if dims else old_meta.get("dim", 0)
+    old_vectors = _open_vectors(old_dir, old_meta["rows"], old_meta["dim"]) if old_dir and reused else None
+    old_lines, old_offsets = _open_chunks(old_dir) if old_dir and reused else (None, None)
+    sha_by_path = {relpath: sha256 for relpath, _, sha256 in changed}
+
+    new_dir = tempfile.mkdtemp(prefix=f"{GENERATION_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-", dir=index_dir)
+    new_name = os.path.basename(new_dir)
+    files, offsets, rows = {}, [0], 0
+    try:
+        with open(os.path.join(new_dir, "vectors.f32"), "wb") as vectors_file, \
+                open(os.path.join(new_dir, "chunks.jsonl"), "wb") as chunks_file:
+            for relpath in sorted(set(reused) | set(new_chunks)):
+                if relpath in reused:
+                    entry = reused[relpath]
+                    start, count = entry["row_start"], entry["row_count"]
+                    if count:
+                        vectors_file.write(np.ascontiguousarray(old_vectors[start:start + count]).tobytes())
+                        lines = old_lines[int(old_offsets[start]):int(old_offsets[start + count])]
+                        chunks_file.write(lines)
+                        base = offsets[-1] - int(old_offsets[start])
+                        offsets.extend(base + int(o) for o in old_offsets[start + 1:start + count + 1])
+                else:
+                    _, stat = sources[relpath]
+                    entry = {"sha256": sha_by_path[relpath], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+                    chunks, vectors = new_chunks[relpath], new_vectors[relpath]
+                    count = len(chunks)
+                    if count:
+                        vectors_file.write(vectors.astype(np.float32).tobytes())
+                        for i, chunk in enumerate(chunks):
+                            line = json.dumps({"document": relpath, "chunk": i, "text": chunk}, ensure_ascii=False).encode("utf-8") + b"\n"
+                            chunks_file.write(line)
+                            offsets.append(offsets[-1] + len(line))
+                files[relpath] = dict(entry, row_start=rows, row_count=count)
+                rows += count
+        np.save(os.path.join(new_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        meta = {
+            "model": embed_model, "dim": dim, "rows": rows, "built_at": time.time(),
+            "chunk_chars": RAG_CHUNK_CHARS, "chunk_overlap": RAG_CHUNK_OVERLAP, "files": files,
+        }
+        with open(os.path.join(new_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    except BaseException:
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise
+    finally:
+        if old_lines is not None:
+            old_lines.close()
+        del old_vectors
+
+    # Tukar CURRENT secara atomik, kemudian buang generasi lama (pembaca yang masih memetakannya tidak terjejas
+    # pada Linux; pada Windows fail yang sedang dipetakan dibuang pada binaan seterusnya)
+    current_path = os.path.join(index_dir, CURRENT_FILE)
+    with open(f"{current_path}.tmp", "w", encoding="utf-8") as f:
+        f.write(new_name)
+    os.replace(f"{current_path}.tmp", current_path)
+    for name in os.listdir(index_dir):
+        if name.startswith(GENERATION_PREFIX) and name != new_name:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+    return {
+        "generation": new_name, "files": len(files), "chunks": rows, "indexed": len(new_chunks),
+        "reused": len(reused), "removed": len(removed), "failed": failed, "seconds": round(time.time() - start_time, 2),
+    }
+
+
+# --- CARIAN ---
+class _Generation:
+    def __init__(self, name, generation_dir):
+        self.name = name
+        self.meta = _read_meta(generation_dir)
+        self.matrix = _open_vectors(generation_dir, self.meta["rows"], self.meta["dim"])
+        self.lines, self.offsets = _open_chunks(generation_dir)
+
+    def chunk(self, row):
+        return json.loads(self.lines[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+
+class KnowledgeBase:
+    """Pembaca indeks untuk laluan sembang. Selamat dikongsi antara thread."""
+    def __init__(self, index_dir=KB_INDEX_DIR, top_k=KB_TOP_K, min_score=KB_MIN_SCORE, recheck_interval=KB_RECHECK_INTERVAL):
+        self.index_dir = index_dir
+        self.top_k = top_k
+        self.min_score = min_score
+        self.recheck_interval = recheck_interval
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        """Generasi semasa (atau None). CURRENT dibaca semula paling kerap sekali setiap recheck_interval."""
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at and now - self._checked_at < self.recheck_interval:
+                return self._generation
+            self._checked_at = now
+            name = _current_generation(self.index_dir)
+            if name is None:
+                self._generation = None
+            elif self._generation is None or self._generation.name != name:
+                try:
+                    self._generation = _Generation(name, os.path.join(self.index_dir, name))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Gagal memuatkan pangkalan pengetahuan '{name}': {e}")
+            return self._generation
+
+    def is_available(self):
+        generation = self._current()
+        return generation is not None and generation.meta["rows"] > 0
+
+    def _top_k(self, generation, query, top_k):
+        if query.shape[0] != generation.meta["dim"]:
+            return []
+        rows = top_k_rows(generation.matrix, query, top_k or self.top_k, self.min_score)
+        return [dict(generation.chunk(i), score=score) for i, score in rows]
+
+    def search(self, query, top_k=None):
+        """Bahagian bahan kursus paling relevan bagi 'query' ([] jika indeks belum dibina)."""
+        generation = self._current()
+        if generation is None or not generation.meta["rows"]:
+            return []
+        return self._top_k(generation, embed_query(query, generation.meta["model"]), top_k)
+
+    async def async_search(self, query, top_k=None):
+        generation = self._current()
+        if generation is None or not generation.meta["rows"]:
+            return []
+        return self._top_k(generation, await async_embed_query(query, generation.meta["model"]), top_k)
+
+    def status(self):
+        generation = self._current()
+        if generation is None:
+            return {"available": False}
+        meta = generation.meta
+        return {
+            "available": meta["rows"] > 0, "generation": generation.name, "model": meta["model"], "dim": meta["dim"],
+            "files": len(meta["files"]), "chunks": meta["rows"], "built_at": meta["built_at"],
+        }
+
+
+def response_cache_options(knowledge_base):
+    """Pilihan cache respons: petikan bahan kursus disertakan dalam prompt, jadi jawapan yang dicache
+    terikat pada generasi indeks dan tidak digunakan lagi selepas binaan semula. None jika tiada KB."""
+    generation = knowledge_base.status().get("generation") if knowledge_base is not None else None
+    return {"knowledge_base": generation} if generation else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pangkalan pengetahuan bahan kursus STEMBot")
+    parser.add_argument("--index-dir", default=KB_INDEX_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Bina atau kemas kini indeks dari folder bahan kursus")
+    build_parser.add_argument("--source", default=KB_SOURCE_DIR)
+    build_parser.add_argument("--model", default=KB_EMBED_MODEL, help="Model embedding Ollama")
+    build_parser.add_argument("--full", action="store_true", help="Indeks semula semua fail, bukan hanya yang berubah")
+    build_parser.add_argument("--workers", type=int, default=KB_INGEST_WORKERS, help="Proses ekstraksi")
+    build_parser.add_argument("--embed-workers", type=int, default=KB_EMBED_WORKERS, help="Panggilan /api/embed serentak")
+    search_parser = subparsers.add_parser("search", help="Cari indeks (untuk semakan)")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--top-k", type=int, default=KB_TOP_K)
+    subparsers.add_parser("status", help="Papar maklumat generasi semasa")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        summary = build_index(args.source, args.index_dir, args.model, full=args.full,
+                              workers=args.workers, embed_workers=args.embed_workers)
+        print(f"Generasi {summary['generation']}: {summary['files']} fail, {summary['chunks']} bahagian "
+              f"({summary['indexed']} diindeks, {summary['reused']} diguna semula, {summary['removed']} dibuang, "
+              f"{len(summary['failed'])} gagal) dalam {summary['seconds']} s")
+    elif args.command == "search":
+        kb = KnowledgeBase(args.index_dir, min_score=-1.0)
+        start_time = time.perf_counter()
+        results = kb.search(args.query, top_k=args.top_k)
+        print(f"{len(results)} hasil dalam {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        for result in results:
+            print(f"[{result['score']:.3f}] {result['document']}, bahagian {result['chunk'] + 1}: {result['text'][:200]!r}")
+    elif args.command == "status":
+        print(json.dumps(KnowledgeBase(args.index_dir).status(), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
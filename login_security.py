@@ -0,0 +1,142 @@
+"""Hash kata laluan bcrypt dalam kolam pekerja terhad dan pengehad cubaan log masuk.
+
+bcrypt sengaja perlahan (~250 ms pada kos 12). Kerja itu dijalankan dalam kolam thread
+bersaiz PASSWORD_HASH_WORKERS (bcrypt melepaskan GIL semasa mengira), jadi gelung acara
+FastAPI tidak tersekat dan ledakan log masuk tidak boleh menggunakan semua CPU.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# --- KONFIGURASI ---
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # Faktor kos untuk hash baru (4-31)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5")) # Cubaan gagal bagi setiap nama pengguna dalam tetingkap
+LOGIN_MAX_FAILURES_PER_CLIENT = int(os.getenv("LOGIN_MAX_FAILURES_PER_CLIENT", "50")) # Satu kelas mungkin berkongsi satu IP
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300")) # Saat
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hash_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+def _verify(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        return False # Hash rosak atau bukan bcrypt
+
+
+# --- VERSI SEGERAK (Streamlit) ---
+def hash_password(password, rounds=None):
+    return get_hash_executor().submit(_hash, password, rounds or BCRYPT_ROUNDS).result()
+
+def verify_password(password, hashed):
+    return get_hash_executor().submit(_verify, password, hashed).result()
+
+
+# --- VERSI ASYNC (FastAPI) ---
+async def async_hash_password(password, rounds=None):
+    return await asyncio.wrap_future(get_hash_executor().submit(_hash, password, rounds or BCRYPT_ROUNDS))
+
+async def async_verify_password(password, hashed):
+    return await asyncio.wrap_future(get_hash_executor().submit(_verify, password, hashed))
+
+
+# --- PENGEHAD CUBAAN LOG MASUK ---
+class LoginRateLimitError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Terlalu banyak cubaan log masuk. Cuba lagi dalam {retry_after} saat.")
+        self.retry_after = retry_after
+
+
+class LoginRateLimiter:
+    """Mengira cubaan gagal dalam tetingkap gelongsor bagi setiap kunci ("user:<nama>", "client:<ip>").
+    Semakan dibuat sebelum bcrypt dijalankan, jadi cubaan yang disekat tidak menggunakan CPU.
+    check() terus menempah cubaan itu sebagai kegagalan, supaya cubaan serentak yang masih menunggu
+    bcrypt turut dikira; release() membatalkan tempahan apabila log masuk berjaya."""
+    def __init__(self, window=LOGIN_FAILURE_WINDOW):
+        self.window = window
+        self._failures = {} # kunci -> deque masa kegagalan (termasuk cubaan yang sedang disemak)
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _prune_locked(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and now - failures[0] > self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def _sweep_locked(self, now):
+        # Kunci yang tidak disemak lagi (cth. nama pengguna rawak) dibuang sekali bagi setiap tetingkap
+        if now - self._swept_at < self.window:
+            return
+        self._swept_at = now
+        for key in list(self._failures):
+            self._prune_locked(key, now)
+
+    def check(self, limits):
+        """'limits' ialah {kunci: had}. Membangkitkan LoginRateLimitError jika mana-mana kunci melebihi had;
+        jika tidak, cubaan ditempah pada setiap kunci dan masa tempahan dikembalikan untuk release()."""
+        now = time.monotonic()
+        retry_after = 0
+        with self._lock:
+            self._sweep_locked(now)
+            for key, limit in limits.items():
+                failures = self._prune_locked(key, now)
+                if failures is not None and len(failures) >= limit:
+                    retry_after = max(retry_after, failures[-limit] + self.window - now)
+            if retry_after <= 0:
+                for key in limits:
+                    self._failures.setdefault(key, deque()).append(now)
+        if retry_after > 0:
+            raise LoginRateLimitError(max(1, math.ceil(retry_after)))
+        return now
+
+    def release(self, keys, attempt):
+        """Membatalkan tempahan check() (log masuk berjaya); cubaan yang gagal dibiarkan dikira."""
+        with self._lock:
+            for key in keys:
+                failures = self._failures.get(key)
+                if failures is None:
+                    continue
+                try:
+                    failures.remove(attempt)
+                except ValueError:
+                    pass # Sudah luput dari tetingkap
+                if not failures:
+                    del self._failures[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+def login_limits(username, client=None):
+    """Had lalai bagi satu cubaan log masuk: nama pengguna dan (jika diketahui) alamat klien."""
+    limits = {f"user:{username}": LOGIN_MAX_FAILURES}
+    if client:
+        limits[f"client:{client}"] = LOGIN_MAX_FAILURES_PER_CLIENT
+    return limits
@@ -0,0 +1,96 @@
+"""Memastikan model yang kerap digunakan sentiasa dimuatkan dalam Ollama.
+
+Semasa aplikasi bermula, setiap model yang dikonfigurasi dipanaskan dengan satu permintaan
+kecil (num_predict=1). Ini memuatkan model dan mengisi cache KV dengan SYSTEM dari Modelfile,
+jadi pelajar pertama hari itu tidak menunggu model dimuatkan. Thread latar belakang kemudian
+menyemak /api/ps secara berkala dan memanaskan semula model yang telah dipunggah.
+"""
+import os
+import threading
+import time
+
+import ollama_client
+
+# --- KONFIGURASI ---
+OLLAMA_PREWARM_MODELS = [m.strip() for m in os.getenv("OLLAMA_PREWARM_MODELS", "").split(",") if m.strip()]
+OLLAMA_RESIDENCY_CHECK_INTERVAL = float(os.getenv("OLLAMA_RESIDENCY_CHECK_INTERVAL", "300")) # Saat; 0 = panaskan sekali sahaja
+PREWARM_PROMPT = "Hai"
+
+
+def configured_models(default_model=None):
+    """Model untuk dipanaskan: OLLAMA_PREWARM_MODELS, kemudian OLLAMA_PINNED_MODELS, kemudian model lalai aplikasi."""
+    models = list(OLLAMA_PREWARM_MODELS or ollama_client.OLLAMA_PINNED_MODELS)
+    if not models and default_model:
+        models = [default_model]
+    return models
+
+def _is_loaded(model, running_models):
+    for running in running_models:
+        name = running.get("name") or running.get("model") or ""
+        if name == model or name == f"{model}:latest":
+            return True
+    return False
+
+
+class ModelResidencyManager:
+    def __init__(self, models, check_interval=OLLAMA_RESIDENCY_CHECK_INTERVAL, scheduler=None):
+        self.models = list(models)
+        self.check_interval = check_interval
+        self.scheduler = scheduler # Jika diberi, pemanasan mematuhi had serentak model
+        self._status = {model: {"loaded": False, "last_warmed": None, "warm_time": None, "error": None} for model in self.models}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def prewarm(self, model):
+        start_time = time.time()
+        try:
+            messages = [{"role": "user", "content": PREWARM_PROMPT}]
+            if self.scheduler is not None:
+                with self.scheduler.slot(model, "__prewarm__"):
+                    ollama_client.chat(messages, model, options={"num_predict": 1})
+            else:
+                ollama_client.chat(messages, model, options={"num_predict": 1})
+        except Exception as e:
+            self._update(model, loaded=False, error=str(e))
+            return False
+        self._update(model, loaded=True, last_warmed=time.time(), warm_time=round(time.time() - start_time, 3), error=None)
+        return True
+
+    def check(self):
+        """Memanaskan model yang tidak lagi dimuatkan. Jika /api/ps gagal, semua model dipanaskan."""
+        try:
+            running = ollama_client.list_running_models()
+        except Exception:
+            running = []
+        for model in self.models:
+            if self._stop.is_set():
+                return
+            if _is_loaded(model, running):
+                self._update(model, loaded=True)
+            else:
+                self.prewarm(model)
+
+    def _update(self, model, **fields):
+        with self._lock:
+            self._status.setdefault(model, {}).update(fields)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            if self.check_interval <= 0:
+                return
+            self._stop.wait(self.check_interval)
+
+    def start(self):
+        if self._thread is None and self.models:
+            self._thread = threading.Thread(target=self._run, name="model-residency", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return {model: dict(info) for model, info in self._status.items()}
@@ -0,0 +1,140 @@
+"""Penanda aras OCR: masa dan ketepatan aksara bagi set fixture, dengan dan tanpa pra-pemprosesan.
+
+Fixture ialah fail imej dengan teks sebenar dalam fail .txt yang sama nama, contohnya
+papan_putih_1.jpg + papan_putih_1.txt. Set sintetik (foto papan putih 4000 px yang condong,
+berbayang dan bising) boleh dijana dengan --generate.
+
+    python ocr_benchmark.py --generate 5
+    python ocr_benchmark.py --fixtures ocr_fixtures --repeat 3
+
+Ketepatan aksara = 1 - (jarak Levenshtein / panjang teks sebenar), selepas ruang kosong dinormalkan.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+import ocr_pipeline
+from file_extraction import IMAGE_EXTENSIONS
+
+# --- KONFIGURASI ---
+BENCHMARK_FIXTURE_DIR = os.getenv("OCR_BENCHMARK_FIXTURE_DIR", "ocr_fixtures")
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")
+SAMPLE_LINES = [
+    "Hukum Newton kedua: daya sama dengan jisim darab pecutan, F = ma.",
+    "Tenaga kinetik bagi jasad yang bergerak ialah E = 1/2 mv^2.",
+    "Fotosintesis menukar tenaga cahaya kepada tenaga kimia dalam glukosa.",
+    "The pH of a strong acid such as HCl is close to 1.",
+    "Ohm's law states that V = IR for an ideal resistor.",
+    "Halaju ialah kadar perubahan sesaran terhadap masa.",
+    "Kepekatan larutan diukur dalam mol per desimeter padu.",
+    "Acceleration due to gravity is approximately 9.81 m/s^2.",
+    "Luas bulatan ialah pi darab jejari kuasa dua.",
+    "Electrons occupy orbitals in order of increasing energy.",
+]
+
+
+def normalise(text):
+    return " ".join(text.split())
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+def char_accuracy(predicted, expected):
+    predicted, expected = normalise(predicted), normalise(expected)
+    if not expected:
+        return 1.0 if not predicted else 0.0
+    return max(0.0, 1 - edit_distance(predicted, expected) / len(expected))
+
+
+def generate_fixtures(directory, count, seed=0):
+    """Menjana 'count' foto papan putih sintetik (JPEG 4000x3000) bersama teks sebenar."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    font = ImageFont.truetype(FONT_PATH, 72)
+    for index in range(1, count + 1):
+        lines = rng.sample(SAMPLE_LINES, 8)
+        # Pencahayaan tidak sekata: kecerunan dari kiri atas ke kanan bawah
+        gradient = np.add.outer(np.linspace(0, 50, 3000), np.linspace(0, 40, 4000))
+        image = Image.fromarray((245 - gradient).astype(np.uint8), mode="L")
+        draw = ImageDraw.Draw(image)
+        for row, line in enumerate(lines):
+            draw.text((250, 350 + row * 280), line, fill=rng.randint(20, 60), font=font)
+        image = image.rotate(rng.uniform(-5, 5), resample=Image.Resampling.BILINEAR, fillcolor=220)
+        noise = np.random.default_rng(seed + index).normal(0, 12, (3000, 4000))
+        image = Image.fromarray(np.clip(np.asarray(image, dtype=np.float64) + noise, 0, 255).astype(np.uint8), mode="L")
+        image = image.filter(ImageFilter.GaussianBlur(1.2)).convert("RGB")
+        name = f"papan_putih_{index}"
+        image.save(os.path.join(directory, f"{name}.jpg"), quality=85)
+        with open(os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return count
+
+def load_fixtures(directory):
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        truth_path = os.path.join(directory, f"{stem}.txt")
+        if ext.lower() in IMAGE_EXTENSIONS and os.path.exists(truth_path):
+            with open(truth_path, "r", encoding="utf-8") as f:
+                fixtures.append((name, os.path.join(directory, name), f.read()))
+    return fixtures
+
+def run_once(path, preprocess_image, langs, psm):
+    start_time = time.perf_counter()
+    with Image.open(path) as image:
+        text = ocr_pipeline.ocr_image(image, preprocess_image=preprocess_image, langs=langs, psm=psm)
+    return time.perf_counter() - start_time, text
+
+def run_benchmark(fixtures, modes, repeat=1, langs=ocr_pipeline.OCR_LANGS, psm=ocr_pipeline.OCR_PSM):
+    """Mengembalikan {mod: [(fixture, median saat, ketepatan)]}."""
+    results = {mode: [] for mode in modes}
+    for name, path, truth in fixtures:
+        for mode in modes:
+            timings, text = [], ""
+            for _ in range(max(1, repeat)):
+                elapsed, text = run_once(path, mode == "preprocessed", langs, psm)
+                timings.append(elapsed)
+            results[mode].append((name, statistics.median(timings), char_accuracy(text, truth)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Penanda aras masa dan ketepatan OCR STEMBot")
+    parser.add_argument("--fixtures", default=BENCHMARK_FIXTURE_DIR)
+    parser.add_argument("--generate", type=int, default=0, metavar="N", help="Jana N fixture sintetik sebelum penanda aras")
+    parser.add_argument("--modes", default="raw,preprocessed", help="Senarai mod: raw, preprocessed")
+    parser.add_argument("--repeat", type=int, default=1, help="Ulangan bagi setiap imej (median dilaporkan)")
+    parser.add_argument("--langs", default=ocr_pipeline.OCR_LANGS)
+    parser.add_argument("--psm", type=int, default=ocr_pipeline.OCR_PSM)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_fixtures(args.fixtures, args.generate)
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        parser.error(f"Tiada fixture (imej + .txt) dalam '{args.fixtures}'. Guna --generate N untuk menjana set sintetik.")
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    results = run_benchmark(fixtures, modes, args.repeat, args.langs, args.psm)
+
+    print(f"{'Fixture':<28}" + "".join(f"{mode + ' (s)':>18}{mode + ' (%)':>18}" for mode in modes))
+    for row, (name, _, _) in enumerate(fixtures):
+        print(f"{name:<28}" + "".join(f"{results[mode][row][1]:>18.3f}{results[mode][row][2] * 100:>18.1f}" for mode in modes))
+    summary = {mode: (statistics.mean(r[1] for r in results[mode]), statistics.mean(r[2] for r in results[mode])) for mode in modes}
+    print(f"{'Purata':<28}" + "".join(f"{summary[mode][0]:>18.3f}{summary[mode][1] * 100:>18.1f}" for mode in modes))
+    if "raw" in summary and "preprocessed" in summary and summary["preprocessed"][0] > 0:
+        print(f"Kelajuan: {summary['raw'][0] / summary['preprocessed'][0]:.2f}x, "
+              f"perubahan ketepatan: {(summary['preprocessed'][1] - summary['raw'][1]) * 100:+.1f} mata peratus")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Pra-pemprosesan imej dan panggilan Tesseract untuk OCR (imej yang dimuat naik dan halaman PDF imbasan).
+
+Foto telefon papan putih (~4000 px) lambat dan kurang tepat jika dihantar terus ke Tesseract.
+Sebelum OCR, imej:
+  1. dipusingkan mengikut EXIF dan dinyahkod terus sebagai skala kelabu; JPEG dikecilkan semasa
+     penyahkodan (draft), jadi piksel penuh tidak pernah dinyahkod,
+  2. dikecilkan kepada OCR_TARGET_DPI jika DPI diketahui, atau jika tidak, paling panjang OCR_MAX_SIDE piksel,
+  3. diratakan latar belakangnya (pencahayaan tidak sekata) dan diperduakan dengan ambang Otsu,
+  4. diluruskan (deskew) dengan profil unjuran baris piksel dakwat.
+Bahasa (OCR_LANGS, cth. "msa+eng") dan mod segmentasi halaman (OCR_PSM) boleh dikonfigurasi;
+bahasa yang tiada pek traineddata dipasang diabaikan dengan amaran.
+Lihat ocr_benchmark.py untuk mengukur masa dan ketepatan.
+"""
+import os
+import threading
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageFilter, ImageOps
+
+# --- KONFIGURASI ---
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "") # Contoh: r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+OCR_LANGS = os.getenv("OCR_LANGS", "msa+eng") # Pek bahasa Tesseract, dipisahkan '+'
+OCR_PSM = int(os.getenv("OCR_PSM", "3")) # 3 = automatik penuh; 6 = satu blok teks seragam; 11 = teks jarang
+OCR_OEM = int(os.getenv("OCR_OEM", "1")) # 1 = enjin LSTM sahaja
+OCR_PREPROCESS_ENABLED = os.getenv("OCR_PREPROCESS_ENABLED", "1") == "1"
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300")) # Imej dengan DPI lebih tinggi dikecilkan ke nilai ini
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000")) # Piksel; foto telefon 4000 px dinyahkod terus pada separuh saiz
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "1") == "1"
+OCR_DESKEW = os.getenv("OCR_DESKEW", "1") == "1"
+OCR_DESKEW_MAX_ANGLE = float(os.getenv("OCR_DESKEW_MAX_ANGLE", "10")) # Darjah
+DESKEW_SAMPLE_POINTS = 20000 # Piksel dakwat yang disampel untuk menganggar sudut
+DESKEW_MIN_ANGLE = 0.3 # Sudut lebih kecil tidak dibetulkan (putaran ada kos dan mengaburkan teks)
+
+if TESSERACT_CMD:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+_resolved_langs = {} # OCR_LANGS -> pek yang dipasang; disemak sekali bagi setiap proses
+_langs_lock = threading.Lock()
+
+
+def tesseract_langs(langs=OCR_LANGS):
+    """'langs' ditapis kepada pek bahasa yang dipasang ('' = lalai Tesseract)."""
+    with _langs_lock:
+        if langs not in _resolved_langs:
+            requested = [lang for lang in langs.split("+") if lang]
+            try:
+                installed = set(pytesseract.get_languages(config=""))
+            except (pytesseract.TesseractError, pytesseract.TesseractNotFoundError, OSError):
+                installed = set(requested) # Biarkan image_to_string melaporkan ralat sebenar
+            missing = [lang for lang in requested if lang not in installed]
+            if missing:
+                print(f"Pek bahasa Tesseract tidak dipasang (diabaikan): {', '.join(missing)}")
+            _resolved_langs[langs] = "+".join(lang for lang in requested if lang in installed)
+        return _resolved_langs[langs]
+
+def tesseract_config(psm=OCR_PSM, oem=OCR_OEM):
+    return f"--oem {oem} --psm {psm}"
+
+
+# --- PRA-PEMPROSESAN ---
+def _scale_for(size, dpi):
+    # Jika resolusi diketahui (halaman PDF, imbasan), ia sahaja yang menentukan saiz; jika tidak, sisi terpanjang
+    if dpi:
+        return min(1.0, OCR_TARGET_DPI / dpi)
+    longest = max(size)
+    return min(1.0, OCR_MAX_SIDE / longest) if OCR_MAX_SIDE and longest else 1.0
+
+def _image_dpi(image):
+    dpi = image.info.get("dpi")
+    if isinstance(dpi, (tuple, list)) and dpi:
+        dpi = dpi[0]
+    try:
+        dpi = float(dpi or 0)
+    except (TypeError, ValueError):
+        return None
+    return dpi if dpi > 72 else None # 72 ialah nilai lalai kebanyakan kamera, bukan resolusi sebenar
+
+def to_grayscale(image, dpi=None):
+    """Skala kelabu, dipusingkan mengikut EXIF dan dikecilkan. 'image' sebaik-baiknya belum dimuatkan
+    (Image.open) supaya JPEG boleh dinyahkod terus pada saiz yang lebih kecil."""
+    scale = _scale_for(image.size, dpi or _image_dpi(image))
+    target_side = max(image.size) * scale
+    if scale < 1 and image.format == "JPEG":
+        # Skala DCT (1/2, 1/4, 1/8) yang masih sekurang-kurangnya saiz sasaran; baki dikecilkan di bawah
+        image.draft("L", (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        # Latar lutsinar menjadi putih, bukan hitam
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+        image = background
+    if image.mode != "L":
+        image = image.convert("L")
+    if max(image.size) > target_side + 1:
+        factor = target_side / max(image.size)
+        size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+        image = image.resize(size, Image.Resampling.BOX) # Cukup untuk OCR dan jauh lebih pantas dari LANCZOS
+    return image
+
+def _otsu_threshold(values):
+    histogram = np.bincount(values.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    total, total_mean = weights[-1], means[-1]
+    background = total - weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * weights - means * total) ** 2 / (weights * background)
+    return int(np.nanargmax(between[:-1]))
+
+def binarize(gray):
+    """Meratakan pencahayaan (bahagi dengan latar yang dikaburkan) kemudian ambang Otsu."""
+    # Latar dianggar pada imej 1/8 saiz kemudian dibesarkan semula: pencahayaan berubah perlahan
+    factor = max(1, min(8, min(gray.size) // 64))
+    small = gray.reduce(factor)
+    small = small.filter(ImageFilter.BoxBlur(max(2, max(small.size) // 40)))
+    background = np.asarray(small.resize(gray.size, Image.Resampling.BILINEAR), dtype=np.float32)
+    flattened = np.asarray(gray, dtype=np.float32) / np.maximum(background, 1.0)
+    flattened = np.clip(flattened * 255.0, 0, 255).astype(np.uint8)
+    threshold = _otsu_threshold(flattened)
+    return Image.fromarray(np.where(flattened > threshold, 255, 0).astype(np.uint8), mode="L")
+
+def estimate_skew(binary, max_angle=OCR_DESKEW_MAX_ANGLE):
+    """Sudut condong (darjah) yang memaksimumkan ketajaman profil baris bagi piksel dakwat."""
+    ys, xs = np.nonzero(np.asarray(binary) < 128)
+    if len(xs) < 100:
+        return 0.0
+    if len(xs) > DESKEW_SAMPLE_POINTS:
+        pick = np.random.default_rng(0).choice(len(xs), DESKEW_SAMPLE_POINTS, replace=False)
+        xs, ys = xs[pick], ys[pick]
+    xs = xs.astype(np.float64)
+    ys = ys.astype(np.float64)
+
+    def score(angle):
+        radians = np.deg2rad(angle)
+        rows = ys * np.cos(radians) - xs * np.sin(radians)
+        histogram = np.bincount((rows - rows.min()).astype(np.int64))
+        return float(np.dot(histogram, histogram))
+
+    # Carian kasar (1 darjah) kemudian halus (0.1 darjah) di sekitar sudut terbaik
+    best = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=score)
+    best = max(np.arange(best - 1.0, best + 1.05, 0.1), key=score)
+    return float(best)
+
+def deskew(binary, max_angle=OCR_DESKEW_MAX_ANGLE):
+    angle = estimate_skew(binary, max_angle)
+    if abs(angle) < DESKEW_MIN_ANGLE:
+        return binary
+    # Profil baris paling tajam pada 'angle'; putaran PIL yang sama (positif = lawan jam) meluruskan teks
+    return binary.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=255)
+
+def preprocess(image, dpi=None):
+    """Imej sedia untuk Tesseract: skala kelabu, dikecilkan, diperduakan dan diluruskan mengikut konfigurasi."""
+    gray = to_grayscale(image, dpi)
+    if OCR_BINARIZE:
+        gray = binarize(gray)
+        if OCR_DESKEW:
+            gray = deskew(gray)
+    return gray
+
+
+def ocr_image(image, dpi=None, preprocess_image=OCR_PREPROCESS_ENABLED, langs=OCR_LANGS, psm=OCR_PSM):
+    """Teks dari imej PIL. 'dpi' diberi bagi halaman PDF yang dirasterkan (resolusi diketahui)."""
+    if preprocess_image:
+        image = preprocess(image, dpi)
+    return pytesseract.image_to_string(image, lang=tesseract_langs(langs) or None, config=tesseract_config(psm))
@@ -0,0 +1,330 @@
+"""Klien Ollama dikongsi oleh aplikasi Streamlit dan backend FastAPI.
+
+Versi segerak menggunakan satu requests.Session dengan kolam sambungan keep-alive,
+manakala versi asyncio (httpx) digunakan oleh backend supaya gelung acara tidak tersekat.
+"""
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- KONFIGURASI ---
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "10")) # Saat untuk membuka sambungan
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "600")) # Saat menunggu data dari Ollama
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5")) # Faktor backoff eksponen (saat)
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "20")) # Sambungan keep-alive maksimum
+RETRY_STATUS_CODES = (502, 503, 504)
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text") # Model untuk /api/embed
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m") # Tempoh model kekal dalam memori selepas permintaan terakhir
+OLLAMA_PINNED_MODELS = [m.strip() for m in os.getenv("OLLAMA_PINNED_MODELS", "").split(",") if m.strip()] # Tidak dipunggah (keep_alive=-1)
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0")) # 0 = ikut Modelfile; nilai tetap elak model dimuat semula
+
+THINK_START_TAG = "<think>"
+THINK_END_TAG = "</think>"
+
+_session = None
+_session_lock = threading.Lock()
+_async_client = None
+_capabilities = {} # model -> set keupayaan dari /api/show (tidak berubah selagi model sama)
+_capabilities_lock = threading.Lock()
+
+
+class OllamaStreamError(RuntimeError):
+    """Ollama menghantar {"error": ...} di tengah strim (cth. model kehabisan memori)."""
+    pass
+
+
+# --- KLIEN SEGERAK (Streamlit) ---
+def get_session():
+    """Mengembalikan requests.Session dikongsi dengan kolam sambungan dan cubaan semula."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # Hanya cuba semula ralat sambungan dan status 502/503/504; ralat semasa membaca
+                # tidak diulang kerana Ollama mungkin sudah separuh jalan menjana jawapan.
+                retry = Retry(
+                    total=OLLAMA_MAX_RETRIES,
+                    connect=OLLAMA_MAX_RETRIES,
+                    read=0,
+                    status=OLLAMA_MAX_RETRIES,
+                    backoff_factor=OLLAMA_RETRY_BACKOFF,
+                    status_forcelist=RETRY_STATUS_CODES,
+                    allowed_methods=None, # Benarkan POST diulang
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=OLLAMA_POOL_SIZE, pool_maxsize=OLLAMA_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def _timeout(read_timeout=None):
+    return (OLLAMA_CONNECT_TIMEOUT, read_timeout if read_timeout is not None else OLLAMA_READ_TIMEOUT)
+
+def list_models(timeout=10):
+    """Mendapatkan senarai nama model yang tersedia (disusun)."""
+    response = get_session().get(f"{OLLAMA_BASE_URL}/api/tags", timeout=_timeout(timeout))
+    response.raise_for_status()
+    return sorted(model["name"] for model in response.json().get("models", []))
+
+def list_running_models(timeout=10):
+    """Model yang sedang dimuatkan dalam memori (/api/ps)."""
+    response = get_session().get(f"{OLLAMA_BASE_URL}/api/ps", timeout=_timeout(timeout))
+    response.raise_for_status()
+    return response.json().get("models", [])
+
+def _parse_capabilities(data):
+    capabilities = set(data.get("capabilities") or [])
+    if not capabilities:
+        # Ollama lama tiada medan 'capabilities': model visi dikenali melalui projektor/keluarga CLIP
+        capabilities.add("completion")
+        families = (data.get("details") or {}).get("families") or []
+        if data.get("projector_info") or "clip" in families or "mllama" in families:
+            capabilities.add("vision")
+    return capabilities
+
+def _cached_capabilities(model):
+    with _capabilities_lock:
+        return _capabilities.get(model)
+
+def _store_capabilities(model, data):
+    capabilities = _parse_capabilities(data)
+    with _capabilities_lock:
+        _capabilities[model] = capabilities
+    return capabilities
+
+def model_capabilities(model, timeout=10):
+    """Keupayaan model (cth. {"completion", "vision"}) dari /api/show, dicache bagi setiap proses."""
+    capabilities = _cached_capabilities(model)
+    if capabilities is None:
+        response = get_session().post(f"{OLLAMA_BASE_URL}/api/show", json={"model": model}, timeout=_timeout(timeout))
+        response.raise_for_status()
+        capabilities = _store_capabilities(model, response.json())
+    return capabilities
+
+def keep_alive_for(model):
+    return -1 if model in OLLAMA_PINNED_MODELS else OLLAMA_KEEP_ALIVE
+
+def default_options():
+    # Pilihan yang sama pada setiap permintaan: num_ctx yang berbeza memaksa Ollama memuat semula model
+    return {"num_ctx": OLLAMA_NUM_CTX} if OLLAMA_NUM_CTX > 0 else {}
+
+def build_chat_payload(messages, model, stream, **extra):
+    payload = {"model": model, "messages": messages, "stream": stream, "keep_alive": keep_alive_for(model)}
+    options = default_options()
+    options.update(extra.pop("options", None) or {})
+    if options:
+        payload["options"] = options
+    payload.update({key: value for key, value in extra.items() if value is not None})
+    return payload
+
+def chat(messages, model, read_timeout=None, **extra):
+    """Panggilan /api/chat tanpa strim. Mengembalikan JSON penuh dari Ollama."""
+    payload = build_chat_payload(messages, model, False, **extra)
+    response = get_session().post(f"{OLLAMA_BASE_URL}/api/chat", json=payload, timeout=_timeout(read_timeout))
+    response.raise_for_status()
+    return response.json()
+
+def stream_chat(messages, model, read_timeout=None, **extra):
+    """Panggilan /api/chat dengan strim. Menghasilkan setiap chunk JSON sehingga 'done'.
+    Membangkitkan OllamaStreamError jika Ollama melaporkan ralat di tengah strim."""
+    payload = build_chat_payload(messages, model, True, **extra)
+    with get_session().post(f"{OLLAMA_BASE_URL}/api/chat", json=payload, stream=True, timeout=_timeout(read_timeout)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line.decode("utf-8"))
+            except json.JSONDecodeError:
+                continue
+            if chunk.get("error"):
+                raise OllamaStreamError(chunk["error"])
+            yield chunk
+            if chunk.get("done"):
+                break
+
+
+# --- KLIEN ASYNC (FastAPI) ---
+def get_async_client():
+    """Mengembalikan httpx.AsyncClient dikongsi. Mesti dipanggil dari dalam gelung acara."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_POOL_SIZE, max_keepalive_connections=OLLAMA_POOL_SIZE),
+        )
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+def _retry_delay(attempt):
+    return OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+
+async def _async_send(method, path, stream=False, **kwargs):
+    """Menghantar permintaan dengan cubaan semula (backoff eksponen) untuk ralat sambungan dan 502/503/504."""
+    client = get_async_client()
+    attempt = 0
+    while True:
+        try:
+            request = client.build_request(method, path, **kwargs)
+            response = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt >= OLLAMA_MAX_RETRIES:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= OLLAMA_MAX_RETRIES:
+                return response
+            await response.aclose()
+        await asyncio.sleep(_retry_delay(attempt))
+        attempt += 1
+
+async def async_list_models():
+    response = await _async_send("GET", "/api/tags", timeout=httpx.Timeout(10, connect=OLLAMA_CONNECT_TIMEOUT))
+    response.raise_for_status()
+    return sorted(model["name"] for model in response.json().get("models", []))
+
+async def async_model_capabilities(model):
+    capabilities = _cached_capabilities(model)
+    if capabilities is None:
+        response = await _async_send("POST", "/api/show", json={"model": model}, timeout=httpx.Timeout(10, connect=OLLAMA_CONNECT_TIMEOUT))
+        response.raise_for_status()
+        capabilities = _store_capabilities(model, response.json())
+    return capabilities
+
+async def async_chat(messages, model, **extra):
+    """Versi async bagi chat(). Mengembalikan JSON penuh dari Ollama."""
+    response = await _async_send("POST", "/api/chat", json=build_chat_payload(messages, model, False, **extra))
+    response.raise_for_status()
+    return response.json()
+
+async def async_stream_chat(messages, model, **extra):
+    """Versi async bagi stream_chat(). Menutup sambungan (dan membatalkan penjanaan) jika penjana ditutup awal."""
+    response = await _async_send("POST", "/api/chat", stream=True, json=build_chat_payload(messages, model, True, **extra))
+    try:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if chunk.get("error"):
+                raise OllamaStreamError(chunk["error"])
+            yield chunk
+            if chunk.get("done"):
+                break
+    finally:
+        await response.aclose()
+
+
+# --- PEMPROSESAN RESPONS ---
+class ThinkTagSplitter:
+    """Memisahkan blok <think>...</think> dari jawapan secara berperingkat semasa chunk strim tiba."""
+    def __init__(self):
+        self.thinking_parts = []
+        self.answer_parts = []
+        self._pending = ""
+        self._in_think = False
+        self._think_closed = False
+
+    def feed(self, piece):
+        text = self._pending + piece
+        self._pending = ""
+        while text:
+            if self._think_closed:
+                self.answer_parts.append(text)
+                return
+            tag = THINK_END_TAG if self._in_think else THINK_START_TAG
+            tag_index = text.find(tag)
+            if tag_index >= 0:
+                self._append(text[:tag_index])
+                text = text[tag_index + len(tag):]
+                if self._in_think:
+                    self._think_closed = True
+                self._in_think = not self._in_think
+                continue
+            # Tag mungkin terpecah antara dua chunk; simpan hujung yang sepadan dengan awalan tag
+            keep = 0
+            for size in range(min(len(tag) - 1, len(text)), 0, -1):
+                if tag.startswith(text[-size:]):
+                    keep = size
+                    break
+            self._append(text[:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            return
+
+    def feed_chunk(self, chunk):
+        """Memproses satu chunk /api/chat. Mengembalikan True jika chunk membawa token."""
+        message = chunk.get("message") if isinstance(chunk.get("message"), dict) else {}
+        thinking_piece = message.get("thinking", "") # Model yang menyokong medan 'thinking' secara asli
+        content_piece = message.get("content", "")
+        if thinking_piece:
+            self.thinking_parts.append(thinking_piece)
+        if content_piece:
+            self.feed(content_piece)
+        return bool(thinking_piece or content_piece)
+
+    def finish(self):
+        if self._pending:
+            self._append(self._pending)
+            self._pending = ""
+
+    def _append(self, text):
+        if text:
+            (self.thinking_parts if self._in_think else self.answer_parts).append(text)
+
+    @property
+    def thinking(self):
+        return "".join(self.thinking_parts).strip()
+
+    @property
+    def answer(self):
+        return "".join(self.answer_parts).strip()
+
+def compute_stream_stats(start_time, first_token_time, end_time, chunk_count, final_chunk):
+    """Mengira masa ke token pertama dan kadar token/saat bagi satu respons strim."""
+    stats = {"time_to_first_token": None, "tokens_per_second": None, "token_count": chunk_count}
+    if first_token_time is not None:
+        stats["time_to_first_token"] = first_token_time - start_time
+    eval_count = final_chunk.get("eval_count")
+    eval_duration = final_chunk.get("eval_duration") # Nanosaat
+    if eval_count and eval_duration:
+        stats["token_count"] = eval_count
+        stats["tokens_per_second"] = eval_count / (eval_duration / 1e9)
+    elif first_token_time is not None and end_time > first_token_time and chunk_count:
+        # Anggaran kasar: satu chunk Ollama biasanya satu token
+        stats["tokens_per_second"] = chunk_count / (end_time - first_token_time)
+    return stats
+
+
+# --- EMBEDDING ---
+def embed(texts, model=None, read_timeout=None):
+    """Mendapatkan vektor embedding bagi senarai teks melalui /api/embed."""
+    model = model or OLLAMA_EMBED_MODEL
+    payload = {"model": model, "input": list(texts), "keep_alive": keep_alive_for(model)}
+    response = get_session().post(f"{OLLAMA_BASE_URL}/api/embed", json=payload, timeout=_timeout(read_timeout))
+    response.raise_for_status()
+    return response.json().get("embeddings", [])
+
+async def async_embed(texts, model=None):
+    model = model or OLLAMA_EMBED_MODEL
+    payload = {"model": model, "input": list(texts), "keep_alive": keep_alive_for(model)}
+    response = await _async_send("POST", "/api/embed", json=payload)
+    response.raise_for_status()
+    return response.json().get("embeddings", [])
@@ -0,0 +1,439 @@
+"""Enjin eksport PDF perbualan: fon, logo dan templat halaman disediakan sekali bagi setiap proses.
+
+Sebelum ini setiap eksport membina FPDF baharu, menghurai semula DejaVuSans.ttf dengan add_font,
+menyahkod semula logo dan melukis tera air pada halaman pertama sahaja. Di sini:
+  * fon DejaVu (biasa, tebal, condong, tebal-condong dan mono) dihurai sekali; setiap dokumen
+    mendapat salinan metrik yang dikongsi dan fail fon sendiri untuk subset semasa output,
+  * logo dinyahkod sekali dan maklumat imejnya disalin ke setiap dokumen,
+  * header (logo, garisan), tera air dan footer (nombor halaman) dilukis pada setiap halaman,
+  * kandungan ialah markdown ringkas: tajuk, senarai, blok kod, petikan, garisan mendatar,
+    **tebal**, *condong* dan `kod`.
+Susun atur baris dibuat sendiri dengan lebar glif yang disimpan dalam cache; multi_cell fpdf2
+mengukur semula keseluruhan baris bagi setiap aksara (kuadratik) dan terlalu perlahan untuk sesi
+ratusan mesej. Setiap baris ditulis terus ke aliran kandungan halaman sebagai satu objek teks.
+Beberapa langkah bergantung pada struktur dalaman fpdf2 (versinya disematkan dalam requirements.txt);
+jika struktur itu berubah, API awam yang lebih perlahan digunakan.
+"""
+import copy
+import io
+import os
+import re
+import threading
+
+from fontTools import ttLib
+from fpdf import FPDF # fpdf2: pip install fpdf2
+from fpdf.enums import PDFResourceType, TextEmphasis
+from fpdf.fonts import SubsetMap
+from fpdf.image_datastructures import ImageCache
+from fpdf.image_parsing import preload_image
+
+# --- KONFIGURASI ---
+PDF_FONT_DIR = os.getenv("PDF_FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+PDF_FONT_SIZE = float(os.getenv("PDF_FONT_SIZE", "11")) # Poin
+PDF_LINE_SPACING = 1.45 # Ketinggian baris sebagai gandaan saiz fon
+PDF_MARGIN = 15 # mm
+PDF_LOGO_WIDTH = 30 # mm
+PDF_WATERMARK_SIZE = 30 # Poin
+PDF_WATERMARK_COLOR = (220, 220, 220) # Kelabu sangat cair
+
+FONT_FAMILY = "DejaVuSans"
+MONO_FAMILY = "DejaVuSansMono"
+FONT_FILES = {
+    (FONT_FAMILY, ""): "DejaVuSans.ttf",
+    (FONT_FAMILY, "B"): "DejaVuSans-Bold.ttf",
+    (FONT_FAMILY, "I"): "DejaVuSans-Oblique.ttf",
+    (FONT_FAMILY, "BI"): "DejaVuSans-BoldOblique.ttf",
+    (MONO_FAMILY, ""): "DejaVuSansMono.ttf",
+    (MONO_FAMILY, "B"): "DejaVuSansMono-Bold.ttf",
+}
+FONT_KEYS = {f"{family.lower()}{style}": (family, style) for family, style in FONT_FILES} # Kunci fon fpdf2
+FALLBACK_FAMILIES = {FONT_FAMILY: "Helvetica", MONO_FAMILY: "Courier"} # Fon teras FPDF (Latin-1 sahaja)
+HEADING_SIZES = {1: 16, 2: 14, 3: 12.5} # Tahap lain menggunakan saiz 12
+CODE_BACKGROUND = (244, 244, 244)
+CODE_COLOR = (150, 30, 30)
+QUOTE_COLOR = (90, 90, 90)
+
+_font_prototypes = {} # (keluarga, gaya) -> (TTFFont yang telah dihurai, bait fail fon)
+_logo_infos = {} # laluan -> (mtime, maklumat imej FPDF, profil ICC)
+_assets_lock = threading.Lock()
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+BULLET_PATTERN = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+NUMBERED_PATTERN = re.compile(r"^(\s*)(\d{1,3}[.)])\s+(.*)$")
+RULE_PATTERN = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+INLINE_PATTERN = re.compile(
+    r"\*\*\*(?=\S)(.+?)(?<=\S)\*\*\*"
+    r"|(\*\*|__)(?=\S)(.+?)(?<=\S)\2"
+    r"|(?<![\w*])\*(?=\S)(.+?)(?<=\S)\*(?![\w*])"
+    r"|(?<![\w_])_(?=\S)(.+?)(?<=\S)_(?![\w_])"
+    r"|`([^`]+)`"
+)
+LABEL_PATTERN = re.compile(r"^([^\s:#`|>*_-][^:\n]{0,29}):\s+((?:#{1,6}\s|[-*+]\s|\d{1,3}[.)]\s|```|~~~|>|\|).*)$")
+TOKEN_PATTERN = re.compile(r"(\s*)(\S+)")
+
+
+# --- ASET (SEKALI BAGI SETIAP PROSES) ---
+def _font_prototype(family, style):
+    key = (family, style)
+    with _assets_lock:
+        if key not in _font_prototypes:
+            path = os.path.join(PDF_FONT_DIR, FONT_FILES[key])
+            with open(path, "rb") as f:
+                data = f.read()
+            scratch = FPDF()
+            scratch.add_font(family, style, path)
+            _font_prototypes[key] = (scratch.fonts[f"{family.lower()}{style}"], data)
+        return _font_prototypes[key]
+
+def _install_font(pdf, family, style):
+    """Menambah fon dari cache proses. Metrik (lebar glif, cmap) dikongsi antara dokumen; fail fon
+    dibuka semula bagi setiap dokumen kerana fpdf2 mengubah suai objek TTFont semasa membuat subset."""
+    prototype, data = _font_prototype(family, style)
+    try:
+        font = copy.copy(prototype)
+        font.i = len(pdf.fonts) + 1
+        font.ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, lazy=True)
+        font.subset = SubsetMap(font)
+        font.missing_glyphs = []
+        font.biggest_size_pt = 0
+        font._hbfont = None
+    except (AttributeError, TypeError):
+        # Struktur dalaman fpdf2 berubah: kembali kepada add_font biasa (lebih perlahan tetapi betul)
+        pdf.add_font(family, style, os.path.join(PDF_FONT_DIR, FONT_FILES[(family, style)]))
+        return
+    pdf.fonts[font.fontkey] = font
+
+def fonts_available():
+    return all(os.path.exists(os.path.join(PDF_FONT_DIR, name)) for name in FONT_FILES.values())
+
+def glyph_widths(family, style=""):
+    """Lebar glif (1/1000 em, diindeks dengan kod aksara) dari cache fon proses; juga digunakan oleh pptx_export.py."""
+    return _font_prototype(family, style)[0].cw
+
+def _logo_info(logo_path):
+    """Maklumat imej logo yang telah dinyahkod dan profil warna ICCnya (JPEG); dimuat semula hanya jika fail berubah."""
+    mtime = os.path.getmtime(logo_path)
+    with _assets_lock:
+        cached = _logo_infos.get(logo_path)
+        if cached is None or cached[0] != mtime:
+            image_cache = ImageCache()
+            _, _, info = preload_image(image_cache, logo_path)
+            cached = _logo_infos[logo_path] = (mtime, info, dict(image_cache.icc_profiles))
+        return cached[1], cached[2]
+
+
+# --- TEMPLAT HALAMAN ---
+class ChatPdf(FPDF):
+    """FPDF dengan header (logo), tera air dan footer pada setiap halaman."""
+
+    def __init__(self, logo_path=None, watermark_text=None):
+        super().__init__()
+        self.set_margins(PDF_MARGIN, PDF_MARGIN, PDF_MARGIN)
+        self.set_auto_page_break(False) # Pemecahan halaman diurus oleh PdfRenderer
+        self.unicode_fonts = fonts_available()
+        if not self.unicode_fonts:
+            print(f"Fon DejaVu tidak ditemui dalam '{PDF_FONT_DIR}'; PDF menggunakan fon teras (Latin-1 sahaja).")
+        self.logo_path = None
+        self.logo_height = 0
+        if logo_path and os.path.exists(logo_path):
+            try:
+                cached_info, icc_profiles = _logo_info(logo_path)
+            except Exception as e: # PIL/fpdf2 membangkitkan pelbagai jenis ralat bagi imej rosak
+                print(f"Gagal memuatkan logo PDF '{logo_path}': {e}")
+            else:
+                info = copy.copy(cached_info) # Salinan: indeks dan kiraan penggunaan adalah per dokumen
+                info["i"], info["usages"] = len(self.image_cache.images) + 1, 0
+                self.image_cache.images[logo_path] = info
+                self.image_cache.icc_profiles.update(icc_profiles) # Logo ialah imej pertama: indeks ICC kekal sama
+                self.logo_path = logo_path
+                self.logo_height = PDF_LOGO_WIDTH * info["h"] / info["w"]
+        self.watermark_text = self.clean_text(watermark_text or "")
+        self.alias_nb_pages()
+
+    def set_font(self, family=None, style="", size=0):
+        # Fon dipasang pada penggunaan pertama: hanya fon yang digunakan dibenamkan (dan disubset) dalam PDF.
+        # add_page() memulihkan fon dengan nama huruf kecil dan TextEmphasis.
+        if self.unicode_fonts and family:
+            letters = style.style if isinstance(style, TextEmphasis) else "".join(sorted(style.upper()))
+            font = FONT_KEYS.get(f"{family.lower()}{letters}")
+            if font is not None:
+                self.font_metrics(*font)
+        super().set_font(family, style, size)
+
+    def font_metrics(self, family, style):
+        fontkey = f"{family.lower()}{style}"
+        if fontkey not in self.fonts:
+            _install_font(self, family, style)
+        return self.fonts[fontkey]
+
+    def family(self, family):
+        return family if self.unicode_fonts else FALLBACK_FAMILIES[family]
+
+    def clean_text(self, text):
+        # Fon teras hanya menyokong Latin-1
+        return text if self.unicode_fonts else text.encode("latin-1", "replace").decode("latin-1")
+
+    def header(self):
+        if self.watermark_text:
+            # Dilukis dahulu supaya kandungan berada di atasnya
+            self.set_font(self.family(FONT_FAMILY), "B", PDF_WATERMARK_SIZE)
+            self.set_text_color(*PDF_WATERMARK_COLOR)
+            width = self.get_string_width(self.watermark_text)
+            with self.rotation(35, self.w / 2, self.h / 2):
+                self.text(self.w / 2 - width / 2, self.h / 2, self.watermark_text)
+            self.set_text_color(0, 0, 0)
+        top = 10
+        if self.logo_path:
+            self.image(self.logo_path, x=(self.w - PDF_LOGO_WIDTH) / 2, y=top, w=PDF_LOGO_WIDTH)
+            top += self.logo_height + 3
+        self.set_draw_color(200, 200, 200)
+        self.line(self.l_margin, top, self.w - self.r_margin, top)
+        self.set_draw_color(0, 0, 0)
+        self.set_y(top + 5)
+
+    def footer(self):
+        self.set_font(self.family(FONT_FAMILY), "", 8)
+        self.set_text_color(130, 130, 130)
+        # cell(), bukan text(): hanya cell() menggantikan alias jumlah halaman
+        self.set_xy(self.l_margin, self.h - 11)
+        self.cell(0, 5, f"Halaman {self.page_no()}/{self.str_alias_nb_pages}", align="R")
+        self.set_text_color(0, 0, 0)
+
+
+# --- SUSUN ATUR MARKDOWN ---
+def parse_inline(text):
+    """Senarai (teks, gaya, mono) bagi penanda inline markdown."""
+    runs, position = [], 0
+    for match in INLINE_PATTERN.finditer(text):
+        if match.start() > position:
+            runs.append((text[position:match.start()], "", False))
+        if match.group(1) is not None:
+            runs.append((match.group(1), "BI", False))
+        elif match.group(3) is not None:
+            runs.append((match.group(3), "B", False))
+        elif match.group(4) is not None or match.group(5) is not None:
+            runs.append((match.group(4) or match.group(5), "I", False))
+        else:
+            runs.append((match.group(6), "", True))
+        position = match.end()
+    if position < len(text):
+        runs.append((text[position:], "", False))
+    return runs
+
+class _SubsetCodes(dict):
+    """Kod aksara -> aksara bagi kod glif dalam subset fon dokumen, untuk str.translate(); setiap
+    aksara dipetakan dengan SubsetMap.pick() sekali sahaja (TTFFont.encode_text memetakan setiap aksara)."""
+    def __init__(self, subset):
+        super().__init__()
+        self.subset = subset
+
+    def __missing__(self, code):
+        mapped = self.subset.pick(code)
+        value = self[code] = None if mapped is None else chr(mapped) # None: glif tiada, aksara digugurkan
+        return value
+
+class PdfRenderer:
+    """Meletakkan blok markdown pada ChatPdf baris demi baris, dengan pemecahan halaman sendiri."""
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self._widths = {} # (keluarga, gaya, teks) -> lebar (mm) pada saiz 1 pt
+        self._direct_text = pdf.unicode_fonts
+        self._subset_codes = {} # indeks fon -> _SubsetCodes
+
+    def text_width(self, text, family, style, size):
+        key = (family, style, text)
+        width = self._widths.get(key)
+        if width is None:
+            pdf = self.pdf
+            if pdf.unicode_fonts:
+                widths = pdf.font_metrics(family, style).cw
+                width = sum(widths[ord(char)] for char in text) / 1000 / pdf.k
+            else:
+                pdf.set_font(pdf.family(family), style, size)
+                width = pdf.get_string_width(text) / size
+            self._widths[key] = width
+        return width * size
+
+    def ensure_space(self, height):
+        if self.pdf.get_y() + height > self.pdf.h - PDF_MARGIN:
+            self.pdf.add_page()
+
+    def wrap(self, runs, width, size, mono=False):
+        """Memecahkan runs kepada baris; setiap baris ialah senarai segmen [x, teks, gaya, keluarga].
+        Perkataan berturutan dengan gaya yang sama digabungkan menjadi satu segmen. Ruang antara
+        perkataan ditulis sebagai aksara ruang supaya teks PDF boleh disalin dan dicari.
+        Bagi kod (mono), ruang hadapan baris pertama dikekalkan sebagai inden."""
+        lines, segments, x = [], [], 0.0
+        pending_space = "" # Ruang di hujung run sebelumnya (cth. sebelum **tebal**)
+        text_width = self.text_width
+        for text, style, run_mono in runs:
+            family = MONO_FAMILY if (mono or run_mono) else FONT_FAMILY
+            style = style if family == FONT_FAMILY else ("B" if "B" in style else "")
+            for space, word in TOKEN_PATTERN.findall(text):
+                space, pending_space = pending_space + space, ""
+                word = self.pdf.clean_text(word)
+                keep_space = space and (segments or (mono and not lines))
+                space_width = text_width(space.replace("\t", " "), family, style, size) if keep_space else 0.0
+                word_width = text_width(word, family, style, size)
+                if segments and x + space_width + word_width > width:
+                    lines.append(segments)
+                    segments, x, space_width = [], 0.0, 0.0
+                while x + space_width + word_width > width and len(word) > 1:
+                    # Perkataan (cth. URL) lebih panjang daripada baris: dipotong mengikut aksara
+                    cut = max(1, int(len(word) * (width - x - space_width) / word_width))
+                    self._place(segments, x, space, space_width, word[:cut], style, family)
+                    lines.append(segments)
+                    segments, x, space_width = [], 0.0, 0.0
+                    word = word[cut:]
+                    word_width = text_width(word, family, style, size)
+                self._place(segments, x, space, space_width, word, style, family)
+                x += space_width + word_width
+            pending_space += text[len(text.rstrip()):]
+        if segments or not lines:
+            lines.append(segments)
+        return lines
+
+    @staticmethod
+    def _place(segments, x, space, space_width, word, style, family):
+        # Ruang di awal baris (inden kod) hanya menganjakkan kedudukan; di tengah baris ia menjadi aksara ruang
+        spaces = " " * len(space) if segments and space_width > 0.01 else ""
+        if segments and segments[-1][2] == style and segments[-1][3] == family:
+            segments[-1][1] += spaces + word
+        else:
+            segments.append([x if spaces else x + space_width, spaces + word, style, family])
+
+    def draw_lines(self, lines, left, size, color=(0, 0, 0), background=None, width=None):
+        pdf = self.pdf
+        line_height = size * PDF_LINE_SPACING / pdf.k
+        for segments in lines:
+            self.ensure_space(line_height)
+            y = pdf.get_y()
+            if background is not None:
+                pdf.set_fill_color(*background)
+                pdf.rect(left - 1.5, y, width + 3, line_height, style="F")
+            self.draw_text(left, y + line_height * 0.72, segments, size, color)
+            pdf.set_y(y + line_height)
+
+    def draw_text(self, left, baseline, merged, size, color=(0, 0, 0)):
+        """Melukis segmen (x, teks, gaya, keluarga) satu baris sebagai satu objek teks PDF.
+
+        FPDF.text() menyemak halaman, menormalkan teks dan menukar fon bagi setiap segmen; di sini baris
+        ditulis terus ke aliran kandungan. q/Q memulihkan fon dan warna supaya keadaan FPDF kekal betul."""
+        pdf = self.pdf
+        if self._direct_text:
+            try:
+                k, y = pdf.k, (pdf.h - baseline) * pdf.k
+                operators = ["q", "{:.3f} {:.3f} {:.3f} rg".format(*(channel / 255 for channel in color)), "BT"]
+                current = None
+                for x, text, style, family in merged:
+                    font = pdf.font_metrics(family, style)
+                    if font is not current:
+                        pdf._resource_catalog.add(PDFResourceType.FONT, font.i, pdf.page)
+                        operators.append(f"/F{font.i} {size:.2f} Tf")
+                        current = font
+                    codes = self._subset_codes.get(font.i)
+                    if codes is None:
+                        codes = self._subset_codes[font.i] = _SubsetCodes(font.subset)
+                    operators.append(f"1 0 0 1 {(left + x) * k:.2f} {y:.2f} Tm ({font.escape_text(text.translate(codes))}) Tj")
+                operators.append("ET Q")
+                pdf._out(" ".join(operators))
+                return
+            except AttributeError as e: # Struktur dalaman fpdf2 berubah: guna FPDF.text()
+                print(f"Lukisan teks terus PDF tidak tersedia ({e}); menggunakan FPDF.text().")
+                self._direct_text = False
+        pdf.set_text_color(*color)
+        for x, text, style, family in merged:
+            pdf.set_font(pdf.family(family), style, size)
+            pdf.text(left + x, baseline, text)
+        pdf.set_text_color(0, 0, 0)
+
+    def paragraph(self, text, indent=0.0, size=PDF_FONT_SIZE, style="", color=(0, 0, 0)):
+        width = self.pdf.epw - indent
+        runs = [(run, style or run_style, mono) for run, run_style, mono in parse_inline(text)]
+        self.draw_lines(self.wrap(runs, width, size), self.pdf.l_margin + indent, size, color)
+
+    def list_item(self, marker, text, level):
+        indent = 5.0 * level
+        size = PDF_FONT_SIZE
+        marker_width = max(5.0, self.text_width(marker + " ", FONT_FAMILY, "", size))
+        lines = self.wrap(parse_inline(text), self.pdf.epw - indent - marker_width, size)
+        line_height = size * PDF_LINE_SPACING / self.pdf.k
+        self.ensure_space(line_height)
+        self.draw_text(self.pdf.l_margin + indent, self.pdf.get_y() + line_height * 0.72,
+                       [(0.0, self.pdf.clean_text(marker), "", FONT_FAMILY)], size)
+        self.draw_lines(lines, self.pdf.l_margin + indent + marker_width, size)
+
+    def code_block(self, code_lines):
+        size = PDF_FONT_SIZE - 2
+        width = self.pdf.epw - 3
+        lines = []
+        for code_line in code_lines:
+            lines.extend(self.wrap([(code_line.expandtabs(4).rstrip(), "", True)], width, size, mono=True))
+        self.pdf.ln(1)
+        self.draw_lines(lines, self.pdf.l_margin + 1.5, size, color=CODE_COLOR, background=CODE_BACKGROUND, width=width)
+        self.pdf.ln(2)
+
+    def rule(self):
+        self.ensure_space(4)
+        y = self.pdf.get_y() + 2
+        self.pdf.set_draw_color(190, 190, 190)
+        self.pdf.line(self.pdf.l_margin, y, self.pdf.w - self.pdf.r_margin, y)
+        self.pdf.set_draw_color(0, 0, 0)
+        self.pdf.set_y(y + 2)
+
+    def render(self, markdown_text):
+        lines = markdown_text.replace("\r\n", "\n").split("\n")
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+            label = LABEL_PATTERN.match(line)
+            if label:
+                # "Pembantu: ## Tajuk" (format eksport sembang): label sebaris sendiri, kemudian blok markdown
+                self.paragraph(label.group(1), style="B")
+                line = label.group(2)
+            stripped = line.strip()
+            if FENCE_PATTERN.match(line):
+                fence = FENCE_PATTERN.match(line).group(1)
+                code_lines = []
+                while index < len(lines) and not lines[index].strip().startswith(fence):
+                    code_lines.append(lines[index])
+                    index += 1
+                index += 1 # Pagar penutup
+                self.code_block(code_lines)
+            elif not stripped:
+                self.pdf.ln(PDF_FONT_SIZE * 0.5 / self.pdf.k)
+            elif RULE_PATTERN.match(line):
+                self.rule()
+            elif HEADING_PATTERN.match(stripped):
+                level, title = HEADING_PATTERN.match(stripped).groups()
+                size = HEADING_SIZES.get(len(level), 12)
+                self.pdf.ln(2)
+                self.paragraph(title, size=size, style="B")
+                self.pdf.ln(1)
+            elif BULLET_PATTERN.match(line):
+                leading, text = BULLET_PATTERN.match(line).groups()
+                self.list_item("•" if self.pdf.unicode_fonts else "-", text, len(leading.expandtabs(4)) // 2)
+            elif NUMBERED_PATTERN.match(line):
+                leading, marker, text = NUMBERED_PATTERN.match(line).groups()
+                self.list_item(marker, text, len(leading.expandtabs(4)) // 2)
+            elif stripped.startswith(">"):
+                self.paragraph(stripped.lstrip("> "), indent=5.0, style="I", color=QUOTE_COLOR)
+            elif stripped.startswith("|"):
+                table_lines = [stripped]
+                while index < len(lines) and lines[index].strip().startswith("|"):
+                    table_lines.append(lines[index].strip())
+                    index += 1
+                self.code_block(table_lines) # Jadual markdown: fon mono supaya lajur sejajar
+            else:
+                self.paragraph(stripped, indent=min(len(line) - len(line.lstrip(" ")), 8) * 1.0)
+
+
+def render_pdf(markdown_text, logo_path=None, watermark_text=None):
+    """Bait PDF bagi teks markdown, dengan logo, tera air dan nombor halaman pada setiap halaman."""
+    pdf = ChatPdf(logo_path=logo_path, watermark_text=watermark_text)
+    pdf.add_page()
+    PdfRenderer(pdf).render(markdown_text)
+    return bytes(pdf.output())
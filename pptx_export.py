@@ -0,0 +1,389 @@
+"""Enjin eksport PowerPoint perbualan: logo dalam susun atur slaid, slaid sambungan dan fon monospace untuk kod.
+
+Sebelum ini setiap mesej menjadi satu slaid dengan kotak teks tetap 9x5.5 inci, logo ditambah semula
+pada setiap slaid (dibaca dan dicincang setiap kali) dan jawapan panjang melimpah keluar dari slaid. Di sini:
+  * logo diletakkan sekali dalam susun atur "Blank" yang dikongsi oleh semua slaid (python-pptx sudah
+    menyimpan imej itu sekali sahaja; yang dijimatkan ialah bentuk gambar dan hubungan pada setiap slaid),
+  * kandungan markdown dipecahkan kepada baris mengikut lebar teks yang diukur dengan metrik fon
+    DejaVu (cache fon pdf_export.py); mesej yang tidak muat diteruskan pada slaid sambungan,
+  * blok kod, jadual dan persamaan ($$...$$, \\[...\\]) serta `kod` dan $...$ sebaris menggunakan fon monospace.
+DejaVu Sans lebih lebar sedikit daripada Arial, jadi anggaran baris adalah konservatif: PowerPoint
+membalut semula teks dalam kotak yang sama dan teks tidak melimpah.
+"""
+import io
+import os
+import re
+from xml.sax.saxutils import escape
+
+from pptx import Presentation
+from pptx.dml.color import RGBColor
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.packuri import PackURI
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+from pptx.parts.slide import SlidePart
+from pptx.util import Emu, Inches, Pt
+
+from pdf_export import (
+    BULLET_PATTERN, FENCE_PATTERN, FONT_FAMILY, HEADING_PATTERN, MONO_FAMILY, NUMBERED_PATTERN, RULE_PATTERN,
+    TOKEN_PATTERN, fonts_available, glyph_widths, parse_inline,
+)
+
+# --- KONFIGURASI ---
+PPTX_FONT = "Arial"
+PPTX_MONO_FONT = "Courier New" # Lebar aksara sama dengan DejaVu Sans Mono (0.6 em)
+PPTX_FONT_SIZE = float(os.getenv("PPTX_FONT_SIZE", "16")) # Poin
+PPTX_ROLE_SIZE = 18
+PPTX_CODE_SIZE = 13
+PPTX_THINKING_SIZE = 12
+PPTX_LINE_SPACING = 1.2 # Ketinggian baris PowerPoint (jarak tunggal) sebagai gandaan saiz fon
+PPTX_MARGIN = Inches(0.5)
+PPTX_LOGO_HEIGHT = Inches(0.75)
+PPTX_LOGO_OFFSET = Inches(0.2)
+PPTX_TEXT_INSET = Inches(0.1) # Inset kiri/kanan lalai kotak teks
+PPTX_BLANK_LAYOUT = 6 # "Blank" dalam templat lalai python-pptx
+HEADING_SIZE_STEP = {1: 4, 2: 2, 3: 1} # Tambahan saiz fon bagi tajuk markdown
+LIST_INDENT = 18.0 # Poin bagi setiap tahap senarai
+FALLBACK_EM = {FONT_FAMILY: 0.55, MONO_FAMILY: 0.6} # Lebar purata aksara jika fail fon tiada
+CODE_COLOR = RGBColor(150, 30, 30)
+QUOTE_COLOR = RGBColor(90, 90, 90)
+THINKING_COLOR = RGBColor(110, 110, 110)
+
+XML_ILLEGAL_PATTERN = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+MATH_FENCES = {"$$": "$$", "\\[": "\\]"}
+INLINE_MATH_PATTERN = re.compile(r"(?<![\\$\w])\$(?=\S)([^$\n]+?)(?<=\S)\$(?![\w$])")
+
+
+def inline_runs(text, style=""):
+    """Senarai (teks, gaya, mono); $...$ sebaris dipaparkan dalam monospace seperti `kod`."""
+    runs, position = [], 0
+    for match in INLINE_MATH_PATTERN.finditer(text):
+        runs += [(run, style or run_style, mono) for run, run_style, mono in parse_inline(text[position:match.start()])]
+        runs.append((match.group(1), style, True))
+        position = match.end()
+    runs += [(run, style or run_style, mono) for run, run_style, mono in parse_inline(text[position:])]
+    return runs
+
+
+class PptxBlock:
+    """Satu perenggan yang telah dibalut: baris ialah senarai (teks, gaya, mono)."""
+    def __init__(self, lines, size, indent=0.0, marker=None, color=None, mono=False, space_before=0.0):
+        self.lines = lines
+        self.size = size
+        self.indent = indent # Poin
+        self.marker = marker # (teks, lebar) penanda senarai; inden gantung
+        self.color = color
+        self.mono = mono # Setiap baris ialah perenggan sendiri (kod)
+        self.space_before = space_before
+
+    @property
+    def line_height(self):
+        return self.size * PPTX_LINE_SPACING
+
+    def height(self, lines=None):
+        return self.space_before + len(self.lines if lines is None else lines) * self.line_height
+
+    def split(self, count):
+        head = PptxBlock(self.lines[:count], self.size, self.indent, self.marker, self.color, self.mono, self.space_before)
+        tail = PptxBlock(self.lines[count:], self.size, self.indent, None, self.color, self.mono)
+        if self.marker:
+            tail.indent += self.marker[1] # Baris sambungan senarai sejajar dengan teks, bukan penanda
+        return head, tail
+
+
+class PptxLayout:
+    """Membalut markdown kepada PptxBlock mengikut lebar teks yang diukur, dalam poin."""
+    def __init__(self, width):
+        self.width = width
+        self._widths = {} # (keluarga, gaya, teks) -> lebar pada saiz 1 pt
+        self._metrics = fonts_available()
+
+    def text_width(self, text, family, style, size):
+        key = (family, style, text)
+        width = self._widths.get(key)
+        if width is None:
+            if self._metrics:
+                widths = glyph_widths(family, style)
+                width = sum(widths[ord(char)] for char in text) / 1000
+            else:
+                width = len(text) * FALLBACK_EM[family]
+            self._widths[key] = width
+        return width * size
+
+    def wrap(self, runs, width, size, mono=False):
+        lines, line, x = [], [], 0.0
+        pending_space = ""
+        for text, style, run_mono in runs:
+            family = MONO_FAMILY if (mono or run_mono) else FONT_FAMILY
+            metric_style = style if family == FONT_FAMILY else ("B" if "B" in style else "")
+            for space, word in TOKEN_PATTERN.findall(text):
+                space, pending_space = pending_space + space, ""
+                space = space.replace("\t", "    ") if (line or (mono and not lines)) else ""
+                space_width = self.text_width(space, family, metric_style, size) if space else 0.0
+                word_width = self.text_width(word, family, metric_style, size)
+                if line and x + space_width + word_width > width:
+                    # Ruang dikekalkan dalam teks (tidak diukur) supaya baris boleh disambung semula
+                    lines.append(line)
+                    line, x, space_width = [], 0.0, 0.0
+                while x + space_width + word_width > width and len(word) > 1:
+                    # Perkataan (cth. URL) lebih panjang daripada baris: dipotong mengikut aksara
+                    cut = max(1, int(len(word) * (width - x - space_width) / word_width))
+                    line.append((space + word[:cut], style, run_mono or mono))
+                    lines.append(line)
+                    line, x, space, space_width = [], 0.0, "", 0.0
+                    word = word[cut:]
+                    word_width = self.text_width(word, family, metric_style, size)
+                line.append((space + word, style, run_mono or mono))
+                x += space_width + word_width
+            pending_space += text[len(text.rstrip()):]
+        if line or not lines:
+            lines.append(line)
+        return lines
+
+    def paragraph(self, runs, size, indent=0.0, color=None, space_before=0.0):
+        return PptxBlock(self.wrap(runs, self.width - indent, size), size, indent, color=color, space_before=space_before)
+
+    def list_item(self, marker, text, level, size):
+        indent = LIST_INDENT * level
+        marker = marker + " "
+        marker_width = max(LIST_INDENT, self.text_width(marker, FONT_FAMILY, "", size))
+        lines = self.wrap(inline_runs(text), self.width - indent - marker_width, size)
+        return PptxBlock(lines, size, indent, marker=(marker, marker_width))
+
+    def code_block(self, code_lines, size=PPTX_CODE_SIZE):
+        lines = []
+        for code_line in code_lines:
+            lines.extend(self.wrap([(code_line.expandtabs(4).rstrip(), "", True)], self.width, size, mono=True))
+        return PptxBlock(lines, size, color=CODE_COLOR, mono=True, space_before=size * 0.3)
+
+    def blocks(self, markdown_text, size=PPTX_FONT_SIZE, style="", color=None):
+        """Blok bagi teks markdown ringkas (tajuk, senarai, kod, persamaan, petikan, jadual)."""
+        blocks = []
+        lines = markdown_text.replace("\r\n", "\n").split("\n")
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+            stripped = line.strip()
+            fence = FENCE_PATTERN.match(line)
+            math_fence = next((opening for opening in MATH_FENCES if stripped.startswith(opening)), None)
+            if fence:
+                code_lines = []
+                while index < len(lines) and not lines[index].strip().startswith(fence.group(1)):
+                    code_lines.append(lines[index])
+                    index += 1
+                index += 1 # Pagar penutup
+                blocks.append(self.code_block(code_lines))
+            elif math_fence:
+                closing = MATH_FENCES[math_fence]
+                body = stripped[len(math_fence):]
+                math_lines = []
+                if body.endswith(closing):
+                    math_lines.append(body[:-len(closing)]) # Persamaan satu baris: $$ E = mc^2 $$
+                else:
+                    if body:
+                        math_lines.append(body)
+                    while index < len(lines) and not lines[index].strip().endswith(closing):
+                        math_lines.append(lines[index])
+                        index += 1
+                    if index < len(lines):
+                        math_lines.append(lines[index].strip()[:-len(closing)])
+                        index += 1
+                blocks.append(self.code_block([math_line.strip() for math_line in math_lines if math_line.strip()]))
+            elif not stripped or RULE_PATTERN.match(line):
+                continue
+            elif HEADING_PATTERN.match(stripped):
+                level, title = HEADING_PATTERN.match(stripped).groups()
+                heading_size = size + HEADING_SIZE_STEP.get(len(level), 0)
+                blocks.append(self.paragraph(inline_runs(title, "B"), heading_size, color=color, space_before=size * 0.4))
+            elif BULLET_PATTERN.match(line):
+                leading, text = BULLET_PATTERN.match(line).groups()
+                blocks.append(self.list_item("•", text, len(leading.expandtabs(4)) // 2, size))
+            elif NUMBERED_PATTERN.match(line):
+                leading, marker, text = NUMBERED_PATTERN.match(line).groups()
+                blocks.append(self.list_item(marker, text, len(leading.expandtabs(4)) // 2, size))
+            elif stripped.startswith(">"):
+                blocks.append(self.paragraph(inline_runs(stripped.lstrip("> "), "I"), size, LIST_INDENT, QUOTE_COLOR))
+            elif stripped.startswith("|"):
+                table_lines = [stripped]
+                while index < len(lines) and lines[index].strip().startswith("|"):
+                    table_lines.append(lines[index].strip())
+                    index += 1
+                blocks.append(self.code_block(table_lines)) # Jadual markdown: fon mono supaya lajur sejajar
+            else:
+                blocks.append(self.paragraph(inline_runs(stripped, style), size, color=color))
+        return blocks
+
+
+# --- DEK ---
+def _add_layout_logo(layout, logo_path):
+    """Logo sebagai gambar dalam susun atur: imej disimpan sekali dan dipaparkan pada setiap slaid yang menggunakannya."""
+    image_part, rel_id = layout.part.get_or_add_image_part(logo_path)
+    width, height = image_part.scale(None, PPTX_LOGO_HEIGHT)
+    layout.shapes._spTree.add_pic(
+        layout.shapes._next_shape_id, "Logo", os.path.basename(logo_path), rel_id,
+        PPTX_LOGO_OFFSET, PPTX_LOGO_OFFSET, width, height,
+    )
+
+def _set_master_defaults(prs):
+    """Fon dan saiz lalai teks disimpan sekali dalam induk slaid (otherStyle); larian hanya menyimpan perbezaan."""
+    master = prs.slide_master._element
+    def_rpr = master.find("/".join(qn(tag) for tag in ("p:txStyles", "p:otherStyle", "a:lvl1pPr", "a:defRPr")))
+    if def_rpr is None:
+        return False
+    def_rpr.set("sz", str(int(PPTX_FONT_SIZE * 100)))
+    latin = def_rpr.find(qn("a:latin"))
+    if latin is None:
+        latin = def_rpr.makeelement(qn("a:latin"), {})
+        def_rpr.append(latin) # Tiada unsur lain selepas latin dalam defRPr lalai
+    latin.set("typeface", PPTX_FONT)
+    return True
+
+def _xml_text(text):
+    return escape(XML_ILLEGAL_PATTERN.sub("", text))
+
+def _run_xml(text, size, style, mono, color, defaults):
+    attributes = "" if defaults and size == PPTX_FONT_SIZE else f' sz="{int(size * 100)}"'
+    if "B" in style:
+        attributes += ' b="1"'
+    if "I" in style:
+        attributes += ' i="1"'
+    children = ""
+    color = color if color is not None else CODE_COLOR if mono else None
+    if color is not None:
+        children += f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill>'
+    if mono or not defaults:
+        children += f'<a:latin typeface="{PPTX_MONO_FONT if mono else PPTX_FONT}"/>'
+    properties = f"<a:rPr{attributes}>{children}</a:rPr>" if attributes or children else ""
+    return f"<a:r>{properties}<a:t>{_xml_text(text)}</a:t></a:r>"
+
+def _block_xml(block, defaults):
+    """Perenggan DrawingML bagi satu blok. Kod: satu perenggan bagi setiap baris. Teks biasa: semua
+    baris disambung menjadi satu perenggan dan PowerPoint membalutnya semula dalam lebar yang sama."""
+    paragraph_lines = block.lines if block.mono else [[run for line in block.lines for run in line]]
+    paragraphs = []
+    for line_index, line in enumerate(paragraph_lines):
+        margin = ""
+        if block.marker:
+            margin = f' marL="{Emu(Pt(block.indent + block.marker[1]))}" indent="{-Emu(Pt(block.marker[1]))}"'
+        elif block.indent:
+            margin = f' marL="{Emu(Pt(block.indent))}"'
+        spacing = ""
+        if line_index == 0 and block.space_before:
+            spacing = f'<a:spcBef><a:spcPts val="{int(block.space_before * 100)}"/></a:spcBef>'
+        properties = f"<a:pPr{margin}>{spacing}</a:pPr>" if margin or spacing else ""
+        runs = list(line)
+        if runs and not block.mono:
+            runs[0] = (runs[0][0].lstrip(), *runs[0][1:]) # Baris pertama slaid sambungan
+        if block.marker and line_index == 0:
+            runs.insert(0, (block.marker[0], "", False))
+        merged = []
+        for text, style, mono in runs:
+            if merged and merged[-1][1:] == [style, mono]:
+                merged[-1][0] += text
+            else:
+                merged.append([text, style, mono])
+        content = "".join(_run_xml(text, block.size, style, mono, block.color, defaults) for text, style, mono in merged if text)
+        if not content: # Baris kosong: endParaRPr menetapkan ketinggiannya
+            content = f'<a:endParaRPr sz="{int(block.size * 100)}"/>'
+        paragraphs.append(f"<a:p>{properties}{content}</a:p>")
+    return "".join(paragraphs)
+
+
+class PptxRenderer:
+    """Satu slaid bagi setiap mesej, dengan slaid sambungan bagi mesej yang tidak muat."""
+    def __init__(self, logo_path=None):
+        self.prs = Presentation()
+        self.layout = self.prs.slide_layouts[PPTX_BLANK_LAYOUT]
+        self.master_defaults = _set_master_defaults(self.prs)
+        self._fast_slides = True
+        self._next_slide_id = None
+        self.top = PPTX_MARGIN
+        if logo_path and os.path.exists(logo_path):
+            try:
+                _add_layout_logo(self.layout, logo_path)
+                self.top = PPTX_LOGO_OFFSET + PPTX_LOGO_HEIGHT + Inches(0.1)
+            except Exception as e: # python-pptx membangkitkan pelbagai jenis ralat bagi imej rosak
+                print(f"Gagal menambah logo pada PowerPoint: {e}")
+        self.box_width = self.prs.slide_width - 2 * PPTX_MARGIN
+        self.box_height = self.prs.slide_height - self.top - PPTX_MARGIN
+        self.text_layout = PptxLayout((self.box_width - 2 * PPTX_TEXT_INSET) / Pt(1))
+        self.text_height = (self.box_height - Inches(0.1)) / Pt(1) # Inset atas dan bawah
+
+    def _role_block(self, role, continuation):
+        label = f"{role.capitalize()} (sambungan):" if continuation else f"{role.capitalize()}:"
+        return PptxBlock([[(label, "B", False)]], PPTX_ROLE_SIZE)
+
+    def _new_slide(self):
+        # Slides.add_slide() mencari hubungan sedia ada dan ID slaid terbesar bagi setiap slaid baru
+        # (kuadratik bagi ratusan slaid); di sini bahagian slaid dicipta terus dengan ID yang dijejaki.
+        if self._fast_slides:
+            try:
+                presentation_part = self.prs.part
+                slide_id_list = self.prs.slides._sldIdLst
+                partname = PackURI(f"/ppt/slides/slide{len(slide_id_list) + 1}.xml")
+                slide_part = SlidePart.new(partname, presentation_part.package, self.layout.part)
+                rel_id = presentation_part.rels._add_relationship(RT.SLIDE, slide_part)
+                if self._next_slide_id is None:
+                    self._next_slide_id = slide_id_list._next_id
+                slide_id_list._add_sldId(id=self._next_slide_id, rId=rel_id)
+                self._next_slide_id += 1
+                return slide_part.slide
+            except (AttributeError, TypeError) as e: # Dalaman python-pptx berubah: guna API awam
+                print(f"Laluan pantas slaid PowerPoint tidak tersedia ({e}); menggunakan add_slide().")
+                self._fast_slides = False
+        return self.prs.slides.add_slide(self.layout)
+
+    def _add_slide(self, blocks):
+        slide = self._new_slide()
+        paragraphs = "".join(_block_xml(block, self.master_defaults) for block in blocks)
+        # Kotak teks setara add_textbox() dengan word_wrap dan tanpa autosaiz, dibina sebagai satu unsur
+        slide.shapes._spTree.append(parse_xml(
+            f'<p:sp {nsdecls("a", "p")}><p:nvSpPr><p:cNvPr id="2" name="Kandungan"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+            f'<p:spPr><a:xfrm><a:off x="{PPTX_MARGIN}" y="{self.top}"/><a:ext cx="{self.box_width}" cy="{self.box_height}"/></a:xfrm>'
+            f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+            f'<p:txBody><a:bodyPr wrap="square" rtlCol="0"><a:noAutofit/></a:bodyPr><a:lstStyle/>{paragraphs or "<a:p/>"}</p:txBody></p:sp>'
+        ))
+
+    def add_message(self, msg, include_thinking=False):
+        role = msg.get("role", "")
+        blocks = self.text_layout.blocks(msg.get("content", ""))
+        thinking_text = (msg.get("thinking_process") or "").strip() if include_thinking else ""
+        if thinking_text:
+            blocks.append(PptxBlock([[("Proses Pemikiran AI:", "I", False)]], PPTX_THINKING_SIZE + 2, color=THINKING_COLOR, space_before=6))
+            blocks += self.text_layout.blocks(thinking_text, PPTX_THINKING_SIZE, color=THINKING_COLOR)
+        slide_blocks = [self._role_block(role, False)]
+        used = slide_blocks[0].height()
+        while blocks:
+            block = blocks.pop(0)
+            if used + block.height() <= self.text_height:
+                slide_blocks.append(block)
+                used += block.height()
+                continue
+            fit = min(int((self.text_height - used - block.space_before) // block.line_height), len(block.lines) - 1)
+            if len(slide_blocks) == 1:
+                fit = max(fit, 1) # Slaid hanya ada label peranan: sekurang-kurangnya satu baris, elak gelung tanpa henti
+            if fit >= 2 or (fit >= 1 and len(slide_blocks) == 1):
+                head, tail = block.split(fit)
+                slide_blocks.append(head)
+                blocks.insert(0, tail)
+            else:
+                blocks.insert(0, block) # Dipindahkan keseluruhannya ke slaid sambungan
+            self._add_slide(slide_blocks)
+            slide_blocks = [self._role_block(role, True)]
+            used = slide_blocks[0].height()
+        self._add_slide(slide_blocks)
+
+    def output(self):
+        buffer = io.BytesIO()
+        self.prs.save(buffer)
+        return buffer.getvalue()
+
+
+def render_pptx(chat_history, logo_path=None, include_thinking=False):
+    """Bait PPTX bagi senarai mesej; mesej panjang dipecahkan kepada slaid sambungan."""
+    renderer = PptxRenderer(logo_path)
+    for msg in chat_history:
+        renderer.add_message(msg, include_thinking)
+    return renderer.output()
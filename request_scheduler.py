@@ -0,0 +1,277 @@
+"""Penjadual permintaan ke Ollama: had serentak bagi setiap model dan giliran adil bagi setiap pengguna.
+
+Permintaan yang tidak boleh dijalankan serta-merta menunggu dalam giliran model tersebut.
+Apabila slot kosong, pengguna dipilih secara round-robin supaya seorang pelajar yang menghantar
+banyak soalan tidak menghalang pelajar lain. Jika giliran penuh, QueueFullError dibangkitkan
+bersama anggaran masa untuk mencuba semula (digunakan untuk respons 429).
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+# --- KONFIGURASI ---
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENT_PER_MODEL", "2"))
+MODEL_CONCURRENCY_OVERRIDES = os.getenv("OLLAMA_MODEL_CONCURRENCY", "") # Contoh: "qwen3:8b=1,gemma3:12b=1"
+MAX_QUEUE_DEPTH = int(os.getenv("SCHEDULER_MAX_QUEUE", "50")) # Bilangan menunggu maksimum bagi setiap model
+QUEUE_WAIT_TIMEOUT = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "300")) # Saat maksimum menunggu giliran (mod segerak)
+DEFAULT_SERVICE_TIME = 20.0 # Anggaran awal tempoh satu permintaan (saat) sebelum ada data sebenar
+
+
+class QueueFullError(Exception):
+    def __init__(self, model, queue_depth, retry_after):
+        super().__init__(f"Giliran untuk model '{model}' penuh ({queue_depth} menunggu).")
+        self.model = model
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    pass
+
+
+class Ticket:
+    """Maklumat kemasukan satu permintaan: kedudukan asal dalam giliran dan masa menunggu."""
+    def __init__(self, model, user, queue_position):
+        self.model = model
+        self.user = user
+        self.queue_position = queue_position
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+    @property
+    def wait_time(self):
+        return (self.started_at or time.time()) - self.enqueued_at
+
+    def as_dict(self):
+        return {"queue_position": self.queue_position, "queue_wait": round(self.wait_time, 3)}
+
+
+class _Waiter:
+    def __init__(self, ticket):
+        self.ticket = ticket
+        self.granted = False
+        self.abandoned = False
+
+class _ThreadWaiter(_Waiter):
+    def __init__(self, ticket):
+        super().__init__(ticket)
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+class _AsyncWaiter(_Waiter):
+    def __init__(self, ticket, loop):
+        super().__init__(ticket)
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        def _resolve():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(_resolve)
+
+
+class _ModelState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.queues = OrderedDict() # pengguna -> deque penunggu, susunan = giliran round-robin
+        self.avg_service_time = None
+
+    def push(self, user, waiter):
+        self.queues.setdefault(user, deque()).append(waiter)
+        self.waiting += 1
+
+    def pop_next(self):
+        if not self.queues:
+            return None
+        user, user_queue = next(iter(self.queues.items()))
+        waiter = user_queue.popleft()
+        del self.queues[user]
+        if user_queue:
+            self.queues[user] = user_queue # Pindah ke hujung: pengguna lain mendapat giliran dahulu
+        self.waiting -= 1
+        return waiter
+
+    def remove(self, user, waiter):
+        user_queue = self.queues.get(user)
+        if user_queue and waiter in user_queue:
+            user_queue.remove(waiter)
+            self.waiting -= 1
+            if not user_queue:
+                del self.queues[user]
+
+    def record_service_time(self, seconds):
+        if self.avg_service_time is None:
+            self.avg_service_time = seconds
+        else:
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * seconds
+
+    def estimated_wait(self, position):
+        service_time = self.avg_service_time or DEFAULT_SERVICE_TIME
+        return service_time * math.ceil(position / max(self.limit, 1))
+
+
+def parse_model_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, limit = item.rsplit("=", 1)
+            try:
+                limits[model.strip()] = max(1, int(limit))
+            except ValueError:
+                pass
+    return limits
+
+
+class RequestScheduler:
+    """Boleh digunakan dari thread (Streamlit) melalui slot() atau dari asyncio (FastAPI) melalui async_slot()/async_enqueue()."""
+    def __init__(self, default_limit=DEFAULT_MODEL_CONCURRENCY, model_limits=None, max_queue=MAX_QUEUE_DEPTH):
+        self.default_limit = max(1, default_limit)
+        self.model_limits = model_limits if model_limits is not None else parse_model_limits(MODEL_CONCURRENCY_OVERRIDES)
+        self.max_queue = max_queue
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model):
+        state = self._states.get(model)
+        if state is None:
+            state = self._states[model] = _ModelState(self.model_limits.get(model, self.default_limit))
+        return state
+
+    def _admit_locked(self, model, user, make_waiter):
+        """Mengembalikan (ticket, None) jika slot tersedia, atau (ticket, waiter) jika perlu menunggu."""
+        state = self._state(model)
+        if state.active < state.limit and not state.waiting:
+            state.active += 1
+            ticket = Ticket(model, user, 0)
+            ticket.started_at = ticket.enqueued_at
+            return ticket, None
+        if state.waiting >= self.max_queue:
+            raise QueueFullError(model, state.waiting, math.ceil(state.estimated_wait(state.waiting + 1)))
+        ticket = Ticket(model, user, state.waiting + 1)
+        waiter = make_waiter(ticket)
+        state.push(user, waiter)
+        return ticket, waiter
+
+    def _release_locked(self, model, service_time=None):
+        state = self._state(model)
+        if service_time is not None:
+            state.record_service_time(service_time)
+        waiter = state.pop_next()
+        if waiter is None:
+            state.active -= 1
+            return
+        # Slot diserahkan terus kepada penunggu seterusnya; bilangan aktif tidak berubah
+        waiter.granted = True
+        waiter.ticket.started_at = time.time()
+        waiter.wake()
+
+    def _abandon_locked(self, waiter):
+        if waiter.abandoned:
+            return
+        waiter.abandoned = True
+        if waiter.granted:
+            self._release_locked(waiter.ticket.model)
+        else:
+            self._state(waiter.ticket.model).remove(waiter.ticket.user, waiter)
+
+    def release(self, ticket):
+        with self._lock:
+            self._release_locked(ticket.model, time.time() - ticket.started_at)
+
+    def acquire(self, model, user, on_queued=None, timeout=QUEUE_WAIT_TIMEOUT):
+        """Versi segerak. Menyekat thread semasa sehingga slot tersedia."""
+        with self._lock:
+            ticket, waiter = self._admit_locked(model, user, _ThreadWaiter)
+        if waiter is None:
+            return ticket
+        try:
+            if on_queued:
+                on_queued(ticket, self.estimated_wait(model, ticket.queue_position))
+            granted = waiter.event.wait(timeout)
+        except BaseException:
+            with self._lock:
+                self._abandon_locked(waiter)
+            raise
+        if not granted:
+            with self._lock:
+                if not waiter.granted:
+                    self._abandon_locked(waiter)
+                    raise QueueTimeoutError(f"Tamat masa menunggu giliran model '{model}' selepas {timeout:.0f}s.")
+        return ticket
+
+    def async_enqueue(self, model, user):
+        """Kemasukan tanpa menunggu, untuk pemanggil yang mahu melaporkan kedudukan giliran dahulu.
+        Mengembalikan (ticket, waiter); waiter ialah None jika slot sudah diperoleh."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            return self._admit_locked(model, user, lambda t: _AsyncWaiter(t, loop))
+
+    async def wait_for_slot(self, waiter):
+        """Menunggu giliran. Jika tugasan dibatalkan semasa menunggu, ia dikeluarkan dari giliran."""
+        if waiter is None:
+            return
+        try:
+            await waiter.future
+        except BaseException:
+            self.abandon(waiter)
+            raise
+
+    def abandon(self, waiter):
+        if waiter is None:
+            return
+        with self._lock:
+            self._abandon_locked(waiter)
+
+    async def async_acquire(self, model, user):
+        ticket, waiter = self.async_enqueue(model, user)
+        await self.wait_for_slot(waiter)
+        return ticket
+
+    @contextmanager
+    def slot(self, model, user, on_queued=None, timeout=QUEUE_WAIT_TIMEOUT):
+        ticket = self.acquire(model, user, on_queued, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def async_slot(self, model, user):
+        ticket = await self.async_acquire(model, user)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def check_admission(self, model):
+        """Membangkitkan QueueFullError jika permintaan baru untuk model ini pasti ditolak."""
+        with self._lock:
+            state = self._state(model)
+            if state.active >= state.limit and state.waiting >= self.max_queue:
+                raise QueueFullError(model, state.waiting, math.ceil(state.estimated_wait(state.waiting + 1)))
+
+    def estimated_wait(self, model, position):
+        with self._lock:
+            return self._state(model).estimated_wait(position)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {
+                    "limit": state.limit,
+                    "active": state.active,
+                    "queue_depth": state.waiting,
+                    "waiting_users": len(state.queues),
+                    "avg_service_time": round(state.avg_service_time, 3) if state.avg_service_time is not None else None,
+                }
+                for model, state in self._states.items()
+            }
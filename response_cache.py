@@ -0,0 +1,218 @@
+"""Cache respons Ollama untuk soalan STEM yang berulang.
+
+Kunci cache ialah (model, sejarah mesej yang dinormalkan, parameter sampling). Entri disimpan
+dalam SQLite supaya kekal selepas aplikasi dimulakan semula, dengan penghapusan LRU dan TTL.
+Carian semantik (pilihan) membandingkan embedding soalan satu giliran dengan soalan yang
+pernah dijawab untuk model dan parameter yang sama.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import ollama_client
+
+# --- KONFIGURASI ---
+CACHE_DIR = "cache"
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(CACHE_DIR, "response_cache.sqlite3"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600))) # Saat
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")) # Persamaan kosinus minimum
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalise_text(text):
+    return _WHITESPACE_RE.sub(" ", text or "").strip().casefold()
+
+def has_images(messages):
+    """True jika mana-mana mesej dalam sejarah membawa imej; jawapan sebegini tidak dicache."""
+    return any(msg.get("images") for msg in messages)
+
+def _image_digests(msg):
+    return [hashlib.sha256(str(image).encode("utf-8")).hexdigest() for image in msg["images"]]
+
+def normalise_messages(messages):
+    # Cincangan imej hanya disertakan jika ada, jadi kunci mesej teks sahaja tidak berubah
+    return [(msg.get("role", ""), normalise_text(msg.get("content", ""))) + ((_image_digests(msg),) if msg.get("images") else ())
+            for msg in messages]
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def make_scope(model, options=None):
+    """Skop carian semantik: hanya soalan untuk model dan parameter yang sama boleh dipadankan."""
+    return _digest({"model": model, "options": options or {}})
+
+def make_key(model, messages, options=None):
+    return _digest({"model": model, "messages": normalise_messages(messages), "options": options or {}})
+
+def single_turn_question(messages):
+    """Mengembalikan teks soalan jika perbualan hanya satu giliran pengguna (mesej sistem diabaikan)."""
+    conversation = [msg for msg in messages if msg.get("role") != "system"]
+    if len(conversation) == 1 and conversation[0].get("role") == "user" and not conversation[0].get("images"):
+        return normalise_text(conversation[0].get("content", ""))
+    return None
+
+
+class ResponseCache:
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 semantic=SEMANTIC_CACHE_ENABLED, semantic_threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, scope TEXT NOT NULL, response TEXT NOT NULL,"
+            " embedding BLOB, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses(scope)")
+        self._conn.commit()
+        self._vectors = {} # skop -> (senarai kunci, matriks embedding dinormalkan)
+
+    # --- Padanan tepat ---
+    def get(self, model, messages, options=None):
+        key = make_key(model, messages, options)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, model, messages, response, options=None, embedding=None):
+        """Menyimpan respons berjaya. 'response' ialah kamus mesej pembantu (content, thinking_process)."""
+        key = make_key(model, messages, options)
+        scope = make_scope(model, options)
+        now = time.time()
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, response, embedding, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, json.dumps(response, ensure_ascii=False), blob, now, now),
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+            if blob is not None:
+                self._vectors.pop(scope, None) # Bina semula indeks semantik skop ini apabila diperlukan
+
+    def _evict_locked(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)", (excess,)
+            )
+            self._vectors.clear()
+
+    # --- Padanan semantik ---
+    def _scope_vectors_locked(self, scope):
+        if scope not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT key, embedding FROM responses WHERE scope = ? AND embedding IS NOT NULL", (scope,)
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            if rows:
+                matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            self._vectors[scope] = (keys, matrix)
+        return self._vectors[scope]
+
+    def get_similar(self, model, embedding, options=None):
+        scope = make_scope(model, options)
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        now = time.time()
+        with self._lock:
+            keys, matrix = self._scope_vectors_locked(scope)
+            if not keys or matrix.shape[1] != query.shape[0]:
+                return None
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.semantic_threshold:
+                return None
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (keys[best],)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, keys[best]))
+            self._conn.commit()
+        response = json.loads(row[0])
+        response["cache_similarity"] = round(float(scores[best]), 4)
+        return response
+
+    # --- Aliran carian lengkap ---
+    def _mark_hit(self, response, match):
+        if match == "semantic":
+            self.semantic_hits += 1
+        else:
+            self.hits += 1
+        response = dict(response)
+        response["cached"] = True
+        response["cache_match"] = match
+        return response
+
+    def lookup(self, model, messages, options=None):
+        """Versi segerak. Mengembalikan (respons_atau_None, embedding_soalan_atau_None)."""
+        cached = self.get(model, messages, options)
+        if cached is not None:
+            return self._mark_hit(cached, "exact"), None
+        question = single_turn_question(messages) if self.semantic else None
+        embedding = None
+        if question:
+            try:
+                embedding = ollama_client.embed([question])[0]
+            except Exception:
+                embedding = None # Carian semantik adalah pilihan; teruskan ke Ollama
+            if embedding is not None:
+                cached = self.get_similar(model, embedding, options)
+                if cached is not None:
+                    return self._mark_hit(cached, "semantic"), embedding
+        self.misses += 1
+        return None, embedding
+
+    async def async_lookup(self, model, messages, options=None):
+        """Versi asyncio bagi lookup() untuk backend FastAPI."""
+        cached = self.get(model, messages, options)
+        if cached is not None:
+            return self._mark_hit(cached, "exact"), None
+        question = single_turn_question(messages) if self.semantic else None
+        embedding = None
+        if question:
+            try:
+                embedding = (await ollama_client.async_embed([question]))[0]
+            except Exception:
+                embedding = None
+            if embedding is not None:
+                cached = self.get_similar(model, embedding, options)
+                if cached is not None:
+                    return self._mark_hit(cached, "semantic"), embedding
+        self.misses += 1
+        return None, embedding
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses}
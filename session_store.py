@@ -0,0 +1,601 @@
+"""Storan sesi perbualan yang boleh ditukar ganti.
+
+- "json": format asal, satu fail JSON bagi setiap sesi di bawah HISTORY_DIR[/<pengguna>].
+- "sqlite": satu pangkalan data SQLite (mod WAL), satu baris bagi setiap mesej, dengan indeks
+  (pengguna, updated_at) supaya senarai sesi di sidebar tidak perlu membaca direktori.
+- "jsonl": satu fail <session_id>.jsonl bagi setiap sesi; setiap giliran ditambah di hujung fail
+  dengan fsync, dan load_session(..., tail=N) hanya membaca N mesej terakhir dari hujung fail.
+
+Pilih melalui SESSION_STORE. Aplikasi tanpa log masuk (chatbot.py) menggunakan username=None.
+
+Migrasi fail JSON sedia ada ke SQLite:
+    python session_store.py migrate [--history-dir chat_sessions] [--db chat_sessions/sessions.sqlite3]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from user_store import _file_lock
+
+# --- KONFIGURASI ---
+HISTORY_DIR = "chat_sessions"
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite") # "sqlite", "jsonl" atau "json"
+SESSION_DB_FILENAME = "sessions.sqlite3"
+JSONL_COMPACT_THRESHOLD = int(os.getenv("JSONL_COMPACT_THRESHOLD", "20")) # Rekod mati sebelum log dipadatkan
+JSONL_TAIL_BLOCK_SIZE = 64 * 1024 # Saiz blok semasa membaca hujung fail .jsonl
+JSONL_RESET_KEY = "_reset"
+
+
+class SessionStoreError(Exception):
+    pass
+
+
+def _history_digests(history, prefix_count):
+    """(cincangan history[:prefix_count], cincangan seluruh history). Setiap mesej disirikan sekali sahaja;
+    save_session() membandingkan cincangan awalan dengan yang disimpan sebelum hanya menambah mesej baru."""
+    h = hashlib.sha256()
+    prefix = None
+    for index, msg in enumerate(history):
+        if index == prefix_count:
+            prefix = h.hexdigest()
+        h.update(json.dumps(msg, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8") + b"\n")
+    full = h.hexdigest()
+    return (full if prefix is None else prefix), full
+
+
+def _session_sort_key(session_id):
+    # ID sesi lalai ialah cap masa "%Y%m%d_%H%M%S"; ID lain diletakkan di hujung
+    try:
+        parts = session_id.split('_')
+        if len(parts) >= 2:
+            return datetime.strptime(f"{parts[0]}_{parts[1]}", "%Y%m%d_%H%M%S")
+    except (ValueError, IndexError):
+        pass
+    return datetime.min
+
+
+class JsonSessionStore:
+    """Format asal: fail <session_id>.json yang ditulis semula sepenuhnya pada setiap giliran."""
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = history_dir
+
+    def _user_dir(self, username):
+        user_dir = os.path.join(self.history_dir, username) if username else self.history_dir
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def _path(self, username, session_id):
+        return os.path.join(self._user_dir(username), f"{session_id}.json")
+
+    def list_sessions(self, username=None):
+        try:
+            files = [f[:-len(".json")] for f in os.listdir(self._user_dir(username)) if f.endswith(".json")]
+        except OSError as e:
+            raise SessionStoreError(e) from e
+        return sorted(files, key=_session_sort_key, reverse=True)
+
+    def load_session(self, username, session_id, tail=None):
+        try:
+            with open(self._path(username, session_id), "r", encoding="utf-8") as f:
+                history = json.load(f)
+            return history[-tail:] if tail else history
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, OSError) as e:
+            raise SessionStoreError(e) from e
+
+    def save_session(self, username, session_id, history):
+        try:
+            with open(self._path(username, session_id), "w", encoding="utf-8") as f:
+                json.dump(history, f, indent=2)
+        except OSError as e:
+            raise SessionStoreError(e) from e
+
+    def delete_session(self, username, session_id):
+        filepath = self._path(username, session_id)
+        try:
+            if not os.path.exists(filepath):
+                return False
+            os.remove(filepath)
+            return True
+        except OSError as e:
+            raise SessionStoreError(e) from e
+
+    def delete_all_sessions(self, username=None):
+        deleted_count = 0
+        try:
+            for session_id in self.list_sessions(username):
+                if self.delete_session(username, session_id):
+                    deleted_count += 1
+        except OSError as e:
+            raise SessionStoreError(e) from e
+        return deleted_count
+
+
+class SqliteSessionStore:
+    """Satu baris bagi setiap mesej. save_session() hanya menambah mesej baru di hujung sesi jika
+    mesej yang disimpan masih sama (cincangan awalan); jika tidak, sesi ditulis semula."""
+    def __init__(self, db_path=None, history_dir=HISTORY_DIR, auto_migrate=True):
+        self.history_dir = history_dir
+        self.db_path = db_path or os.path.join(history_dir, SESSION_DB_FILENAME)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        is_new_db = not os.path.exists(self.db_path)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " username TEXT NOT NULL, session_id TEXT NOT NULL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL, message_count INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (username, session_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON sessions(username, updated_at DESC)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if "history_digest" not in columns: # Pangkalan data lama: cincangan dikira semula pada simpanan pertama
+                conn.execute("ALTER TABLE sessions ADD COLUMN history_digest TEXT")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " username TEXT NOT NULL, session_id TEXT NOT NULL, seq INTEGER NOT NULL, message TEXT NOT NULL,"
+                " PRIMARY KEY (username, session_id, seq))"
+            )
+        if auto_migrate and is_new_db and os.path.isdir(history_dir):
+            # Kali pertama: import sesi JSON sedia ada supaya pengguna tidak kehilangan sejarah
+            migrate_json_sessions(history_dir, self)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def list_sessions(self, username=None):
+        try:
+            rows = self._conn().execute(
+                "SELECT session_id FROM sessions WHERE username = ? ORDER BY updated_at DESC", (username or "",)
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+        return [row[0] for row in rows]
+
+    def load_session(self, username, session_id, tail=None):
+        try:
+            if tail:
+                rows = self._conn().execute(
+                    "SELECT message FROM messages WHERE username = ? AND session_id = ? ORDER BY seq DESC LIMIT ?",
+                    (username or "", session_id, tail),
+                ).fetchall()
+                rows.reverse()
+            else:
+                rows = self._conn().execute(
+                    "SELECT message FROM messages WHERE username = ? AND session_id = ? ORDER BY seq",
+                    (username or "", session_id),
+                ).fetchall()
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+        return [json.loads(row[0]) for row in rows]
+
+    def append_messages(self, username, session_id, messages, start_seq=None, created_at=None, updated_at=None,
+                        digest=None, replace=False):
+        """Menulis mesej bermula pada start_seq dalam satu transaksi. replace=True memadam mesej sedia ada
+        dahulu (created_at sesi dikekalkan). 'digest' ialah cincangan seluruh sejarah selepas tulisan ini."""
+        username = username or ""
+        now = updated_at or time.time()
+        conn = self._conn()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT message_count FROM sessions WHERE username = ? AND session_id = ?", (username, session_id)
+                ).fetchone()
+                count = row[0] if row else 0
+                if replace:
+                    conn.execute("DELETE FROM messages WHERE username = ? AND session_id = ?", (username, session_id))
+                    count = 0
+                seq = count if start_seq is None else start_seq
+                conn.executemany(
+                    "INSERT OR REPLACE INTO messages (username, session_id, seq, message) VALUES (?, ?, ?, ?)",
+                    [(username, session_id, seq + i, json.dumps(msg, ensure_ascii=False)) for i, msg in enumerate(messages)],
+                )
+                new_count = max(count, seq + len(messages))
+                if row:
+                    conn.execute(
+                        "UPDATE sessions SET updated_at = ?, message_count = ?, history_digest = ? WHERE username = ? AND session_id = ?",
+                        (now, new_count, digest, username, session_id),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO sessions (username, session_id, created_at, updated_at, message_count, history_digest) VALUES (?, ?, ?, ?, ?, ?)",
+                        (username, session_id, created_at or now, now, new_count, digest),
+                    )
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+
+    def save_session(self, username, session_id, history):
+        """Menyimpan sejarah penuh dengan hanya menulis mesej yang belum disimpan. Jika sejarah lebih
+        pendek, atau mesej yang disimpan telah disunting/berbeza (cincangan awalan tidak sepadan),
+        sesi ditulis semula."""
+        try:
+            row = self._conn().execute(
+                "SELECT message_count, history_digest FROM sessions WHERE username = ? AND session_id = ?",
+                (username or "", session_id),
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+        stored_count, stored_digest = row if row else (0, None)
+        prefix_digest, full_digest = _history_digests(history, stored_count)
+        if row and stored_digest is None and len(history) >= stored_count:
+            # Sesi disimpan sebelum lajur cincangan wujud: bandingkan dengan mesej yang disimpan
+            stored_digest = _history_digests(self.load_session(username, session_id), stored_count)[1]
+        if row and (len(history) < stored_count or prefix_digest != stored_digest):
+            self.append_messages(username, session_id, history, start_seq=0, digest=full_digest, replace=True)
+        elif len(history) > stored_count or not row:
+            self.append_messages(username, session_id, history[stored_count:], start_seq=stored_count, digest=full_digest)
+
+    def delete_session(self, username, session_id):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE username = ? AND session_id = ?", (username or "", session_id))
+                deleted = conn.execute(
+                    "DELETE FROM sessions WHERE username = ? AND session_id = ?", (username or "", session_id)
+                ).rowcount
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+        return deleted > 0
+
+    def delete_all_sessions(self, username=None):
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute("DELETE FROM messages WHERE username = ?", (username or "",))
+                return conn.execute("DELETE FROM sessions WHERE username = ?", (username or "",)).rowcount
+        except sqlite3.Error as e:
+            raise SessionStoreError(e) from e
+
+    def has_session(self, username, session_id):
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE username = ? AND session_id = ?", (username or "", session_id)
+        ).fetchone()
+        return row is not None
+
+
+def _decode_record(line):
+    """Menyahkod satu baris JSONL. Baris kosong atau rosak (contohnya tulisan separuh jalan
+    semasa proses mati) mengembalikan None."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return record if isinstance(record, dict) else None
+
+def _is_reset(record):
+    return record.get(JSONL_RESET_KEY) is True
+
+def _iter_lines_reversed(f, block_size=JSONL_TAIL_BLOCK_SIZE):
+    """Membaca baris dari hujung fail ke belakang, satu blok pada satu masa."""
+    f.seek(0, os.SEEK_END)
+    position = f.tell()
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        f.seek(position)
+        lines = (f.read(read_size) + remainder).split(b"\n")
+        remainder = lines.pop(0) # Mungkin belum lengkap; disambung dengan blok sebelumnya
+        yield from reversed(lines)
+    yield remainder
+
+def _fsync_dir(path):
+    # Pastikan os.replace() kekal selepas kuasa terputus (tidak disokong di Windows)
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JsonlSessionStore:
+    """Satu fail <session_id>.jsonl bagi setiap sesi, satu mesej bagi setiap baris.
+
+    save_session() hanya menambah mesej baru dengan satu write() dan fsync. Jika sejarah
+    dipendekkan, disunting atau berbeza (cincangan awalan), rekod {"_reset": true} ditambah diikuti
+    sejarah baru; rekod lama yang tidak lagi digunakan dibuang oleh pemadatan latar belakang
+    (fail sementara + os.replace()). Tulisan dan pemadatan dibuat di bawah kunci fail
+    <session_id>.jsonl.lock kerana aplikasi Streamlit dan backend berkongsi direktori yang sama.
+    Fail <session_id>.json lama masih boleh dibaca dan ditukar ke JSONL apabila disimpan semula.
+    """
+    def __init__(self, history_dir=HISTORY_DIR, compact_threshold=JSONL_COMPACT_THRESHOLD):
+        self.history_dir = history_dir
+        self.compact_threshold = compact_threshold
+        self._states = {} # (username, session_id) -> (mesej aktif, rekod mati, saiz fail, cincangan sejarah)
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._compacting = set()
+
+    def _user_dir(self, username):
+        user_dir = os.path.join(self.history_dir, username) if username else self.history_dir
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def _path(self, username, session_id):
+        return os.path.join(self._user_dir(username), f"{session_id}.jsonl")
+
+    def _legacy_path(self, username, session_id):
+        return os.path.join(self._user_dir(username), f"{session_id}.json")
+
+    def _lock(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _locked(self, key, path):
+        """Kunci benang bagi proses ini dan kunci fail merentas proses bagi satu sesi."""
+        with self._lock(key), _file_lock(f"{path}.lock"):
+            yield
+
+    # --- Bacaan ---
+    def _scan(self, path):
+        """Membaca keseluruhan log. Mengembalikan (mesej aktif, bilangan rekod mati)."""
+        messages = []
+        dead = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = _decode_record(line)
+                if record is None:
+                    dead += 1
+                elif _is_reset(record):
+                    dead += len(messages) + 1
+                    messages = []
+                else:
+                    messages.append(record)
+        return messages, dead
+
+    def _read_tail(self, path, limit):
+        """Membaca hanya 'limit' mesej terakhir dari hujung fail, berhenti pada rekod _reset."""
+        messages = []
+        with open(path, "rb") as f:
+            for line in _iter_lines_reversed(f):
+                record = _decode_record(line)
+                if record is None:
+                    continue
+                if _is_reset(record):
+                    break
+                messages.append(record)
+                if len(messages) >= limit:
+                    break
+        messages.reverse()
+        return messages
+
+    def _state_locked(self, key, path):
+        """Bilangan mesej, rekod mati dan cincangan sejarah, dicache selagi saiz fail tidak diubah oleh proses lain."""
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            self._states.pop(key, None)
+            return None
+        state = self._states.get(key)
+        if state is None or state[2] != size:
+            messages, dead = self._scan(path)
+            state = self._states[key] = (len(messages), dead, size, _history_digests(messages, len(messages))[1])
+        return state
+
+    def list_sessions(self, username=None):
+        try:
+            session_ids = set()
+            for filename in os.listdir(self._user_dir(username)):
+                if filename.endswith(".jsonl"):
+                    session_ids.add(filename[:-len(".jsonl")])
+                elif filename.endswith(".json"):
+                    session_ids.add(filename[:-len(".json")])
+        except OSError as e:
+            raise SessionStoreError(e) from e
+        return sorted(session_ids, key=_session_sort_key, reverse=True)
+
+    def load_session(self, username, session_id, tail=None):
+        path = self._path(username, session_id)
+        try:
+            if not os.path.exists(path):
+                with open(self._legacy_path(username, session_id), "r", encoding="utf-8") as f:
+                    history = json.load(f)
+                return history[-tail:] if tail else history
+            if tail:
+                return self._read_tail(path, tail)
+            return self._scan(path)[0]
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, OSError) as e:
+            raise SessionStoreError(e) from e
+
+    # --- Tulisan ---
+    def _append(self, path, records):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(path, "a+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data # Tamatkan baris separuh yang ditinggalkan oleh proses yang mati
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def _write_atomic(self, path, records):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for record in records:
+                    f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _fsync_dir(os.path.dirname(path) or ".")
+        return os.path.getsize(path)
+
+    def save_session(self, username, session_id, history):
+        """Menambah mesej yang belum disimpan di hujung log (satu write + fsync bagi setiap giliran).
+        Jika mesej yang disimpan bukan awalan sejarah ini, rekod _reset dan sejarah penuh ditambah."""
+        key = (username or "", session_id)
+        path = self._path(username, session_id)
+        legacy_path = self._legacy_path(username, session_id)
+        try:
+            with self._locked(key, path):
+                state = self._state_locked(key, path)
+                if state is None:
+                    # Sesi baru atau fail .json lama: tulis log penuh sekali sahaja
+                    size = self._write_atomic(path, history)
+                    self._states[key] = (len(history), 0, size, _history_digests(history, len(history))[1])
+                    if os.path.exists(legacy_path):
+                        os.remove(legacy_path)
+                    return
+                stored_count, dead, _, stored_digest = state
+                prefix_digest, full_digest = _history_digests(history, stored_count)
+                if len(history) < stored_count or prefix_digest != stored_digest:
+                    records = [{JSONL_RESET_KEY: True}] + list(history)
+                    dead += stored_count + 1
+                elif len(history) == stored_count:
+                    return
+                else:
+                    records = history[stored_count:]
+                size = self._append(path, records)
+                self._states[key] = (len(history), dead, size, full_digest)
+        except OSError as e:
+            raise SessionStoreError(e) from e
+        if dead >= self.compact_threshold:
+            self.compact_in_background(username, session_id)
+
+    # --- Pemadatan ---
+    def compact(self, username, session_id):
+        """Menulis semula log dengan hanya mesej aktif. Mengembalikan bilangan rekod mati yang dibuang."""
+        key = (username or "", session_id)
+        path = self._path(username, session_id)
+        with self._locked(key, path):
+            try:
+                messages, dead = self._scan(path)
+            except FileNotFoundError:
+                return 0
+            if dead:
+                size = self._write_atomic(path, messages)
+                self._states[key] = (len(messages), 0, size, _history_digests(messages, len(messages))[1])
+        return dead
+
+    def compact_in_background(self, username, session_id):
+        key = (username or "", session_id)
+        with self._guard:
+            if key in self._compacting:
+                return
+            self._compacting.add(key)
+
+        def _run():
+            try:
+                self.compact(username, session_id)
+            except OSError as e:
+                print(f"Gagal memadatkan sesi '{session_id}': {e}")
+            finally:
+                with self._guard:
+                    self._compacting.discard(key)
+
+        threading.Thread(target=_run, name=f"jsonl-compact-{session_id}", daemon=True).start()
+
+    def delete_session(self, username, session_id):
+        key = (username or "", session_id)
+        deleted = False
+        path = self._path(username, session_id)
+        try:
+            with self._locked(key, path):
+                for existing in (path, self._legacy_path(username, session_id)):
+                    if os.path.exists(existing):
+                        os.remove(existing)
+                        deleted = True
+                self._states.pop(key, None)
+        except OSError as e:
+            raise SessionStoreError(e) from e
+        return deleted
+
+    def delete_all_sessions(self, username=None):
+        deleted_count = 0
+        for session_id in self.list_sessions(username):
+            if self.delete_session(username, session_id):
+                deleted_count += 1
+        return deleted_count
+
+
+def get_session_store(history_dir=HISTORY_DIR, backend=None):
+    backend = (backend or SESSION_STORE).lower()
+    if backend == "json":
+        return JsonSessionStore(history_dir)
+    if backend == "sqlite":
+        return SqliteSessionStore(history_dir=history_dir)
+    if backend == "jsonl":
+        return JsonlSessionStore(history_dir)
+    raise ValueError(f"SESSION_STORE tidak dikenali: '{backend}'")
+
+
+# --- MIGRASI ---
+def iter_json_session_files(history_dir):
+    """Menghasilkan (username, session_id, laluan) bagi setiap fail JSON lama.
+    Fail di akar HISTORY_DIR milik aplikasi tanpa log masuk (username kosong)."""
+    for entry in sorted(os.listdir(history_dir)):
+        path = os.path.join(history_dir, entry)
+        if entry.endswith(".json") and os.path.isfile(path):
+            yield "", entry[:-len(".json")], path
+        elif os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(".json"):
+                    yield entry, filename[:-len(".json")], os.path.join(path, filename)
+
+def migrate_json_sessions(history_dir, store, overwrite=False):
+    """Mengimport fail JSON ke storan SQLite. Mengembalikan (diimport, dilangkau, gagal)."""
+    imported = skipped = failed = 0
+    for username, session_id, path in iter_json_session_files(history_dir):
+        if not overwrite and store.has_session(username, session_id):
+            skipped += 1
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                history = json.load(f)
+            mtime = os.path.getmtime(path)
+            store.delete_session(username, session_id)
+            store.append_messages(username, session_id, history, start_seq=0, created_at=mtime, updated_at=mtime,
+                                  digest=_history_digests(history, 0)[1])
+            imported += 1
+        except (OSError, json.JSONDecodeError, SessionStoreError) as e:
+            print(f"Gagal mengimport {path}: {e}")
+            failed += 1
+    return imported, skipped, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Alat storan sesi perbualan STEMBot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Import fail chat_sessions/*.json ke SQLite")
+    migrate_parser.add_argument("--history-dir", default=HISTORY_DIR)
+    migrate_parser.add_argument("--db", default=None, help="Laluan pangkalan data (lalai: <history-dir>/sessions.sqlite3)")
+    migrate_parser.add_argument("--overwrite", action="store_true", help="Tulis semula sesi yang sudah wujud dalam SQLite")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        store = SqliteSessionStore(db_path=args.db, history_dir=args.history_dir, auto_migrate=False)
+        imported, skipped, failed = migrate_json_sessions(args.history_dir, store, overwrite=args.overwrite)
+        print(f"Diimport: {imported}, dilangkau (sudah wujud): {skipped}, gagal: {failed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Ujian storan sesi: sejarah yang disunting atau berbeza mesti ditulis semula, bukan ditambah."""
+import pytest
+
+import session_store
+
+
+def _msg(role, content):
+    return {"role": role, "content": content}
+
+
+@pytest.fixture(params=["sqlite", "jsonl"])
+def store(request, tmp_path):
+    return session_store.get_session_store(str(tmp_path), backend=request.param)
+
+
+def test_append_only(store):
+    history = [_msg("user", "A"), _msg("assistant", "a")]
+    store.save_session("ali", "s1", history)
+    history += [_msg("user", "B"), _msg("assistant", "b")]
+    store.save_session("ali", "s1", history)
+    assert store.load_session("ali", "s1") == history
+
+
+def test_edited_history_is_rewritten(store):
+    store.save_session("ali", "s1", [_msg("user", "A"), _msg("assistant", "a")])
+    edited = [_msg("user", "B"), _msg("assistant", "b")]
+    store.save_session("ali", "s1", edited)
+    assert store.load_session("ali", "s1") == edited
+
+
+def test_diverged_history_is_rewritten(store):
+    store.save_session("ali", "s1", [_msg("user", "1"), _msg("assistant", "1")])
+    diverged = [_msg("user", "2"), _msg("assistant", "2"), _msg("user", "3")]
+    store.save_session("ali", "s1", diverged)
+    assert store.load_session("ali", "s1") == diverged
+
+
+def test_shorter_history_is_rewritten(store):
+    store.save_session("ali", "s1", [_msg("user", "1"), _msg("assistant", "1"), _msg("user", "2")])
+    store.save_session("ali", "s1", [_msg("user", "1")])
+    assert store.load_session("ali", "s1") == [_msg("user", "1")]
+
+
+def test_sqlite_legacy_session_without_digest(tmp_path):
+    store = session_store.get_session_store(str(tmp_path), backend="sqlite")
+    store.append_messages("ali", "s1", [_msg("user", "A"), _msg("assistant", "a")], start_seq=0)
+    edited = [_msg("user", "B"), _msg("assistant", "b"), _msg("user", "C")]
+    store.save_session("ali", "s1", edited)
+    assert store.load_session("ali", "s1") == edited
+
+
+def test_jsonl_compaction_keeps_appends_from_other_process(tmp_path):
+    writer = session_store.get_session_store(str(tmp_path), backend="jsonl")
+    compactor = session_store.get_session_store(str(tmp_path), backend="jsonl")
+    writer.save_session("ali", "s1", [_msg("user", "1"), _msg("assistant", "1")])
+    writer.save_session("ali", "s1", [_msg("user", "2")])
+    history = [_msg("user", "2"), _msg("assistant", "2")]
+    writer.save_session("ali", "s1", history)
+    assert compactor.compact("ali", "s1") == 3
+    history.append(_msg("user", "3"))
+    writer.save_session("ali", "s1", history)
+    assert compactor.load_session("ali", "s1") == history
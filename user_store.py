@@ -0,0 +1,126 @@
+"""Direktori pengguna (user_data/users.json) dikongsi oleh chatbot-newtheme.py dan backend FastAPI.
+
+Fail dibaca sekali dan disimpan dalam memori. Ia hanya dibaca semula apabila mtime/saiz fail
+berubah, dan semakan itu sendiri dibuat paling kerap sekali setiap USER_STORE_RECHECK_INTERVAL
+saat, jadi pengesahan token JWT biasanya tidak menyentuh cakera langsung.
+Perubahan (pendaftaran) dibuat di bawah kunci fail dan ditulis secara atomik (fail sementara +
+os.replace()) supaya pendaftaran serentak dari beberapa proses tidak hilang.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# --- KONFIGURASI ---
+USERS_DIR = "user_data"
+USERS_FILE = os.path.join(USERS_DIR, "users.json")
+USER_STORE_RECHECK_INTERVAL = float(os.getenv("USER_STORE_RECHECK_INTERVAL", "5")) # Saat antara semakan mtime
+
+
+class UserExistsError(Exception):
+    pass
+
+
+@contextmanager
+def _file_lock(lock_path):
+    """Kunci eksklusif merentas proses menggunakan fail <users.json>.lock."""
+    with open(lock_path, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class UserStore:
+    def __init__(self, users_file=USERS_FILE, recheck_interval=USER_STORE_RECHECK_INTERVAL):
+        self.users_file = users_file
+        self.lock_file = f"{users_file}.lock"
+        self.recheck_interval = recheck_interval
+        self._users = {}
+        self._signature = None # (mtime_ns, saiz) fail semasa terakhir dibaca
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(users_file) or ".", exist_ok=True)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.users_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _refresh_locked(self, force=False):
+        # force hanya melangkau had selang semakan; fail yang tidak berubah (mtime/saiz) tidak dibaca semula
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.recheck_interval:
+            return
+        self._checked_at = now
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        if signature is None:
+            self._users = {}
+        else:
+            with open(self.users_file, "r", encoding="utf-8") as f:
+                self._users = json.load(f)
+        self._signature = signature
+
+    def get_user(self, username):
+        """Rekod pengguna (salinan) atau None. Nama yang tidak dikenali memaksa semakan mtime/saiz
+        fail kerana pengguna itu mungkin baru didaftarkan oleh proses lain; fail hanya dibaca jika berubah."""
+        with self._lock:
+            self._refresh_locked()
+            if username not in self._users:
+                self._refresh_locked(force=True)
+            user = self._users.get(username)
+            return dict(user) if user is not None else None
+
+    def exists(self, username):
+        return self.get_user(username) is not None
+
+    def usernames(self):
+        """Semua nama pengguna yang berdaftar, disusun."""
+        with self._lock:
+            self._refresh_locked()
+            return sorted(self._users)
+
+    def add_user(self, username, record):
+        """Menambah pengguna baru. Membangkitkan UserExistsError jika nama sudah digunakan."""
+        with self._lock, _file_lock(self.lock_file):
+            self._refresh_locked(force=True) # Baca versi terkini di bawah kunci sebelum mengubah
+            if username in self._users:
+                raise UserExistsError(username)
+            users = dict(self._users)
+            users[username] = record
+            self._write_atomic(users)
+            self._users = users
+            self._signature = self._file_signature()
+            self._checked_at = time.monotonic()
+
+    def _write_atomic(self, users):
+        tmp_path = f"{self.users_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(users, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.users_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise